@@ -1,4 +1,5 @@
 # app.py
+import os
 import socket
 import webbrowser
 from threading import Timer
@@ -8,6 +9,7 @@ import dash
 import dash_bootstrap_components as dbc
 import dash_mantine_components as dmc
 from dash import Dash, Input, Output, State, ctx, dcc, html
+from flask import jsonify
 
 from pathlib import Path
 import sys
@@ -34,6 +36,10 @@ except Exception:
     _spec.loader.exec_module(home_dashboard)  # type: ignore
     register_callbacks = home_dashboard.register_callbacks  # type: ignore
 
+from engine.backends import get_backend
+from engine.transport import register_payload_report
+from engine.uploads import register_upload_routes
+
 # =========================
 # Helper functions
 # =========================
@@ -209,6 +215,20 @@ app.validation_layout = app.layout
 # Callbacks de modales del Home
 register_callbacks(app)
 
+# Subida de ficheros grandes por trozos (rutas Flask en app.server)
+register_upload_routes(app)
+
+# Tamaño de la respuesta de cada callback (log 'tgftir.payload' + api/payload-report)
+register_payload_report(app)
+
+
+@server.route(f"{app.config.routes_pathname_prefix.rstrip('/')}/healthz")
+def healthz():
+    """Comprobación de vida para el balanceador / supervisor (gunicorn, waitress)."""
+    backend = get_backend()
+    return jsonify(status="ok", pid=os.getpid(), cache_backend=type(backend).__name__, shared_cache=backend.shared)
+
+
 # =========================
 # Callbacks
 # =========================
@@ -0,0 +1,149 @@
+/* assets/chunked_upload.js
+ * ---------------------------------------------------------------------------
+ * Subida por trozos (reanudable) para ficheros grandes.
+ * - Abre un selector de ficheros, envía cada fichero en trozos binarios
+ *   (PUT api/uploads/<id>?offset=N) y al final pide el parseo (POST .../complete).
+ * - Sólo vuelve a Dash un id pequeño por fichero, vía dash_clientside.set_props.
+ * - Si se corta la conexión, al reintentar se reanuda desde lo ya recibido.
+ * - El id de subida lleva un nonce aleatorio por fichero, guardado en
+ *   sessionStorage: dos pestañas que suben el mismo fichero no comparten
+ *   el .part del servidor, y la misma pestaña puede reanudar.
+ * ------------------------------------------------------------------------- */
+(function () {
+    var CHUNK_SIZE = 8 * 1024 * 1024;
+
+    function apiBase() {
+        try {
+            var cfg = JSON.parse(document.getElementById("_dash-config").textContent);
+            return (cfg.requests_pathname_prefix || "/") + "api/uploads/";
+        } catch (e) {
+            return "/api/uploads/";
+        }
+    }
+
+    function randomNonce() {
+        if (window.crypto && window.crypto.randomUUID) {
+            return window.crypto.randomUUID();
+        }
+        // sin contexto seguro (http en red local) no hay randomUUID
+        var bytes = new Uint8Array(16);
+        window.crypto.getRandomValues(bytes);
+        return Array.prototype.map.call(bytes, function (b) {
+            return ("0" + b.toString(16)).slice(-2);
+        }).join("");
+    }
+
+    function fileKey(kind, file) {
+        return "tgftir-upload:" + kind + "-" + file.size + "-" + file.lastModified + "-" + file.name;
+    }
+
+    function uploadId(kind, file) {
+        var key = fileKey(kind, file);
+        var nonce = null;
+        try {
+            nonce = window.sessionStorage.getItem(key);
+            if (!nonce) {
+                nonce = randomNonce();
+                window.sessionStorage.setItem(key, nonce);
+            }
+        } catch (e) {
+            nonce = nonce || randomNonce();   // sessionStorage bloqueado: sin reanudación
+        }
+        var raw = nonce + "-" + kind + "-" + file.size + "-" + file.name;
+        return raw.replace(/[^A-Za-z0-9_.-]/g, "_").slice(0, 128);
+    }
+
+    function forgetUpload(kind, file) {
+        try {
+            window.sessionStorage.removeItem(fileKey(kind, file));
+        } catch (e) {
+            /* nada que olvidar */
+        }
+    }
+
+    function setProgress(progressId, value) {
+        if (progressId) {
+            window.dash_clientside.set_props(progressId, {value: value});
+        }
+    }
+
+    async function uploadOne(kind, file, onProgress) {
+        var base = apiBase() + encodeURIComponent(uploadId(kind, file));
+        var status = await (await fetch(base)).json();
+        var offset = status.received || 0;
+        if (offset > file.size) {
+            offset = 0;
+        }
+        while (offset < file.size) {
+            var chunk = file.slice(offset, offset + CHUNK_SIZE);
+            var resp = await fetch(base + "?offset=" + offset, {
+                method: "PUT",
+                headers: {"Content-Type": "application/octet-stream"},
+                body: chunk
+            });
+            var body = await resp.json();
+            if (resp.status === 409) {
+                offset = body.received;   // reanudar desde lo que tiene el servidor
+                continue;
+            }
+            if (!resp.ok) {
+                throw new Error(body.error || resp.statusText);
+            }
+            offset = body.received;
+            onProgress(offset / file.size);
+        }
+        var done = await fetch(base + "/complete", {
+            method: "POST",
+            headers: {"Content-Type": "application/json"},
+            body: JSON.stringify({kind: kind, filename: file.name, size: file.size})
+        });
+        var result = await done.json();
+        if (done.status !== 409) {
+            forgetUpload(kind, file);   // el .part ya no existe: la próxima subida empieza de cero
+        }
+        if (!done.ok) {
+            throw new Error(result.error || done.statusText);
+        }
+        return result;
+    }
+
+    function pickAndUpload(kind, multiple, accept, storeId, progressId) {
+        var input = document.createElement("input");
+        input.type = "file";
+        input.multiple = !!multiple;
+        if (accept) {
+            input.accept = accept;
+        }
+        input.onchange = async function () {
+            var files = Array.prototype.slice.call(input.files || []);
+            var results = [];
+            var errors = [];
+            for (var i = 0; i < files.length; i++) {
+                try {
+                    results.push(await uploadOne(kind, files[i], function (frac) {
+                        setProgress(progressId, Math.round(100 * (i + frac) / files.length));
+                    }));
+                } catch (e) {
+                    errors.push(files[i].name + ": " + e.message);
+                }
+            }
+            setProgress(progressId, 0);
+            window.dash_clientside.set_props(storeId, {
+                data: {kind: kind, files: results, errors: errors, ts: Date.now()}
+            });
+        };
+        input.click();
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        chunked_upload: {
+            /* Clientside callback: (n_clicks) -> no_update; el resultado llega por set_props */
+            pick: function (n_clicks, kind, multiple, accept, storeId, progressId) {
+                if (n_clicks) {
+                    pickAndUpload(kind, multiple, accept, storeId, progressId);
+                }
+                return window.dash_clientside.no_update;
+            }
+        }
+    });
+})();
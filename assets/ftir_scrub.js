@@ -0,0 +1,175 @@
+/* assets/ftir_scrub.js
+ * ---------------------------------------------------------------------------
+ * Modo "scrub" del EGA: el cubo FTIR se envía una vez (engine/transport.py)
+ * y el espectro del tiempo seleccionado se dibuja en el navegador, sin ir al
+ * servidor, al pasar el ratón por la gráfica tiempo/temperatura, al soltar la
+ * línea roja o al escribir un tiempo.
+ * - decode: int16 delta + deflate → Float32Array (una vez por cubo).
+ * - scrub:  tiempo → espectro más cercano (o interpolado) + texto informativo.
+ * ------------------------------------------------------------------------- */
+(function () {
+    var CUBES = {};   // cube_id -> {times, wavenumbers, values, nt, nw, meta}
+
+    function b64ToBuffer(b64) {
+        return fetch("data:application/octet-stream;base64," + b64).then(function (r) {
+            return r.arrayBuffer();
+        });
+    }
+
+    function b64ToF64Sync(b64) {
+        var bin = atob(b64), bytes = new Uint8Array(bin.length);
+        for (var i = 0; i < bin.length; i++) {
+            bytes[i] = bin.charCodeAt(i);
+        }
+        return new Float64Array(bytes.buffer);
+    }
+
+    // Datos pequeños que acompañan al cubo (TG tiempo→temperatura, rango del GS)
+    function readMeta(p) {
+        return {
+            tg_time: b64ToF64Sync(p.tg_time), tg_temp: b64ToF64Sync(p.tg_temp),
+            time_min: p.time_min, time_max: p.time_max
+        };
+    }
+
+    function inflate(b64) {
+        return fetch("data:application/octet-stream;base64," + b64).then(function (r) {
+            return new Response(r.body.pipeThrough(new DecompressionStream("deflate"))).arrayBuffer();
+        });
+    }
+
+    async function decodeCube(p) {
+        var parts = await Promise.all([
+            b64ToBuffer(p.times), b64ToBuffer(p.wavenumbers),
+            b64ToBuffer(p.offset), b64ToBuffer(p.scale), inflate(p.data)
+        ]);
+        var nt = p.n_times, nw = p.n_wavenumbers;
+        var offset = new Float64Array(parts[2]);
+        var scale = new Float64Array(parts[3]);
+        var q = new Int16Array(parts[4]);
+        // suma acumulada a lo largo del tiempo (Int16Array envuelve como int16)
+        for (var i = 1; i < nt; i++) {
+            var o = i * nw, po = o - nw;
+            for (var j = 0; j < nw; j++) {
+                q[o + j] = q[po + j] + q[o + j];
+            }
+        }
+        var values = new Float32Array(nt * nw);
+        for (var k = 0; k < nt * nw; k++) {
+            var jj = k % nw;
+            values[k] = q[k] === p.nan_code ? NaN : offset[jj] + scale[jj] * q[k];
+        }
+        return {
+            times: new Float64Array(parts[0]), wavenumbers: new Float64Array(parts[1]),
+            values: values, nt: nt, nw: nw, meta: readMeta(p)
+        };
+    }
+
+    // índice del primer tiempo > t (como numpy.searchsorted side='right')
+    function searchRight(arr, t) {
+        var lo = 0, hi = arr.length;
+        while (lo < hi) {
+            var mid = (lo + hi) >> 1;
+            if (arr[mid] <= t) { lo = mid + 1; } else { hi = mid; }
+        }
+        return lo;
+    }
+
+    function interp(x, xs, ys) {
+        var n = xs.length;
+        if (!n) { return NaN; }
+        if (x <= xs[0]) { return ys[0]; }
+        if (x >= xs[n - 1]) { return ys[n - 1]; }
+        var i = searchRight(xs, x);
+        var w = (x - xs[i - 1]) / (xs[i] - xs[i - 1]);
+        return ys[i - 1] + w * (ys[i] - ys[i - 1]);
+    }
+
+    // Mismo criterio que FtirCube.spectrum_at (empate → el escaneo anterior)
+    function spectrumAt(c, t, interpolate) {
+        var times = c.times, n = c.nt, nw = c.nw;
+        if (!interpolate || n === 1) {
+            var i = Math.min(Math.max(searchRight(times, t), 1), n - 1);
+            var idx = (n === 1) ? 0 : (Math.abs(t - times[i - 1]) <= Math.abs(times[i] - t) ? i - 1 : i);
+            return {y: Array.from(c.values.subarray(idx * nw, (idx + 1) * nw)), time: times[idx]};
+        }
+        t = Math.min(Math.max(t, times[0]), times[n - 1]);
+        var k = Math.min(Math.max(searchRight(times, t), 1), n - 1);
+        var t0 = times[k - 1], t1 = times[k];
+        var w = t1 > t0 ? (t - t0) / (t1 - t0) : 0;
+        var a = (k - 1) * nw, b = k * nw, y = new Array(nw);
+        for (var j = 0; j < nw; j++) {
+            y[j] = (1 - w) * c.values[a + j] + w * c.values[b + j];
+        }
+        return {y: y, time: t};
+    }
+
+    var nu = function () { return window.dash_clientside.no_update; };
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        ftir_scrub: {
+            /* payload -> id del cubo listo (vía set_props cuando termina de decodificar) */
+            decode: function (payload, readyId) {
+                if (!payload || typeof DecompressionStream === "undefined") {
+                    return null;
+                }
+                if (CUBES[payload.cube_id]) {
+                    CUBES[payload.cube_id].meta = readMeta(payload);
+                    return payload.cube_id;
+                }
+                decodeCube(payload).then(function (c) {
+                    CUBES = {};
+                    CUBES[payload.cube_id] = c;
+                    window.dash_clientside.set_props(readyId, {data: payload.cube_id});
+                }).catch(function (e) {
+                    console.warn("FTIR scrub: decode failed, using server path", e);
+                });
+                return null;
+            },
+
+            /* hover / línea roja / tiempo manual -> figuras e info sin ir al servidor */
+            scrub: function (hoverData, relayoutData, manualTime, ready, interpolate, ftirFig, timeFig) {
+                var c = ready && CUBES[ready];
+                if (!c || !ftirFig || !timeFig) {
+                    return [nu(), nu(), nu(), nu(), nu()];
+                }
+                var trig = (window.dash_clientside.callback_context.triggered[0] || {}).prop_id || "";
+                var t = null, fromHover = false;
+                if (trig.indexOf("hoverData") >= 0 && hoverData && hoverData.points && hoverData.points.length) {
+                    t = hoverData.points[0].x;
+                    fromHover = true;
+                } else if (trig.indexOf("relayoutData") >= 0 && relayoutData) {
+                    t = relayoutData["shapes[0].x0"];
+                    if (t === undefined) { t = relayoutData["shapes[0].x1"]; }
+                } else if (trig.indexOf("manual-time-input") >= 0) {
+                    t = manualTime;
+                }
+                if (t === null || t === undefined || isNaN(Number(t))) {
+                    return [nu(), nu(), nu(), nu(), nu()];
+                }
+                var m = c.meta;
+                t = Math.min(Math.max(Number(t), m.time_min), m.time_max);
+
+                var s = spectrumAt(c, t, !!interpolate);
+                var data0 = Object.assign({}, ftirFig.data[0], {y: s.y, name: "Espectro a " + s.time.toFixed(1) + "s"});
+                var newFtir = Object.assign({}, ftirFig, {data: [data0].concat(ftirFig.data.slice(1))});
+
+                var shapes = (timeFig.layout.shapes || []).slice();
+                if (shapes.length) {
+                    shapes[0] = Object.assign({}, shapes[0], {x0: t, x1: t});
+                }
+                var newTime = Object.assign({}, timeFig, {
+                    layout: Object.assign({}, timeFig.layout, {shapes: shapes, editrevision: String(t)})
+                });
+
+                var temp = interp(t, m.tg_time, m.tg_temp);
+                var label = interpolate ? "Interpolated FTIR time" : "Closest FTIR time";
+                var info = "Selected time (GS): " + t.toFixed(1) + "s | " + label + ": " + s.time.toFixed(1) +
+                    "s | Interpolated temperature (TG): " + temp.toFixed(1) + "°C";
+                // al pasar el ratón no se toca el input manual (evita peticiones al servidor)
+                var manual = fromHover ? nu() : Math.round(t * 100) / 100;
+                return [newTime, newFtir, info, t, manual];
+            }
+        }
+    });
+})();
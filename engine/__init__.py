@@ -0,0 +1,6 @@
+# engine/__init__.py
+# -----------------------------------------------------------------------------
+# Núcleo numérico y de datos compartido por las páginas de Dash.
+# - Sin dependencias de layout: aquí no se crean componentes ni callbacks.
+# - Las páginas importan los submódulos directamente (p. ej. engine.run_store).
+# -----------------------------------------------------------------------------
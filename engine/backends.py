@@ -0,0 +1,308 @@
+# engine/backends.py
+# -----------------------------------------------------------------------------
+# Backends de caché intercambiables (clave → objeto Python):
+# - MemoryBackend:      en el propio proceso (LRU + presupuesto de bytes).
+# - FileSystemBackend:  pickles en un directorio compartido (varios workers).
+# - DiskCacheBackend:   `diskcache` si está instalado (SQLite + ficheros).
+# Todos expulsan por inactividad (idle_ttl, se renueva en cada lectura) y por
+# tamaño total. lock(key) serializa un leer-modificar-escribir sobre una clave
+# entre hilos (memory) o entre procesos (filesystem: flock; diskcache: transact). TieredCache combina una LRU local del proceso con el backend
+# compartido (si lo hay), que es lo que usan RUNS, CUBES y DERIVED.
+# Se eligen por entorno con make_backend_from_env() / get_backend():
+#   TGFTIR_CACHE_BACKEND = memory | filesystem | diskcache   (memory)
+#   TGFTIR_CACHE_DIR     = directorio para filesystem/diskcache
+#   TGFTIR_CACHE_MB      = presupuesto total en MB                (2048)
+#   TGFTIR_SESSION_TTL   = segundos de inactividad antes de expirar (14400)
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Hashable, Iterator, Optional
+
+from engine.cache import LRUCache, estimate_nbytes
+
+DEFAULT_CACHE_MB = 2048
+DEFAULT_IDLE_TTL = 4 * 3600
+PRUNE_INTERVAL = 30.0       # s entre podas del directorio (FileSystemBackend)
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """Cerrojo exclusivo entre procesos sobre un fichero (fcntl / msvcrt en Windows)."""
+    with open(path, "a+b") as fh:
+        if os.name == "nt":
+            import msvcrt
+            fh.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:   # LK_LOCK se rinde tras ~10 s: se vuelve a intentar
+                    continue
+            os.utime(path)
+            try:
+                yield
+            finally:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            os.utime(path)    # en uso: que _prune no lo borre
+            try:
+                yield
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+class MemoryBackend:
+    """Caché local del proceso: rápida, pero no se comparte entre workers."""
+
+    shared = False
+
+    def __init__(self, max_bytes: int, idle_ttl: float = DEFAULT_IDLE_TTL, max_entries: int = 4096) -> None:
+        self.idle_ttl = idle_ttl
+        self._cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self._seen: dict = {}
+        self._lock = threading.Lock()
+        self._key_lock = threading.RLock()
+
+    def get(self, key: Hashable) -> Any:
+        now = time.time()
+        with self._lock:
+            last = self._seen.get(key)
+            if last is None:
+                return None
+            if now - last > self.idle_ttl:
+                self._cache.pop(key)
+                self._seen.pop(key, None)
+                return None
+            value = self._cache.get(key)
+            if value is None:  # expulsado por tamaño
+                self._seen.pop(key, None)
+                return None
+            self._seen[key] = now
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._cache.set(key, value)
+            self._seen[key] = time.time()
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._cache.pop(key)
+            self._seen.pop(key, None)
+
+    @contextmanager
+    def lock(self, key: Hashable) -> Iterator[None]:
+        with self._key_lock:
+            yield
+
+
+class FileSystemBackend:
+    """
+    Un pickle por clave en un directorio (local o compartido por NFS/SMB).
+    Escritura atómica (fichero temporal + os.replace); el mtime hace de
+    "último acceso" para la expiración y la poda LRU por tamaño. La poda se
+    hace al escribir, como mucho cada PRUNE_INTERVAL s por proceso (entre
+    medias el directorio puede pasarse algo del presupuesto).
+    """
+
+    shared = True
+
+    def __init__(self, directory: Path, max_bytes: int, idle_ttl: float = DEFAULT_IDLE_TTL) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._last_prune = 0.0
+
+    def _path(self, key: Hashable) -> Path:
+        return self.directory / (hashlib.sha1(repr(key).encode("utf-8")).hexdigest() + ".pkl")
+
+    def get(self, key: Hashable) -> Any:
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.idle_ttl:
+                path.unlink()
+                return None
+            with open(path, "rb") as fh:
+                value = pickle.load(fh)
+            os.utime(path)
+            return value
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as fh:
+            pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        # la poda recorre todo el directorio: como mucho una vez cada PRUNE_INTERVAL
+        now = time.time()
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self._last_prune = now
+            self._prune()
+
+    def delete(self, key: Hashable) -> None:
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def lock(self, key: Hashable):
+        """Cerrojo entre procesos (y máquinas, si el sistema de ficheros admite flock)."""
+        return _file_lock(self._path(key).with_suffix(".lock"))
+
+    def _prune(self) -> None:
+        """Borra lo expirado y, si se supera el presupuesto, lo más antiguo."""
+        now = time.time()
+        for path in self.directory.glob("*.lock"):
+            try:
+                if now - path.stat().st_mtime > self.idle_ttl:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+        entries = []
+        for path in self.directory.glob("*.pkl"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - st.st_mtime > self.idle_ttl:
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+class DiskCacheBackend:
+    """Backend sobre `diskcache.Cache` (dependencia opcional)."""
+
+    shared = True
+
+    def __init__(self, directory: Path, max_bytes: int, idle_ttl: float = DEFAULT_IDLE_TTL) -> None:
+        import diskcache  # opcional: sólo si se elige este backend
+
+        self.idle_ttl = idle_ttl
+        self._cache = diskcache.Cache(str(directory), size_limit=max_bytes, eviction_policy="least-recently-used")
+
+    def get(self, key: Hashable) -> Any:
+        value = self._cache.get(key)
+        if value is not None:
+            self._cache.touch(key, expire=self.idle_ttl)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._cache.set(key, value, expire=self.idle_ttl)
+
+    def delete(self, key: Hashable) -> None:
+        self._cache.delete(key)
+
+    def lock(self, key: Hashable):
+        """Transacción de SQLite: serializa a todos los procesos que usan el directorio."""
+        return self._cache.transact()
+
+
+def make_backend(kind: str = "memory", directory: Optional[Path] = None,
+                 max_bytes: int = DEFAULT_CACHE_MB * 1024 ** 2, idle_ttl: float = DEFAULT_IDLE_TTL):
+    """Crea un backend por nombre: 'memory', 'filesystem' o 'diskcache'."""
+    kind = (kind or "memory").lower()
+    if kind == "memory":
+        return MemoryBackend(max_bytes=max_bytes, idle_ttl=idle_ttl)
+    directory = Path(directory or Path(tempfile.gettempdir()) / "tgftir_cache")
+    if kind == "filesystem":
+        return FileSystemBackend(directory, max_bytes=max_bytes, idle_ttl=idle_ttl)
+    if kind == "diskcache":
+        return DiskCacheBackend(directory, max_bytes=max_bytes, idle_ttl=idle_ttl)
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+
+def make_backend_from_env():
+    """Backend configurado por variables de entorno (ver cabecera)."""
+    return make_backend(
+        os.getenv("TGFTIR_CACHE_BACKEND", "memory"),
+        os.getenv("TGFTIR_CACHE_DIR") or None,
+        int(os.getenv("TGFTIR_CACHE_MB", str(DEFAULT_CACHE_MB))) * 1024 ** 2,
+        float(os.getenv("TGFTIR_SESSION_TTL", str(DEFAULT_IDLE_TTL))),
+    )
+
+
+_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def get_backend():
+    """Backend único del proceso (configurado por entorno la primera vez)."""
+    global _BACKEND
+    with _BACKEND_LOCK:
+        if _BACKEND is None:
+            _BACKEND = make_backend_from_env()
+        return _BACKEND
+
+
+class TieredCache:
+    """
+    LRU local (rápida, por proceso) delante del backend compartido.
+    Con el backend 'memory' sólo existe el nivel local; con 'filesystem' o
+    'diskcache' lo que escribe un worker lo puede leer cualquier otro.
+    Misma interfaz que LRUCache (get / set / pop / in / len).
+    """
+
+    def __init__(self, namespace: str, local: LRUCache, backend=None) -> None:
+        self.namespace = namespace
+        self.local = local
+        self._backend = backend
+
+    @property
+    def backend(self):
+        backend = self._backend if self._backend is not None else get_backend()
+        return backend if backend.shared else None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self.local.get(key)
+        if value is None:
+            backend = self.backend
+            if backend is not None:
+                value = backend.get((self.namespace, key))
+                if value is not None:
+                    self.local.set(key, value)
+        return default if value is None else value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self.local.set(key, value)
+        backend = self.backend
+        if backend is not None and estimate_nbytes(value) <= getattr(backend, "max_bytes", float("inf")):
+            backend.set((self.namespace, key), value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        value = self.local.pop(key, default)
+        backend = self.backend
+        if backend is not None:
+            backend.delete((self.namespace, key))
+        return value
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+    @property
+    def total_bytes(self) -> int:
+        return self.local.total_bytes
@@ -0,0 +1,100 @@
+# engine/bands.py
+# -----------------------------------------------------------------------------
+# Perfiles de evolución de bandas (quimigramas: CO2, CO, H2O, CH4, C=O...).
+# - Una vez por cubo: integral acumulada (trapecios) de cada espectro a lo
+#   largo del número de onda, ordenado ascendente → matriz C (n_spectra × n_wn).
+# - La integral de cualquier banda [lo, hi] en todos los espectros es
+#   C(hi) - C(lo): dos columnas + la parte de trapecio dentro del intervalo
+#   de la rejilla en que cae cada borde. O(n_spectra), sin re-integrar.
+# - Línea base: cuerda entre los bordes de la banda; el perfil es el área
+#   entre el espectro y la cuerda (> 0 si el espectro queda por encima).
+# - C se guarda en BANDS (float64: las restas de acumulados pierden precisión
+#   en float32).
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from scipy.integrate import cumulative_trapezoid
+
+from engine.backends import TieredCache
+from engine.cache import LRUCache
+from engine.ftir_cube import FtirCube
+
+# Bandas típicas de gases de pirólisis/combustión (cm⁻¹)
+BAND_PRESETS: Dict[str, Tuple[float, float]] = {
+    "CO2": (2250.0, 2400.0),
+    "CO": (2060.0, 2240.0),
+    "H2O": (3500.0, 3900.0),
+    "CH4": (2980.0, 3050.0),
+    "C=O": (1650.0, 1850.0),
+    "NH3": (940.0, 980.0),
+}
+
+
+class CumulativeBands:
+    """Acumulados por espectro sobre los números de onda ascendentes del cubo."""
+
+    __slots__ = ("wavenumbers", "order", "cumulative")
+
+    def __init__(self, wavenumbers: np.ndarray, order: np.ndarray, cumulative: np.ndarray) -> None:
+        self.wavenumbers = wavenumbers     # ascendentes
+        self.order = order                 # columna del cubo de cada número de onda ascendente
+        self.cumulative = cumulative       # (n_spectra × n_wn)
+
+    @property
+    def nbytes(self) -> int:
+        return self.wavenumbers.nbytes + self.order.nbytes + self.cumulative.nbytes
+
+
+BANDS = TieredCache("bands", LRUCache(max_entries=8, max_bytes=1024 ** 3))
+
+
+def cumulative_bands(cube: FtirCube) -> CumulativeBands:
+    """Acumulados de trapecio del cubo (una vez por cube_id)."""
+    cached = BANDS.get(cube.cube_id)
+    if cached is not None:
+        return cached
+    order = np.argsort(cube.wavenumbers, kind="stable")
+    wn = cube.wavenumbers[order]
+    values = np.nan_to_num(np.asarray(cube.intensities, dtype=np.float64)[:, order])
+    cumulative = cumulative_trapezoid(values, wn, axis=1, initial=0.0)
+    bands = CumulativeBands(wn, order, np.ascontiguousarray(cumulative))
+    BANDS.set(cube.cube_id, bands)
+    return bands
+
+
+def _edge(cube: FtirCube, bands: CumulativeBands, x: float) -> Tuple[np.ndarray, np.ndarray]:
+    """(C(x), y(x)) de todos los espectros en un número de onda cualquiera (interpolación lineal)."""
+    wn = bands.wavenumbers
+    j = int(np.clip(np.searchsorted(wn, x, side="right") - 1, 0, len(wn) - 2))
+    width = wn[j + 1] - wn[j]
+    t = (x - wn[j]) / width if width > 0 else 0.0
+    y0 = np.nan_to_num(np.asarray(cube.intensities[:, bands.order[j]], dtype=np.float64))
+    y1 = np.nan_to_num(np.asarray(cube.intensities[:, bands.order[j + 1]], dtype=np.float64))
+    yx = y0 + t * (y1 - y0)
+    return bands.cumulative[:, j] + 0.5 * (x - wn[j]) * (y0 + yx), yx
+
+
+def band_profile(cube: FtirCube, lo: float, hi: float, baseline: bool = True) -> Optional[np.ndarray]:
+    """
+    Área de la banda [lo, hi] (cm⁻¹, en cualquier orden) en cada espectro del
+    cubo, sobre la cuerda entre sus bordes si `baseline`. None si la banda
+    queda fuera del rango del cubo o no tiene anchura.
+    """
+    if len(cube.wavenumbers) < 2:
+        return None
+    bands = cumulative_bands(cube)
+    wn = bands.wavenumbers
+    lo, hi = sorted((float(lo), float(hi)))
+    lo, hi = max(lo, float(wn[0])), min(hi, float(wn[-1]))
+    if not hi > lo:
+        return None
+    c_lo, y_lo = _edge(cube, bands, lo)
+    c_hi, y_hi = _edge(cube, bands, hi)
+    area = c_hi - c_lo
+    if baseline:
+        area = area - 0.5 * (hi - lo) * (y_lo + y_hi)
+    return area
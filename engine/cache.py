@@ -0,0 +1,105 @@
+# engine/cache.py
+# -----------------------------------------------------------------------------
+# Caché LRU en memoria con expulsión por nº de entradas y por tamaño (bytes).
+# - Thread-safe (el servidor de Dash atiende callbacks en varios hilos).
+# - El tamaño de cada valor se estima con `nbytes` si existe.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Iterator
+
+import numpy as np
+
+
+def estimate_nbytes(value: Any) -> int:
+    """Estimación barata del tamaño en memoria de un valor cacheado."""
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, (int, np.integer)):
+        return int(nbytes)
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Diccionario acotado con política LRU.
+
+    Expulsa las entradas menos usadas cuando se supera `max_entries`
+    o `max_bytes`. Un valor más grande que `max_bytes` no se guarda.
+    """
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 512 * 1024 ** 2) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: dict = {}
+        self._total = 0
+        self._lock = threading.RLock()
+
+    # ---- acceso ----
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = estimate_nbytes(value)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._data[key] = value
+            self._sizes[key] = size
+            self._total += size
+            self._evict()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key]
+            self._drop(key)
+            return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._total = 0
+
+    # ---- utilidades ----
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        with self._lock:
+            return iter(list(self._data.keys()))
+
+    # ---- internos ----
+    def _drop(self, key: Hashable) -> None:
+        del self._data[key]
+        self._total -= self._sizes.pop(key, 0)
+
+    def _evict(self) -> None:
+        while self._data and (len(self._data) > self.max_entries or self._total > self.max_bytes):
+            oldest = next(iter(self._data))
+            self._drop(oldest)
+
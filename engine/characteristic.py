@@ -0,0 +1,86 @@
+# engine/characteristic.py
+# -----------------------------------------------------------------------------
+# Puntos característicos de las curvas TG/DTG de todos los ensayos a la vez,
+# sobre las matrices ya calculadas (y cacheadas) de engine/tg_batch.py.
+# - Una etapa de pérdida de masa es un tramo continuo en el que la velocidad
+#   de pérdida (-dTG/dT) supera STEP_THRESHOLD × el máximo del ensayo.
+# - Tpeak: máximo de la velocidad dentro del tramo.
+# - Tonset / Tendset: método de la tangente (la tangente a la TG en Tpeak
+#   corta la meseta anterior / posterior a la etapa).
+# - Pérdida de masa y velocidad se expresan en % de la masa inicial.
+# - Se ignora media ventana del filtro en cada extremo del ensayo (ahí la
+#   derivada sale del relleno de la rejilla, no de los datos).
+# Todo se resuelve con operaciones sobre el array aplanado (reduceat), sin
+# bucles por ensayo ni por etapa.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from engine.tg_batch import TGBatch
+
+STEP_THRESHOLD = 0.05   # fracción del pico máximo del ensayo que delimita una etapa
+MIN_STEP_LOSS = 1.0     # % (TG normalizada): etapas menores se descartan
+
+COLUMNS = ["run", "step", "t_onset", "t_peak", "t_endset", "peak_rate", "mass_loss", "residue"]
+
+
+def characteristic_points(batch: TGBatch, threshold: float = STEP_THRESHOLD,
+                          min_loss: float = MIN_STEP_LOSS, edge: Optional[int] = None) -> pd.DataFrame:
+    """
+    Una fila por etapa y ensayo (índice de fila del batch en `run`):
+    t_onset, t_peak, t_endset (°C), peak_rate (%/°C), mass_loss y residue (%).
+    """
+    n = len(batch.grid)
+    rate = np.where(batch.interior(edge), -batch.deriv, 0.0)
+    rowmax = rate.max(axis=1, keepdims=True)
+    above = (rate > threshold * rowmax) & (rowmax > 0)
+    if not above.any():
+        return pd.DataFrame(columns=COLUMNS)
+
+    # inicio/fin (exclusivo) de cada tramo en índices del array aplanado
+    padded = np.zeros((above.shape[0], n + 2), dtype=np.int8)
+    padded[:, 1:-1] = above
+    edges = np.diff(padded, axis=1)
+    rows, c_start = np.nonzero(edges == 1)
+    _, c_end = np.nonzero(edges == -1)
+    starts, ends = rows * n + c_start, rows * n + c_end
+    lengths = ends - starts
+
+    # máximo de cada tramo: reduceat sobre [inicio, fin) alternos
+    flat = np.append(rate.ravel(), 0.0)
+    seg_max = np.maximum.reduceat(flat, np.column_stack((starts, ends)).ravel())[::2]
+    # primera posición que alcanza ese máximo
+    pos = np.flatnonzero(above.ravel())
+    seg_id = np.repeat(np.arange(len(starts)), lengths)
+    hits = np.where(flat[pos] == seg_max[seg_id], pos, flat.size)
+    peak = np.minimum.reduceat(hits, np.cumsum(lengths) - lengths)
+
+    base = rows * n
+    m = batch.norm_mass.ravel()
+    m_start, m_end, m_peak = m[starts], m[ends - 1], m[peak]
+    t_peak = batch.grid[peak - base]
+    t_onset = t_peak - (m_start - m_peak) / seg_max
+    t_endset = t_peak + (m_peak - m_end) / seg_max
+    loss = m_start - m_end
+
+    # TG normalizada → % de la masa inicial
+    residue = batch.residue[rows]
+    scale = np.where(np.isfinite(residue), (100.0 - residue) / 100.0, np.nan)
+
+    keep = loss >= min_loss
+    table = pd.DataFrame({
+        "run": rows[keep],
+        "t_onset": t_onset[keep],
+        "t_peak": t_peak[keep],
+        "t_endset": t_endset[keep],
+        "peak_rate": (seg_max * scale)[keep],
+        "mass_loss": (loss * scale)[keep],
+        "residue": residue[keep],
+    })
+    table.insert(1, "step", table.groupby("run").cumcount() + 1)
+    return table[COLUMNS]
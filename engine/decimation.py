@@ -0,0 +1,128 @@
+# engine/decimation.py
+# -----------------------------------------------------------------------------
+# Reducción de puntos para las gráficas (Largest-Triangle-Three-Buckets).
+# - Cada traza se envía con ~DEFAULT_POINTS puntos en vez de todas las filas;
+#   LTTB conserva picos y forma mejor que un submuestreo regular.
+# - Con un visor (x0, x1) sólo se decima lo visible (más un margen), así que
+#   al hacer zoom la curva recupera la resolución completa.
+# - Los NaN y los puntos fuera del visor cortan la curva en tramos; cada tramo
+#   se decima por separado y se unen con un NaN (hueco en la línea).
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_POINTS = 2000       # puntos por traza y visor
+PLOT_DTYPE = np.float32     # lo que se envía al navegador (mitad de bytes que float64)
+VIEWPORT_PAD = 0.25         # margen a cada lado del visor (fracción del ancho)
+
+Viewport = Optional[Sequence[float]]   # (x0, x1) o None = todo el rango
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Índices de los `n_out` puntos elegidos por LTTB (incluye primero y último).
+    En LTTB cada cubo elige el punto que forma el triángulo de mayor área con
+    el punto elegido en el cubo anterior (ancla) y la media del siguiente.
+    El ancla depende del cubo anterior, así que se recorre cubo a cubo; dentro
+    de cada cubo el área es una operación vectorizada (≈4 µs por cubo).
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n_out-2 cubos sobre los puntos interiores [1, n-1)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    starts = edges[:-1]
+    sizes = np.diff(edges)
+    mean_x = (np.add.reduceat(x[1:n - 1], starts - 1) / sizes).tolist()
+    mean_y = (np.add.reduceat(y[1:n - 1], starts - 1) / sizes).tolist()
+    # media del cubo siguiente (para el último: el último punto)
+    next_x = mean_x[1:] + [float(x[n - 1])]
+    next_y = mean_y[1:] + [float(y[n - 1])]
+
+    chosen = np.empty(n_out, dtype=np.intp)
+    chosen[0], chosen[-1] = 0, n - 1
+    bounds = edges.tolist()
+    ax, ay = float(x[0]), float(y[0])
+    for b in range(n_out - 2):
+        s, e = bounds[b], bounds[b + 1]
+        dx, dy = ax - next_x[b], ay - next_y[b]
+        # área·2 = |dx·(y - ay) - dy·(x - ax)|; gana el primer máximo del cubo
+        area = dx * y[s:e] - dy * x[s:e]
+        area += dy * ax - dx * ay
+        j = s + int(np.abs(area, out=area).argmax())
+        chosen[b + 1] = j
+        ax, ay = float(x[j]), float(y[j])
+    return chosen
+
+
+def _segments(mask: np.ndarray) -> np.ndarray:
+    """(inicio, fin) de cada tramo contiguo de True en `mask`."""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.column_stack((np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def decimate(x: Sequence[float], y: Sequence[float], n_out: int = DEFAULT_POINTS,
+             viewport: Viewport = None, pad: float = VIEWPORT_PAD,
+             dtype=PLOT_DTYPE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (x, y) reducidos a ~n_out puntos para dibujar, como `dtype` (float32).
+    Con `viewport` sólo se conserva [x0, x1] ampliado en `pad` a cada lado
+    (y un punto más por tramo, para que la línea salga del visor).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = np.isfinite(x) & np.isfinite(y)
+    if viewport is not None:
+        lo, hi = sorted(viewport)
+        width = hi - lo
+        inside = (x >= lo - pad * width) & (x <= hi + pad * width)
+        inside[1:] |= inside[:-1]
+        inside[:-1] |= inside[1:].copy()
+        keep &= inside
+    if len(x) <= n_out and keep.all():
+        return x.astype(dtype), y.astype(dtype)
+
+    segments = _segments(keep)
+    total = int(keep.sum())
+    if total == 0:
+        return x[:0].astype(dtype), y[:0].astype(dtype)
+
+    xs, ys = [], []
+    for start, end in segments:
+        m = max(3, int(round(n_out * (end - start) / total)))
+        idx = start + lttb_indices(x[start:end], y[start:end], m)
+        if xs:
+            xs.append([np.nan])
+            ys.append([np.nan])
+        xs.append(x[idx])
+        ys.append(y[idx])
+    return np.concatenate(xs).astype(dtype), np.concatenate(ys).astype(dtype)
+
+
+def viewport_from_relayout(relayout: Optional[Dict[str, Any]], current: Viewport = None,
+                           axis: str = "xaxis") -> Optional[List[float]]:
+    """
+    Visor del eje `axis` tras un evento relayoutData de Plotly (apto para un
+    dcc.Store):
+      - zoom/pan  → [x0, x1]
+      - reset     → None (autorange)
+      - otro evento (leyenda, formas, títulos…) → `current` sin cambios
+    """
+    if not relayout:
+        return current
+    if relayout.get(f"{axis}.autorange"):
+        return None
+    rng = relayout.get(f"{axis}.range")
+    if rng is None and f"{axis}.range[0]" in relayout and f"{axis}.range[1]" in relayout:
+        rng = (relayout[f"{axis}.range[0]"], relayout[f"{axis}.range[1]"])
+    if rng is None:
+        return current
+    try:
+        return [float(rng[0]), float(rng[1])]
+    except (TypeError, ValueError):
+        return current
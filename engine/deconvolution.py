@@ -0,0 +1,211 @@
+# engine/deconvolution.py
+# -----------------------------------------------------------------------------
+# Deconvolución de la DTG en N picos (etapas solapadas de descomposición).
+# - Modelos: 'gaussian' (h, c, w) y 'fraser_suzuki' (h, c, w, s: asimetría);
+#   w es la anchura a media altura (FWHM) en ambos.
+# - Ajuste por mínimos cuadrados (scipy.optimize.least_squares) con jacobiano
+#   analítico y semillas en los picos más prominentes de la curva.
+# - fit_many reparte los ajustes de muchos ensayos en un ProcessPoolExecutor
+#   e informa del progreso; los resultados se memorizan por (run_id, modelo,
+#   N picos). Pensado para ejecutarse dentro del proceso de un callback en
+#   segundo plano (un solo hilo), no en los hilos del servidor.
+# Nº de procesos: TGFTIR_FIT_WORKERS (por defecto, nº de CPUs).
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.optimize import least_squares
+from scipy.signal import find_peaks, peak_widths
+
+from engine.backends import TieredCache
+from engine.cache import LRUCache
+
+MODELS = ("gaussian", "fraser_suzuki")
+N_PARAMS = {"gaussian": 3, "fraser_suzuki": 4}
+MAX_FIT_POINTS = 1500       # la curva se submuestrea a lo sumo a estos puntos
+MAX_PEAKS = 8
+FIT_WORKERS = int(os.getenv("TGFTIR_FIT_WORKERS", "0")) or (os.cpu_count() or 1)
+
+_LN2 = np.log(2.0)
+_S_MIN = 1e-6               # |s| mínima (s → 0 es el límite gaussiano)
+
+
+# ---------------------------------------------------------------------------
+# Modelos y jacobianos (params: array (n_picos, n_parámetros))
+# ---------------------------------------------------------------------------
+def _gaussian(x: np.ndarray, p: np.ndarray, jac: bool = False):
+    h, c, w = p[:, 0], p[:, 1], p[:, 2]
+    z = (x[:, None] - c) / w
+    e = np.exp(-4.0 * _LN2 * z ** 2)
+    f = h * e
+    if not jac:
+        return f
+    k = 8.0 * _LN2 * f
+    return f, np.stack([e, k * z / w, k * z ** 2 / w], axis=2)
+
+
+def _fraser_suzuki(x: np.ndarray, p: np.ndarray, jac: bool = False):
+    h, c, w, s = p[:, 0], p[:, 1], p[:, 2], p[:, 3]
+    s = np.where(np.abs(s) < _S_MIN, np.copysign(_S_MIN, s), s)
+    d = x[:, None] - c
+    u = 1.0 + 2.0 * s * d / w
+    inside = u > 0
+    u = np.where(inside, u, 1.0)
+    L = np.log(u)
+    e = np.where(inside, np.exp(-_LN2 * (L / s) ** 2), 0.0)
+    f = h * e
+    if not jac:
+        return f
+    g = -2.0 * _LN2 * f * L / s ** 2          # ∂f/∂L
+    dL_dc = -2.0 * s / (w * u)
+    dL_dw = -2.0 * s * d / (w ** 2 * u)
+    dL_ds = 2.0 * d / (w * u)
+    df_ds = g * dL_ds + 2.0 * _LN2 * f * L ** 2 / s ** 3
+    return f, np.stack([e, g * dL_dc, g * dL_dw, df_ds], axis=2)
+
+
+_MODEL_FN = {"gaussian": _gaussian, "fraser_suzuki": _fraser_suzuki}
+
+
+def peak_curves(model: str, params: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """Curva de cada pico en x: array (n_picos, len(x))."""
+    params = np.asarray(params, dtype=np.float64).reshape(-1, N_PARAMS[model])
+    return _MODEL_FN[model](np.asarray(x, dtype=np.float64), params).T
+
+
+# ---------------------------------------------------------------------------
+# Ajuste de un ensayo
+# ---------------------------------------------------------------------------
+class PeakFit:
+    """Resultado de un ajuste: parámetros por pico, r² y fracción de área de cada pico."""
+
+    __slots__ = ("model", "params", "r2", "areas")
+
+    def __init__(self, model: str, params: np.ndarray, r2: float, areas: np.ndarray) -> None:
+        self.model = model
+        self.params = params
+        self.r2 = r2
+        self.areas = areas
+
+    @property
+    def nbytes(self) -> int:
+        return self.params.nbytes + self.areas.nbytes
+
+
+def _initial_guess(x: np.ndarray, y: np.ndarray, n_peaks: int, model: str) -> np.ndarray:
+    """Semillas: picos más prominentes; si faltan, el máximo del residuo."""
+    dx = float(x[1] - x[0]) if len(x) > 1 else 1.0
+    idx, props = find_peaks(y, prominence=0.01 * float(np.max(y)))
+    idx = idx[np.argsort(props["prominences"])[::-1]][:n_peaks]
+    widths = peak_widths(y, idx, rel_height=0.5)[0] * dx if len(idx) else np.array([])
+    seeds = [(y[i], x[i], max(wd, 3 * dx)) for i, wd in zip(idx, widths)]
+    span = float(x[-1] - x[0])
+    while len(seeds) < n_peaks:
+        p = np.array([[h, c, w] for h, c, w in seeds]) if seeds else np.zeros((0, 3))
+        resid = y - (_gaussian(x, p).sum(axis=1) if len(p) else 0.0)
+        i = int(np.argmax(resid))
+        seeds.append((max(resid[i], 0.05 * float(np.max(y))), x[i], span / (4 * n_peaks)))
+    seeds.sort(key=lambda t: t[1])
+    p0 = np.array(seeds, dtype=np.float64)
+    if model == "fraser_suzuki":
+        p0 = np.column_stack([p0, np.full(n_peaks, -0.1)])
+    return p0
+
+
+def fit_peaks(x: Sequence[float], y: Sequence[float], n_peaks: int, model: str = "gaussian") -> PeakFit:
+    """Ajusta `n_peaks` picos del `model` a la curva (x, y) (x creciente, y ≥ 0)."""
+    if model not in _MODEL_FN:
+        raise ValueError(f"Unknown peak model: {model}")
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    ok = np.isfinite(x) & np.isfinite(y)
+    x, y = x[ok], np.clip(y[ok], 0.0, None)
+    if len(x) > MAX_FIT_POINTS:
+        stride = int(np.ceil(len(x) / MAX_FIT_POINTS))
+        x, y = x[::stride], y[::stride]
+    n_par = N_PARAMS[model]
+    fn = _MODEL_FN[model]
+    p0 = _initial_guess(x, y, n_peaks, model)
+
+    lo = np.tile([0.0, x[0], 1e-3 * (x[-1] - x[0])] + ([-0.95] if model == "fraser_suzuki" else []), n_peaks)
+    hi = np.tile([np.inf, x[-1], x[-1] - x[0]] + ([0.95] if model == "fraser_suzuki" else []), n_peaks)
+    p0 = np.clip(p0.ravel(), lo + 1e-9, hi - 1e-9)
+
+    def residual(flat):
+        return fn(x, flat.reshape(n_peaks, n_par)).sum(axis=1) - y
+
+    def jacobian(flat):
+        _, J = fn(x, flat.reshape(n_peaks, n_par), jac=True)
+        return J.reshape(len(x), n_peaks * n_par)
+
+    sol = least_squares(residual, p0, jac=jacobian, bounds=(lo, hi), x_scale="jac", max_nfev=200 * n_peaks)
+    params = sol.x.reshape(n_peaks, n_par)
+    ss_res = float(np.sum(sol.fun ** 2))
+    ss_tot = float(np.sum((y - y.mean()) ** 2))
+    curves = fn(x, params)
+    total = np.trapezoid(curves, x, axis=0)
+    areas = total / total.sum() if total.sum() > 0 else np.zeros(n_peaks)
+    order = np.argsort(params[:, 1])
+    return PeakFit(model, params[order], 1.0 - ss_res / ss_tot if ss_tot > 0 else np.nan, areas[order])
+
+
+# ---------------------------------------------------------------------------
+# Muchos ensayos en paralelo
+# ---------------------------------------------------------------------------
+FITS = TieredCache("deconv", LRUCache(max_entries=1024, max_bytes=64 * 1024 ** 2))
+
+FitJob = Tuple[Hashable, np.ndarray, np.ndarray]   # (run_id, x, y)
+
+
+def _fit_job(args):
+    x, y, n_peaks, model = args
+    return fit_peaks(x, y, n_peaks, model)
+
+
+def fit_many(jobs: Sequence[FitJob], n_peaks: int, model: str = "gaussian",
+             progress: Optional[Callable[[int, int], None]] = None,
+             max_workers: Optional[int] = None) -> Dict[Hashable, PeakFit]:
+    """
+    Ajusta todos los ensayos: los que ya están en caché se devuelven al momento,
+    el resto se reparte entre procesos. `progress(hechos, total)` tras cada uno.
+    """
+    results: Dict[Hashable, PeakFit] = {}
+    pending: List[FitJob] = []
+    for run_id, x, y in jobs:
+        cached = FITS.get((run_id, model, n_peaks))
+        if cached is not None:
+            results[run_id] = cached
+        else:
+            pending.append((run_id, x, y))
+
+    total, done = len(jobs), len(results)
+    if progress:
+        progress(done, total)
+    if not pending:
+        return results
+
+    workers = min(len(pending), max_workers or FIT_WORKERS)
+    if workers <= 1:
+        for run_id, x, y in pending:
+            results[run_id] = fit_peaks(x, y, n_peaks, model)
+            FITS.set((run_id, model, n_peaks), results[run_id])
+            done += 1
+            if progress:
+                progress(done, total)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_fit_job, (x, y, n_peaks, model)): run_id for run_id, x, y in pending}
+        for future in as_completed(futures):
+            run_id = futures[future]
+            results[run_id] = future.result()
+            FITS.set((run_id, model, n_peaks), results[run_id])
+            done += 1
+            if progress:
+                progress(done, total)
+    return results
@@ -0,0 +1,106 @@
+# engine/ftir_cube.py
+# -----------------------------------------------------------------------------
+# Cubo espectral FTIR compacto, construido UNA vez al subir el fichero:
+# - times:        (n_spectra,)   float64, ordenado ascendente (s)
+# - wavenumbers:  (n_wavenumbers,) float64 (cm⁻¹, en el orden del fichero)
+# - intensities:  (n_spectra, n_wavenumbers) contiguo en C (fila = espectro)
+# Los callbacks sólo indexan en él; no se transpone ni se re-parsea nada.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from engine.backends import TieredCache
+from engine.cache import LRUCache
+
+
+class FtirCube:
+    """Espectros FTIR como matriz (tiempo × número de onda)."""
+
+    __slots__ = ("cube_id", "times", "wavenumbers", "intensities")
+
+    def __init__(self, cube_id: str, times: np.ndarray, wavenumbers: np.ndarray, intensities: np.ndarray) -> None:
+        order = np.argsort(times, kind="stable")
+        if np.any(order != np.arange(len(order))):
+            times = times[order]
+            intensities = intensities[order]
+        self.cube_id = cube_id
+        self.times = np.ascontiguousarray(times, dtype=np.float64)
+        self.wavenumbers = np.ascontiguousarray(wavenumbers, dtype=np.float64)
+        self.intensities = np.ascontiguousarray(intensities)
+
+    @classmethod
+    def from_frame(cls, ftir: pd.DataFrame, cube_id: str) -> "FtirCube":
+        """
+        DataFrame tal y como se lee del CSV del equipo:
+          - 1ª columna: números de onda (una fila por número de onda)
+          - resto de columnas: un espectro por columna; la cabecera es el tiempo (s),
+            posiblemente con coma decimal.
+        """
+        headers = pd.Index(ftir.columns[1:]).astype(str).str.strip().str.replace(",", ".", regex=False)
+        times = pd.to_numeric(headers, errors="coerce").to_numpy(dtype=np.float64)
+        keep = ~np.isnan(times)
+
+        values = ftir.to_numpy(dtype=np.float64)
+        wavenumbers = values[:, 0]
+        intensities = values[:, 1:][:, keep].T
+        return cls(cube_id, times[keep], wavenumbers, intensities)
+
+    # ---- propiedades ----
+    @property
+    def n_spectra(self) -> int:
+        return self.intensities.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.times.nbytes + self.wavenumbers.nbytes + self.intensities.nbytes
+
+    def spectrum(self, index: int) -> np.ndarray:
+        return self.intensities[index]
+
+    # ---- búsqueda por tiempo (O(log n), times está ordenado) ----
+    def nearest_index(self, t: float) -> int:
+        """Índice del espectro más cercano a t (en empate, el anterior)."""
+        times = self.times
+        n = len(times)
+        i = int(np.searchsorted(times, t))
+        if i <= 0:
+            return 0
+        if i >= n:
+            return n - 1
+        return i - 1 if (t - times[i - 1]) <= (times[i] - t) else i
+
+    def spectrum_at(self, t: float, interpolate: bool = False) -> Tuple[np.ndarray, float]:
+        """
+        Espectro en el instante t y el tiempo al que corresponde.
+          - interpolate=False: espectro medido más cercano (y su tiempo real).
+          - interpolate=True: interpolación lineal entre los dos barridos que
+            rodean a t (t se recorta al rango adquirido).
+        """
+        times = self.times
+        n = len(times)
+        if not interpolate or n < 2:
+            i = self.nearest_index(t)
+            return self.intensities[i], float(times[i])
+
+        t = float(np.clip(t, times[0], times[-1]))
+        i = int(np.clip(np.searchsorted(times, t, side="right"), 1, n - 1))
+        t0, t1 = times[i - 1], times[i]
+        w = (t - t0) / (t1 - t0) if t1 > t0 else 0.0
+        spectrum = (1.0 - w) * self.intensities[i - 1] + w * self.intensities[i]
+        return spectrum, t
+
+
+# Cubos ya construidos, por hash del fichero (evita re-parsear en cada callback;
+# con backend compartido, también entre workers)
+CUBES = TieredCache("cube", LRUCache(max_entries=8, max_bytes=2 * 1024 ** 3))
+
+
+def get_cube(cube_id: Optional[str]) -> Optional[FtirCube]:
+    if not cube_id:
+        return None
+    return CUBES.get(cube_id)
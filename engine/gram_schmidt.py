@@ -0,0 +1,58 @@
+# engine/gram_schmidt.py
+# -----------------------------------------------------------------------------
+# Perfil de Gram–Schmidt calculado a partir del propio cubo FTIR (sin el
+# XLSX del equipo).
+# - Base de fondo: QR de los primeros espectros (antes de que salgan gases),
+#   columnas ortonormales Q (n_wavenumbers × k).
+# - GS(t) = ‖x(t) − Q Qᵀ x(t)‖ = sqrt(‖x‖² − ‖Qᵀx‖²): una multiplicación
+#   matricial por bloques de espectros, sin bucles por tiempo.
+# - Se guarda como un TGRun (tiempo en s, señal) en RUNS, una vez por cubo,
+#   con las mismas columnas que el GS del XLSX para que la página no cambie.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import numpy as np
+
+from engine.ftir_cube import FtirCube
+from engine.run_store import RUNS, TGRun
+
+DEFAULT_BACKGROUND_SCANS = 5    # primeros barridos usados como fondo
+CHUNK_SPECTRA = 1024            # espectros por bloque (acota la memoria en float64)
+RANK_TOL = 1e-10                # columnas de R casi nulas → fondo redundante
+
+
+def background_basis(cube: FtirCube, n_background: int = DEFAULT_BACKGROUND_SCANS) -> np.ndarray:
+    """Base ortonormal (n_wavenumbers × k) del espacio de los espectros de fondo."""
+    k = max(1, min(n_background, cube.n_spectra))
+    background = np.nan_to_num(np.asarray(cube.intensities[:k], dtype=np.float64)).T
+    q, r = np.linalg.qr(background)
+    diag = np.abs(np.diag(r))
+    keep = diag > RANK_TOL * max(float(diag.max()), 1.0)
+    return q[:, keep]
+
+
+def gram_schmidt(cube: FtirCube, n_background: int = DEFAULT_BACKGROUND_SCANS) -> np.ndarray:
+    """Perfil GS (uno por espectro del cubo): norma de la parte no explicada por el fondo."""
+    basis = background_basis(cube, n_background)
+    out = np.empty(cube.n_spectra)
+    for start in range(0, cube.n_spectra, CHUNK_SPECTRA):
+        block = np.nan_to_num(np.asarray(cube.intensities[start:start + CHUNK_SPECTRA], dtype=np.float64))
+        coef = block @ basis
+        residual2 = np.einsum("ij,ij->i", block, block) - np.einsum("ij,ij->i", coef, coef)
+        out[start:start + len(block)] = np.sqrt(np.clip(residual2, 0.0, None))
+    return out
+
+
+def gram_schmidt_run(cube: FtirCube, n_background: int = DEFAULT_BACKGROUND_SCANS) -> TGRun:
+    """GS del cubo como TGRun ('Time (s)', 'Gram-Schmidt'), calculado una vez y guardado en RUNS."""
+    run_id = f"{cube.cube_id}-gs{n_background}"
+    run = RUNS.get(run_id)
+    if run is None:
+        columns = {
+            "Time (s)": np.ascontiguousarray(cube.times, dtype=np.float64),
+            "Gram-Schmidt": gram_schmidt(cube, n_background),
+        }
+        run = TGRun(run_id, "Gram-Schmidt (FTIR)", columns)
+        RUNS.put(run)
+    return run
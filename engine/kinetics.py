@@ -0,0 +1,132 @@
+# engine/kinetics.py
+# -----------------------------------------------------------------------------
+# Cinética isoconversional sobre ensayos a distintas velocidades de
+# calentamiento β (°C/min), a partir del TGBatch de engine/tg_batch.py.
+# - α(T) = 1 - TG/100 (TG normalizada y suavizada), forzada a ser monótona.
+# - T(α) y dα/dT(α) de todos los ensayos en una rejilla común de α con un
+#   único searchsorted sobre las filas concatenadas (cada fila desplazada +2).
+# - Friedman, Ozawa–Flynn–Wall (OFW) y Kissinger–Akahira–Sunose (KAS): una
+#   regresión lineal frente a 1/T por nivel de α, todas a la vez (mínimos
+#   cuadrados vectorizados a lo largo del eje de ensayos).
+# - Kissinger: una sola Ea con la temperatura del pico de DTG de cada ensayo.
+# - β se lee del nombre del fichero (_R10, _R10R5 → 10) o, si no aparece, de
+#   la pendiente de la temperatura programada frente al tiempo.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import re
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from engine.tg_batch import TGBatch
+
+R_GAS = 8.314462618         # J/(mol·K)
+KELVIN = 273.15
+OFW_FACTOR = 1.052          # aproximación de Doyle
+DEFAULT_ALPHAS = np.linspace(0.05, 0.95, 200)
+
+_RATE_IN_NAME = re.compile(r"_R(\d+(?:[.,]\d+)?)", re.IGNORECASE)
+
+
+def heating_rate_from_name(filename: str) -> Optional[float]:
+    """β (°C/min) codificada en el nombre: 'TG_x_R10.csv' → 10; con varias (R10R5), la primera."""
+    match = _RATE_IN_NAME.search(filename or "")
+    return float(match.group(1).replace(",", ".")) if match else None
+
+
+def heating_rate_from_program(time_min: Sequence[float], program_temp: Sequence[float]) -> Optional[float]:
+    """β (°C/min) como pendiente de la temperatura programada en los tramos de calentamiento."""
+    t = np.asarray(time_min, dtype=np.float64)
+    temp = np.asarray(program_temp, dtype=np.float64)
+    ok = np.isfinite(t) & np.isfinite(temp)
+    t, temp = t[ok], temp[ok]
+    if len(t) < 3:
+        return None
+    ramp = np.gradient(temp, t) > 0
+    if ramp.sum() < 3:
+        return None
+    slope = np.polyfit(t[ramp], temp[ramp], 1)[0]
+    return float(slope) if slope > 0 else None
+
+
+def conversion(batch: TGBatch) -> Tuple[np.ndarray, np.ndarray]:
+    """(α, dα/dT) de cada ensayo en la rejilla del batch (α monótona en [0, 1])."""
+    alpha = np.clip(1.0 - batch.smooth / 100.0, 0.0, 1.0)
+    alpha = np.maximum.accumulate(alpha, axis=1)
+    dadT = np.where(batch.mask, -batch.deriv / 100.0, 0.0)
+    return alpha, dadT
+
+
+def at_conversion(batch: TGBatch, alphas: np.ndarray = DEFAULT_ALPHAS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    T (°C) y dα/dT en cada nivel de α para cada ensayo: matrices
+    (n_ensayos × n_alphas), con un solo searchsorted para todo el batch.
+    """
+    alpha, dadT = conversion(batch)
+    n_runs, n = alpha.shape
+    offset = 2.0 * np.arange(n_runs)[:, None]          # α ∈ [0, 1] → filas separadas
+    flat = (alpha + offset).ravel()
+    targets = (np.asarray(alphas)[None, :] + offset)
+    base = (np.arange(n_runs) * n)[:, None]
+    hi = np.searchsorted(flat, targets.ravel(), side="left").reshape(targets.shape)
+    hi = np.clip(hi, base + 1, base + n - 1)
+    lo = hi - 1
+    span = flat[hi] - flat[lo]
+    w = np.where(span > 0, (targets - flat[lo]) / np.where(span > 0, span, 1.0), 0.0)
+    grid = batch.grid
+    temps = grid[lo - base] + w * (grid[hi - base] - grid[lo - base])
+    rate = dadT.ravel()
+    rates = rate[lo] + w * (rate[hi] - rate[lo])
+    return temps, rates
+
+
+def _linear_fit(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Pendiente y r² de y frente a x por columnas (regresiones independientes a lo largo del eje 0)."""
+    xm = x - np.nanmean(x, axis=0)
+    ym = y - np.nanmean(y, axis=0)
+    sxy = np.nansum(xm * ym, axis=0)
+    sxx = np.nansum(xm * xm, axis=0)
+    syy = np.nansum(ym * ym, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = sxy / sxx
+        r2 = sxy ** 2 / (sxx * syy)
+    return slope, r2
+
+
+def isoconversional(batch: TGBatch, betas: Sequence[float], alphas: np.ndarray = DEFAULT_ALPHAS) -> pd.DataFrame:
+    """
+    Ea(α) en kJ/mol por Friedman, OFW y KAS (+ r² de cada ajuste).
+    `betas` en °C/min, una por fila del batch; hacen falta ≥ 2 velocidades distintas.
+    """
+    betas = np.asarray(betas, dtype=np.float64)
+    alphas = np.asarray(alphas, dtype=np.float64)
+    temps, dadT = at_conversion(batch, alphas)
+    T = temps + KELVIN
+    inv_T = 1.0 / T
+    beta = betas[:, None]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        friedman_y = np.log(np.where(dadT > 0, beta * dadT, np.nan))   # ln(dα/dt)
+        ofw_y = np.broadcast_to(np.log(beta), T.shape)
+        kas_y = np.log(beta / T ** 2)
+
+    out = {"alpha": alphas}
+    for name, y, factor in (("friedman", friedman_y, 1.0), ("ofw", ofw_y, OFW_FACTOR), ("kas", kas_y, 1.0)):
+        x = np.where(np.isfinite(y), inv_T, np.nan)
+        slope, r2 = _linear_fit(x, y)
+        out[name] = -slope * R_GAS / factor / 1000.0
+        out[f"{name}_r2"] = r2
+    return pd.DataFrame(out)
+
+
+def kissinger(batch: TGBatch, betas: Sequence[float]) -> Tuple[float, float]:
+    """Ea (kJ/mol) y r² de Kissinger: ln(β/Tp²) frente a 1/Tp, Tp = pico de DTG."""
+    betas = np.asarray(betas, dtype=np.float64)
+    _, dadT = conversion(batch)
+    dadT = np.where(batch.interior(), dadT, 0.0)   # sin los bordes del filtro
+    t_peak = batch.grid[np.argmax(dadT, axis=1)] + KELVIN
+    slope, r2 = _linear_fit(1.0 / t_peak, np.log(betas / t_peak ** 2))
+    return float(-slope * R_GAS / 1000.0), float(r2)
@@ -0,0 +1,399 @@
+# engine/library.py
+# -----------------------------------------------------------------------------
+# Biblioteca local de espectros FTIR de referencia (fase gas), sin conexión.
+# - Importa JCAMP-DX (.jdx/.dx/.jcamp: AFFN y ASDF comprimido SQZ/DIF/DUP) y
+#   CSV de dos columnas (número de onda, Y).
+# - Cada referencia se pasa a absorbancia y se remuestrea a LIBRARY_GRID:
+#   una matriz float32 (n_referencias × n_puntos) con filas normalizadas
+#   (coseno) y centradas + normalizadas (correlación de Pearson).
+# - Buscar = un producto matriz–vector y un argpartition (top-k). Con
+#   TGFTIR_LIBRARY_PCA > 0 se añade un índice PCA (SVD truncada): se
+#   puntúa en el espacio reducido y sólo se re-puntúan PCA_CANDIDATES.
+# - search_many: todos los espectros de un ensayo a la vez (matriz × matriz,
+#   por bloques).
+# - Las referencias viven como ficheros en TGFTIR_LIBRARY_DIR (todas las
+#   instancias/procesos ven las mismas); la matriz compilada se guarda al
+#   lado (.npz) y, si cambian los ficheros, sólo se parsean los nuevos o
+#   modificados (el resto de filas se reutiliza).
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from engine.preprocessing import to_absorbance
+from engine.readers import sniff_delimiter
+
+LIBRARY_DIR = Path(os.getenv("TGFTIR_LIBRARY_DIR", Path(__file__).resolve().parents[1] / "library"))
+LIBRARY_GRID = np.arange(650.0, 4000.0 + 1e-9, 2.0)      # cm⁻¹
+LIBRARY_EXTENSIONS = (".jdx", ".dx", ".jcamp", ".csv", ".txt")
+COMPILED_NAME = ".library.npz"
+PCA_COMPONENTS = int(os.getenv("TGFTIR_LIBRARY_PCA", "0"))   # 0 = sin índice PCA
+PCA_CANDIDATES = 200
+DEFAULT_TOP_K = 5
+METRICS = ("correlation", "cosine")
+BATCH_ROWS = 1024           # espectros por bloque en search_many
+
+_log = logging.getLogger("tgftir.library")
+
+Source = Union[bytes, bytearray, str, Path]
+
+
+# ---------------------------------------------------------------------------
+# Lectura de referencias
+# ---------------------------------------------------------------------------
+# ASDF (JCAMP-DX): SQZ = dígito con signo, DIF = diferencia, DUP = repetición
+_SQZ = {"@": 0, **{c: i + 1 for i, c in enumerate("ABCDEFGHI")}, **{c: -(i + 1) for i, c in enumerate("abcdefghi")}}
+_DIF = {"%": 0, **{c: i + 1 for i, c in enumerate("JKLMNOPQR")}, **{c: -(i + 1) for i, c in enumerate("jklmnopqr")}}
+_DUP = {**{c: i + 1 for i, c in enumerate("STUVWXYZ")}, "s": 9}
+_TOKEN = re.compile(r"[@A-Ia-i%J-Rj-rS-Zs]\d*(?:\.\d*)?|[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+
+
+def _asdf_value(lead: int, rest: str) -> float:
+    value = float(f"{abs(lead)}{rest}")
+    return -value if lead < 0 else value
+
+
+def _decode_xydata_line(line: str) -> Tuple[List[float], bool]:
+    """Valores de una línea (X y luego las Y) y si la línea acabó en modo DIF."""
+    values: List[float] = []
+    last_dif: Optional[float] = None
+    for tok in _TOKEN.findall(line):
+        c = tok[0]
+        if c in _DUP:
+            for _ in range(int(f"{_DUP[c]}{tok[1:]}") - 1):
+                values.append(values[-1] + last_dif if last_dif is not None else values[-1])
+        elif c in _DIF:
+            last_dif = _asdf_value(_DIF[c], tok[1:])
+            values.append(values[-1] + last_dif)
+        elif c in _SQZ:
+            last_dif = None
+            values.append(_asdf_value(_SQZ[c], tok[1:]))
+        else:
+            last_dif = None
+            values.append(float(tok))
+    return values, last_dif is not None
+
+
+def read_jcamp(source: Source) -> Tuple[str, np.ndarray, np.ndarray, bool]:
+    """(título, x en cm⁻¹, y, es_transmitancia) del primer bloque con datos de un JCAMP-DX."""
+    raw = Path(source).read_bytes() if isinstance(source, (str, Path)) else bytes(source)
+    text = raw.decode("utf-8", errors="replace")
+    labels = {}
+    ys: List[float] = []
+    pairs: List[float] = []
+    mode = None
+    prev_dif = False
+    for line in text.splitlines():
+        line = line.split("$$", 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith("##"):
+            key, _, value = line[2:].partition("=")
+            key = re.sub(r"[\s_\-/]", "", key).upper()
+            if key == "END" and mode:
+                break
+            labels.setdefault(key, value.strip())
+            mode = None
+            if key == "XYDATA":
+                mode = "xydata"
+            elif key in ("XYPOINTS", "PEAKTABLE"):
+                mode = "pairs"
+            continue
+        if mode == "xydata":
+            values, dif = _decode_xydata_line(line)
+            line_ys = values[1:]
+            if prev_dif and ys and line_ys:
+                line_ys = line_ys[1:]            # comprobación Y: repite el último valor
+            ys.extend(line_ys)
+            prev_dif = dif
+        elif mode == "pairs":
+            pairs.extend(float(t) for t in re.findall(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?", line))
+
+    xfactor = float(labels.get("XFACTOR", 1) or 1)
+    yfactor = float(labels.get("YFACTOR", 1) or 1)
+    if ys:
+        y = np.asarray(ys) * yfactor
+        first, last = float(labels.get("FIRSTX", 0)), float(labels.get("LASTX", len(y) - 1))
+        x = np.linspace(first, last, len(y))
+    elif pairs:
+        xy = np.asarray(pairs[: len(pairs) // 2 * 2]).reshape(-1, 2)
+        x, y = xy[:, 0] * xfactor, xy[:, 1] * yfactor
+    else:
+        raise ValueError("No XYDATA/XYPOINTS block found")
+    if "MICRO" in labels.get("XUNITS", "").upper():
+        x = 1e4 / x
+    transmittance = "TRANS" in labels.get("YUNITS", "").upper()
+    return labels.get("TITLE", "") or "", x, y, transmittance
+
+
+def read_reference_csv(source: Source) -> Tuple[np.ndarray, np.ndarray, bool]:
+    """(x, y, es_transmitancia) de un CSV de dos columnas; la cabecera es opcional."""
+    raw = Path(source).read_bytes() if isinstance(source, (str, Path)) else bytes(source)
+    first = raw.decode("utf-8", errors="replace").splitlines()[0] if raw else ""
+    sep = sniff_delimiter(first)
+    df = pd.read_csv(io.BytesIO(raw), sep=sep, header=None, usecols=[0, 1], dtype=str,
+                     engine="c", skip_blank_lines=True)
+    values = df.apply(lambda col: pd.to_numeric(col.str.strip().str.replace(",", ".", regex=False),
+                                                errors="coerce")).to_numpy(dtype=np.float64)
+    values = values[np.isfinite(values).all(axis=1)]
+    if len(values) < 2:
+        raise ValueError("Expected two numeric columns (wavenumber, Y)")
+    header = first.lower()
+    transmittance = "trans" in header or ("abs" not in header and float(np.median(values[:, 1])) > 1.0)
+    return values[:, 0], values[:, 1], transmittance
+
+
+def read_reference(source: Source, filename: str) -> Tuple[str, np.ndarray, np.ndarray, bool]:
+    """(nombre, x, y, es_transmitancia) según la extensión del fichero."""
+    stem, suffix = Path(filename).stem, Path(filename).suffix.lower()
+    if suffix in (".jdx", ".dx", ".jcamp"):
+        title, x, y, transmittance = read_jcamp(source)
+        return title or stem, x, y, transmittance
+    x, y, transmittance = read_reference_csv(source)
+    return stem, x, y, transmittance
+
+
+# ---------------------------------------------------------------------------
+# Remuestreo y normalización
+# ---------------------------------------------------------------------------
+def resample(x: np.ndarray, values: np.ndarray, grid: np.ndarray = LIBRARY_GRID) -> np.ndarray:
+    """
+    Espectro(s) (`values`: (n_x,) o (n_espectros × n_x)) interpolados en `grid`;
+    fuera del rango de `x`, 0 (sin absorción). Pesos calculados una sola vez.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    order = np.argsort(x, kind="stable")
+    x, values = x[order], values[..., order]
+    j = np.clip(np.searchsorted(x, grid) - 1, 0, len(x) - 2)
+    span = x[j + 1] - x[j]
+    w = np.where(span > 0, (grid - x[j]) / np.where(span > 0, span, 1.0), 0.0)
+    out = values[..., j] * (1.0 - w) + values[..., j + 1] * w
+    inside = (grid >= x[0]) & (grid <= x[-1])
+    return np.where(inside, np.nan_to_num(out), 0.0)
+
+
+def _normalise(rows: np.ndarray, metric: str) -> np.ndarray:
+    """Filas de norma 1 (centradas antes si la métrica es la correlación)."""
+    rows = np.asarray(rows, dtype=np.float32)
+    if metric == "correlation":
+        rows = rows - rows.mean(axis=-1, keepdims=True)
+    norm = np.linalg.norm(rows, axis=-1, keepdims=True)
+    return np.divide(rows, norm, out=np.zeros_like(rows), where=norm > 0)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Índices de los k mayores (ordenados) a lo largo del último eje."""
+    k = min(k, scores.shape[-1])
+    part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1)
+    return np.take_along_axis(part, order, axis=-1)
+
+
+class SpectralLibrary:
+    """
+    Referencias en LIBRARY_GRID: nombres + matrices normalizadas por métrica
+    (+ índice PCA). `keys` identifica el fichero de cada fila (nombre, tamaño,
+    mtime) para reutilizarla al recompilar.
+    """
+
+    __slots__ = ("names", "keys", "grid", "matrices", "pca", "signature")
+
+    def __init__(self, names: Sequence[str], grid: np.ndarray, absorbance: np.ndarray,
+                 keys: Sequence[str] = (), signature: str = "") -> None:
+        absorbance = np.asarray(absorbance, dtype=np.float32).reshape(len(names), len(grid))
+        self._set(names, keys, grid, {metric: _normalise(absorbance, metric) for metric in METRICS}, signature)
+
+    def _set(self, names, keys, grid, matrices, signature) -> None:
+        self.names = list(names)
+        self.keys = list(keys) or [""] * len(self.names)
+        self.grid = grid
+        self.matrices = matrices
+        self.pca = {}
+        self.signature = signature
+
+    @classmethod
+    def from_matrices(cls, names, keys, grid, matrices, signature: str = "") -> "SpectralLibrary":
+        """Biblioteca a partir de filas ya normalizadas (compiladas)."""
+        lib = cls.__new__(cls)
+        lib._set(names, keys, grid, matrices, signature)
+        return lib
+
+    @property
+    def n_refs(self) -> int:
+        return len(self.names)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(m.nbytes for m in self.matrices.values()) + sum(b.nbytes + s.nbytes for b, s in self.pca.values())
+
+    def build_pca(self, n_components: int) -> None:
+        """Índice PCA (SVD truncada) de cada matriz: base (n_puntos × c) y puntuaciones (n_refs × c)."""
+        self.pca = {}
+        for metric, matrix in self.matrices.items():
+            if len(matrix) <= n_components:
+                continue
+            _, _, vt = np.linalg.svd(matrix, full_matrices=False)
+            basis = np.ascontiguousarray(vt[:n_components].T)
+            self.pca[metric] = (basis, matrix @ basis)
+
+    def _queries(self, x, values, transmittance: bool, metric: str) -> np.ndarray:
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        return _normalise(resample(x, to_absorbance(values, transmittance), self.grid), metric)
+
+    def search(self, x, y, k: int = DEFAULT_TOP_K, metric: str = "correlation",
+               transmittance: bool = True) -> List[Tuple[str, float]]:
+        """Top-k [(nombre, puntuación)] de un espectro (x en cm⁻¹)."""
+        if not self.n_refs:
+            return []
+        q = self._queries(x, y, transmittance, metric)
+        matrix = self.matrices[metric]
+        if metric in self.pca and self.n_refs > PCA_CANDIDATES:
+            basis, scores = self.pca[metric]
+            candidates = _top_k(scores @ (q @ basis), PCA_CANDIDATES)
+            exact = matrix[candidates] @ q
+            best = candidates[_top_k(exact, k)]
+            return [(self.names[i], float(s)) for i, s in zip(best, matrix[best] @ q)]
+        scores = matrix @ q
+        best = _top_k(scores, k)
+        return [(self.names[i], float(scores[i])) for i in best]
+
+    def search_many(self, x, values, k: int = 1, metric: str = "correlation",
+                    transmittance: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """(índices, puntuaciones) top-k de cada fila de `values`: matrices (n_espectros × k)."""
+        values = np.atleast_2d(values)
+        k = min(k, self.n_refs)
+        idx = np.zeros((len(values), k), dtype=np.intp)
+        scores = np.zeros((len(values), k), dtype=np.float32)
+        if not self.n_refs:
+            return idx, scores
+        matrix = self.matrices[metric]
+        for start in range(0, len(values), BATCH_ROWS):
+            q = self._queries(x, values[start:start + BATCH_ROWS], transmittance, metric)
+            block = q @ matrix.T
+            top = _top_k(block, k)
+            idx[start:start + len(q)] = top
+            scores[start:start + len(q)] = np.take_along_axis(block, top, axis=1)
+        return idx, scores
+
+    # ---- persistencia ----
+    def save(self, path: Path) -> None:
+        """Guarda la matriz compilada (escritura atómica: tmp + replace)."""
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(tmp, names=np.asarray(self.names, dtype=str), keys=np.asarray(self.keys, dtype=str), grid=self.grid,
+                 correlation=self.matrices["correlation"], cosine=self.matrices["cosine"],
+                 signature=np.asarray(self.signature))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "SpectralLibrary":
+        with np.load(path, allow_pickle=False) as data:
+            return cls.from_matrices(data["names"].tolist(), data["keys"].tolist(), data["grid"],
+                                     {metric: data[metric] for metric in METRICS}, str(data["signature"]))
+
+
+# ---------------------------------------------------------------------------
+# Biblioteca en disco
+# ---------------------------------------------------------------------------
+_LOCK = threading.Lock()
+_CURRENT: Optional[SpectralLibrary] = None
+_CURRENT_KEY: Optional[Tuple[str, int]] = None
+
+
+def library_files(directory: Path = LIBRARY_DIR) -> List[Path]:
+    if not directory.is_dir():
+        return []
+    return sorted(p for p in directory.iterdir() if p.suffix.lower() in LIBRARY_EXTENSIONS and p.is_file())
+
+
+def _file_key(path: Path) -> str:
+    st = path.stat()
+    return f"{path.name}|{st.st_size}|{st.st_mtime_ns}"
+
+
+def _signature(keys: Sequence[str]) -> str:
+    return hashlib.sha1("\n".join(keys).encode()).hexdigest()
+
+
+def load_library(directory: Path = LIBRARY_DIR) -> SpectralLibrary:
+    """
+    Biblioteca de `directory`. Sólo se vuelve a leer si cambia el directorio
+    (mtime); sólo se re-parsean los ficheros si cambia su firma (nombres,
+    tamaños, mtimes) respecto a la matriz compilada guardada.
+    """
+    global _CURRENT, _CURRENT_KEY
+    directory = Path(directory)
+    key = (str(directory), directory.stat().st_mtime_ns if directory.is_dir() else 0)
+    with _LOCK:
+        if _CURRENT is not None and _CURRENT_KEY == key:
+            return _CURRENT
+        files = library_files(directory)
+        keys = [_file_key(p) for p in files]
+        signature = _signature(keys)
+        compiled = directory / COMPILED_NAME
+        previous = None
+        if compiled.exists():
+            try:
+                previous = SpectralLibrary.load(compiled)
+            except (OSError, ValueError, KeyError):
+                previous = None
+        if previous is not None and previous.signature == signature and np.array_equal(previous.grid, LIBRARY_GRID):
+            lib = previous
+        else:
+            reuse = {}
+            if previous is not None and np.array_equal(previous.grid, LIBRARY_GRID):
+                reuse = {key: i for i, key in enumerate(previous.keys)}
+            names, row_keys, rows = [], [], {metric: [] for metric in METRICS}
+            for path, key in zip(files, keys):
+                if key in reuse:
+                    i = reuse[key]
+                    name = previous.names[i]
+                    for metric in METRICS:
+                        rows[metric].append(previous.matrices[metric][i])
+                else:
+                    try:
+                        name, x, y, transmittance = read_reference(path, path.name)
+                    except (ValueError, OSError) as e:
+                        _log.warning("Skipping reference %s: %s", path.name, e)
+                        continue
+                    absorbance = resample(x, to_absorbance(y, transmittance))
+                    for metric in METRICS:
+                        rows[metric].append(_normalise(absorbance, metric))
+                names.append(name)
+                row_keys.append(key)
+            matrices = {metric: np.asarray(rows[metric], dtype=np.float32).reshape(-1, len(LIBRARY_GRID))
+                        for metric in METRICS}
+            lib = SpectralLibrary.from_matrices(names, row_keys, LIBRARY_GRID, matrices, signature)
+            if files:
+                try:
+                    lib.save(compiled)
+                except OSError as e:
+                    _log.warning("Could not save compiled library: %s", e)
+        if PCA_COMPONENTS:
+            lib.build_pca(PCA_COMPONENTS)
+        _CURRENT, _CURRENT_KEY = lib, (str(directory), directory.stat().st_mtime_ns if directory.is_dir() else 0)
+        return lib
+
+
+def add_reference(raw: bytes, filename: str, directory: Path = LIBRARY_DIR) -> str:
+    """Valida y guarda un fichero de referencia en la biblioteca; devuelve su nombre."""
+    name, _, _, _ = read_reference(raw, filename)
+    target = Path(filename).name
+    if Path(target).suffix.lower() not in LIBRARY_EXTENSIONS:
+        raise ValueError(f"Unsupported reference format: {filename}")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / target).write_bytes(raw)
+    return name
@@ -0,0 +1,190 @@
+# engine/preprocessing.py
+# -----------------------------------------------------------------------------
+# Preprocesado del cubo FTIR completo (todas las operaciones sobre la matriz,
+# sin bucles por espectro):
+# - Transmitancia → absorbancia: A = -log10(T) (T en % o en fracción).
+# - Resta del fondo: media de los primeros barridos (en absorbancia se resta;
+#   en transmitancia se divide: T / T_fondo · 100).
+# - Línea base:
+#   · 'als': mínimos cuadrados asimétricos (Eilers). Cada iteración resuelve
+#     (W + λ DᵀD) z = W y, un sistema pentadiagonal simétrico por espectro;
+#     la factorización LDLᵀ se hace a la vez para todos los espectros de un
+#     bloque (bucle sobre los números de onda, vectorizado sobre espectros).
+#   · 'poly': polinomio iterativo (modpoly): una pseudo-inversa común y un
+#     producto de matrices por iteración.
+#   En transmitancia las bandas son valles: la línea base se busca sobre -T
+#   y el resultado queda referido al 100 %.
+# - El cubo resultante se guarda en CUBES con un id derivado del original y
+#   de los parámetros, así que cada combinación se calcula una vez.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import hashlib
+from typing import Optional
+
+import numpy as np
+
+from engine.ftir_cube import CUBES, FtirCube, get_cube
+
+BASELINES = ("none", "als", "poly")
+DEFAULT_BACKGROUND_SCANS = 5
+ALS_LAMBDA = 1e5            # suavidad de la línea base
+ALS_P = 0.01                # peso de los puntos por encima de la línea base
+ALS_MAX_ITER = 10
+POLY_ORDER = 3
+POLY_ITER = 20
+BLOCK_SPECTRA = 2048        # espectros por bloque (acota la memoria de la factorización)
+MIN_TRANSMITTANCE = 1e-4    # evita log(0)
+
+
+def to_absorbance(y: np.ndarray, transmittance: bool = True) -> np.ndarray:
+    """Y → absorbancia (-log10 T). La transmitancia puede venir en % o en fracción."""
+    y = np.asarray(y, dtype=np.float64)
+    if not transmittance:
+        return y
+    scale = 100.0 if np.nanmax(y) > 1.5 else 1.0
+    return -np.log10(np.clip(y / scale, MIN_TRANSMITTANCE, None))
+
+
+def _second_difference_gram(n: int):
+    """Diagonales de DᵀD (D = segunda diferencia): principal, +1 y +2."""
+    d0 = np.zeros(n)
+    d0[:-2] += 1.0
+    d0[1:-1] += 4.0
+    d0[2:] += 1.0
+    d1 = np.zeros(n - 1)
+    d1[:-1] -= 2.0
+    d1[1:] -= 2.0
+    return d0, d1, np.ones(n - 2)
+
+
+def solve_pentadiagonal(diag: np.ndarray, off1: np.ndarray, off2: np.ndarray, rhs: np.ndarray) -> np.ndarray:
+    """
+    Resuelve muchos sistemas pentadiagonales simétricos a la vez (LDLᵀ).
+    diag, rhs: (n, m) — una columna por sistema; off1 (n-1,) y off2 (n-2,)
+    comunes a todos. El bucle recorre las n filas; cada paso opera sobre los
+    m sistemas.
+    """
+    n = diag.shape[0]
+    d = diag.copy()
+    z = rhs.copy()
+    l1 = np.zeros_like(d)
+    l2 = np.zeros_like(d)
+    tmp = np.empty_like(d[0])
+    if n > 1:
+        np.divide(off1[0], d[0], out=l1[1])
+        d[1] -= l1[1] * l1[1] * d[0]
+        z[1] -= l1[1] * z[0]
+    for i in range(2, n):
+        a, b = l2[i], l1[i]
+        np.divide(off2[i - 2], d[i - 2], out=a)
+        np.multiply(a, l1[i - 1], out=tmp)
+        tmp *= d[i - 2]
+        np.subtract(off1[i - 1], tmp, out=b)
+        b /= d[i - 1]
+        di, zi = d[i], z[i]
+        np.multiply(b, b, out=tmp)
+        tmp *= d[i - 1]
+        di -= tmp
+        np.multiply(a, a, out=tmp)
+        tmp *= d[i - 2]
+        di -= tmp
+        np.multiply(b, z[i - 1], out=tmp)
+        zi -= tmp
+        np.multiply(a, z[i - 2], out=tmp)
+        zi -= tmp
+    z /= d
+    if n > 1:
+        z[n - 2] -= l1[n - 1] * z[n - 1]
+    for i in range(n - 3, -1, -1):
+        zi = z[i]
+        np.multiply(l1[i + 1], z[i + 1], out=tmp)
+        zi -= tmp
+        np.multiply(l2[i + 2], z[i + 2], out=tmp)
+        zi -= tmp
+    return z
+
+
+def als_baseline(values: np.ndarray, lam: float = ALS_LAMBDA, p: float = ALS_P,
+                 max_iter: int = ALS_MAX_ITER) -> np.ndarray:
+    """Línea base ALS de cada fila de `values` (n_espectros × n_puntos), por debajo de los picos."""
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    m, n = values.shape
+    if n < 3:
+        return values.copy()
+    d0, d1, d2 = _second_difference_gram(n)
+    off1, off2 = lam * d1, lam * d2
+    out = np.empty_like(values)
+    for start in range(0, m, BLOCK_SPECTRA):
+        y = np.ascontiguousarray(values[start:start + BLOCK_SPECTRA].T)    # (n, bloque)
+        w = np.ones_like(y)
+        for _ in range(max_iter):
+            z = solve_pentadiagonal(w + lam * d0[:, None], off1, off2, w * y)
+            new_w = np.where(y > z, p, 1.0 - p)
+            if np.array_equal(new_w, w):
+                break
+            w = new_w
+        out[start:start + BLOCK_SPECTRA] = z.T
+    return out
+
+
+def poly_baseline(values: np.ndarray, x: np.ndarray, order: int = POLY_ORDER, n_iter: int = POLY_ITER) -> np.ndarray:
+    """
+    Línea base polinómica iterativa (modpoly) de cada fila, con una pseudo-inversa
+    común. Con n_iter ≤ 1 es el ajuste por mínimos cuadrados sin iterar.
+    """
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    x = np.asarray(x, dtype=np.float64)
+    span = float(x.max() - x.min()) or 1.0
+    vander = np.vander(2.0 * (x - x.min()) / span - 1.0, order + 1)      # x en [-1, 1]
+    project = np.linalg.pinv(vander).T                                    # (n × k)
+    current = values
+    fit = (current @ project) @ vander.T
+    for _ in range(n_iter - 1):
+        current = np.minimum(current, fit)
+        fit = (current @ project) @ vander.T
+    return fit
+
+
+def preprocessing_id(cube_id: str, absorbance: bool, background_scans: int, baseline: str) -> str:
+    """Id del cubo preprocesado: el del original + huella de los parámetros."""
+    params = f"{bool(absorbance)}|{int(background_scans)}|{baseline}|{ALS_LAMBDA}|{ALS_P}|{POLY_ORDER}"
+    return f"{cube_id}-pp-{hashlib.sha1(params.encode()).hexdigest()[:12]}"
+
+
+def preprocess_cube(cube: FtirCube, absorbance: bool = False, background_scans: int = 0,
+                    baseline: str = "none") -> FtirCube:
+    """
+    Cubo con el preprocesado pedido (el original si no se pide nada). Se
+    memoriza en CUBES por (cubo, parámetros).
+    """
+    if baseline not in BASELINES:
+        raise ValueError(f"Unknown baseline: {baseline}")
+    if not absorbance and not background_scans and baseline == "none":
+        return cube
+    cube_id = preprocessing_id(cube.cube_id, absorbance, background_scans, baseline)
+    cached: Optional[FtirCube] = get_cube(cube_id)
+    if cached is not None:
+        return cached
+
+    values = np.asarray(cube.intensities, dtype=np.float64)
+    transmittance = not absorbance
+    if absorbance:
+        values = to_absorbance(values)
+    if background_scans:
+        background = np.nanmean(values[:max(1, min(int(background_scans), cube.n_spectra))], axis=0)
+        if transmittance:
+            safe = np.where(np.abs(background) > 0, background, np.nan)
+            values = 100.0 * values / safe
+        else:
+            values = values - background
+    if baseline != "none":
+        sign = -1.0 if transmittance else 1.0      # en transmitancia las bandas son valles
+        signal = sign * values
+        base = als_baseline(signal) if baseline == "als" else poly_baseline(signal, cube.wavenumbers)
+        values = sign * (signal - base) + (100.0 if transmittance else 0.0)
+
+    out = FtirCube(cube_id, cube.times, cube.wavenumbers, values.astype(cube.intensities.dtype))
+    CUBES.set(cube_id, out)
+    return out
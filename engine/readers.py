@@ -0,0 +1,154 @@
+# engine/readers.py
+# -----------------------------------------------------------------------------
+# Lectores rápidos de los ficheros del equipo.
+# - FTIR: CSV con ';' y coma decimal. Se parsea en una sola pasada con el
+#   motor C de pandas (decimal=','), con dtypes fijos y sin convertir cada
+#   celda a str. Devuelve directamente un FtirCube.
+# - TG: CSV del equipo (Time, Unsubtracted Weight, ..., columna vacía final).
+#   El separador se detecta sólo con la 1ª línea y se lee con el motor C,
+#   usecols y float64; el motor 'python' (sep=None) queda como último recurso.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import io
+from pathlib import Path
+from typing import IO, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from engine.ftir_cube import FtirCube
+
+Source = Union[bytes, bytearray, str, Path, IO[bytes]]
+
+ENCODINGS = ("utf-8", "ISO-8859-1")
+DELIMITERS = (",", ";", "\t", "|")
+
+
+def _head_lines(source: Source, n: int = 2) -> Tuple[List[str], str]:
+    """Primeras `n` líneas del fichero (decodificadas) y el encoding que funcionó."""
+    if isinstance(source, (bytes, bytearray)):
+        head = bytes(source[: 1 << 20])
+    elif isinstance(source, (str, Path)):
+        with open(source, "rb") as fh:
+            head = fh.read(1 << 20)
+    else:
+        pos = source.tell()
+        head = source.read(1 << 20)
+        source.seek(pos)
+    for enc in ENCODINGS:
+        try:
+            text = head.decode(enc)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:  # pragma: no cover - ISO-8859-1 decodifica cualquier byte
+        raise ValueError("Unknown file encoding")
+    return text.splitlines()[:n], enc
+
+
+def _as_reader_input(source: Source):
+    """bytes → BytesIO; rutas y file-likes se pasan tal cual a pandas."""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return source
+
+
+def _parse_float_tokens(tokens: List[str]) -> np.ndarray:
+    """Tokens de texto (coma o punto decimal) → float64; NaN si no son números."""
+    idx = pd.Index(tokens, dtype=object).astype(str).str.strip().str.replace(",", ".", regex=False)
+    return pd.to_numeric(idx, errors="coerce").to_numpy(dtype=np.float64)
+
+
+def read_ftir_cube(source: Source, cube_id: str, dtype=np.float32, sep: str = ";") -> FtirCube:
+    """
+    Lee el CSV FTIR del equipo y construye el FtirCube:
+      - 1ª columna: números de onda (float64)
+      - resto: un espectro por columna; la cabecera es el tiempo (s)
+    Las columnas sin tiempo válido (p. ej. la vacía del ';' final) no se leen;
+    las filas completamente vacías se descartan.
+    """
+    lines, encoding = _head_lines(source, 2)
+    if not lines:
+        raise ValueError("Empty FTIR file")
+    header = lines[0].rstrip("\r\n").split(sep)
+    times = _parse_float_tokens(header[1:])
+    data_cols = [i + 1 for i in np.flatnonzero(~np.isnan(times))]
+    if not data_cols:
+        raise ValueError("No time columns found in FTIR header")
+
+    # ¿Coma o punto decimal? Se decide con la primera fila de datos
+    first_row = lines[1].split(sep) if len(lines) > 1 else []
+    decimal = "," if any("," in tok for tok in first_row) else "."
+
+    dtypes = {0: np.float64, **{c: dtype for c in data_cols}}
+    df = pd.read_csv(
+        _as_reader_input(source),
+        sep=sep,
+        decimal=decimal,
+        header=None,
+        skiprows=1,
+        usecols=[0] + data_cols,
+        dtype=dtypes,
+        encoding=encoding,
+        engine="c",
+    )
+
+    wavenumbers = df[0].to_numpy()
+    # Bloque homogéneo (n_wavenumbers, n_spectra); su traspuesta ya es (tiempo × onda)
+    values = df.iloc[:, 1:].to_numpy(dtype=dtype)
+    del df
+
+    # Filas vacías (sin nº de onda ni datos) y columnas vacías
+    empty_rows = np.isnan(wavenumbers) & np.all(np.isnan(values), axis=1)
+    if empty_rows.any():
+        wavenumbers, values = wavenumbers[~empty_rows], values[~empty_rows]
+    full_cols = ~np.all(np.isnan(values), axis=0)
+    spectra_times = times[~np.isnan(times)]
+    if not full_cols.all():
+        values, spectra_times = values[:, full_cols], spectra_times[full_cols]
+
+    return FtirCube(cube_id, spectra_times, wavenumbers, values.T)
+
+
+def sniff_delimiter(line: str) -> str:
+    """Separador más frecuente en la línea de cabecera (',' por defecto)."""
+    counts = {d: line.count(d) for d in DELIMITERS}
+    best = max(counts, key=counts.get)
+    return best if counts[best] > 0 else ","
+
+
+def read_tg_table(source: Source) -> pd.DataFrame:
+    """
+    Lee un CSV TG con esquema conocido:
+      - separador detectado en la 1ª línea; coma decimal sólo si el separador es ';'
+      - se omiten las columnas sin nombre (la vacía del separador final)
+      - todas las columnas como float64 con el motor C
+    Si el fichero no encaja (texto en columnas numéricas, filas irregulares…)
+    se recurre a la autodetección del motor 'python' como antes.
+    """
+    lines, encoding = _head_lines(source, 2)
+    if not lines:
+        raise ValueError("Empty TG file")
+    sep = sniff_delimiter(lines[0])
+    header = lines[0].rstrip("\r\n").split(sep)
+    usecols = [i for i, name in enumerate(header) if name.strip()]
+    decimal = "."
+    if sep == ";" and len(lines) > 1 and any("," in tok for tok in lines[1].split(sep)):
+        decimal = ","
+
+    try:
+        return pd.read_csv(
+            _as_reader_input(source),
+            sep=sep,
+            decimal=decimal,
+            usecols=usecols,
+            dtype=np.float64,
+            encoding=encoding,
+            engine="c",
+        )
+    except (ValueError, pd.errors.ParserError):
+        if not isinstance(source, (bytes, bytearray, str, Path)):
+            source.seek(0)
+        return pd.read_csv(_as_reader_input(source), sep=None, engine="python", encoding=encoding)
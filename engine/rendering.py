@@ -0,0 +1,36 @@
+# engine/rendering.py
+# -----------------------------------------------------------------------------
+# Política de renderizado de las trazas de línea.
+# - Por debajo de WEBGL_POINT_THRESHOLD puntos (suma de todas las trazas de
+#   una figura) se usa go.Scatter (SVG: nítido, ideal para exportar).
+# - Por encima, go.Scattergl (WebGL): pan/zoom fluidos con muchos puntos.
+# El estilo (color, grosor, visible, eje Y) es el mismo en ambos tipos, así
+# que la leyenda unificada, los parches de visibilidad y las formas editables
+# (línea roja del EGA, que vive en el layout) no cambian.
+# Umbral configurable: TGFTIR_WEBGL_POINTS (por defecto 50000).
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import os
+from typing import Iterable, Sized
+
+import plotly.graph_objs as go
+
+WEBGL_POINT_THRESHOLD = int(os.getenv("TGFTIR_WEBGL_POINTS", "50000"))
+
+
+def use_webgl(total_points: int, threshold: int | None = None) -> bool:
+    """¿Hay que dibujar con WebGL para este nº total de puntos?"""
+    limit = WEBGL_POINT_THRESHOLD if threshold is None else threshold
+    return total_points > limit
+
+
+def count_points(arrays: Iterable[Sized]) -> int:
+    """Suma de longitudes (una entrada por traza)."""
+    return sum(len(a) for a in arrays)
+
+
+def line_trace(webgl: bool = False, **kwargs):
+    """go.Scatter o go.Scattergl con los mismos argumentos."""
+    return go.Scattergl(**kwargs) if webgl else go.Scatter(**kwargs)
@@ -0,0 +1,109 @@
+# engine/run_store.py
+# -----------------------------------------------------------------------------
+# Registro de ensayos TG en el servidor.
+# - Cada ensayo se parsea UNA vez y se guarda como arrays NumPy (float64).
+# - La clave es un hash del contenido del fichero: el dcc.Store del navegador
+#   sólo guarda {nombre_fichero: run_id} en lugar del DataFrame en JSON.
+# - Expulsión LRU por nº de ensayos y por memoria ocupada.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from engine.backends import TieredCache
+from engine.cache import LRUCache
+
+# Límites por defecto: ~50 ensayos de 20k filas caben con mucha holgura
+MAX_RUNS = 128
+MAX_RUN_BYTES = 512 * 1024 ** 2
+
+
+def content_hash(data: bytes) -> str:
+    """Hash corto y estable del contenido de un fichero (sirve como run_id)."""
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+class TGRun:
+    """
+    Ensayo TG ya parseado: columnas numéricas por nombre.
+
+    Se conserva el nombre original de cada columna (p. ej. 'Sample Temperature')
+    para que las gráficas sigan eligiendo ejes por nombre como antes.
+    """
+
+    __slots__ = ("run_id", "name", "columns")
+
+    def __init__(self, run_id: str, name: str, columns: Dict[str, np.ndarray]) -> None:
+        self.run_id = run_id
+        self.name = name
+        self.columns = columns
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, name: str, run_id: str) -> "TGRun":
+        """Convierte un DataFrame (ya seleccionado) en arrays float64 contiguos."""
+        columns = {
+            str(col): np.ascontiguousarray(pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float))
+            for col in df.columns
+        }
+        return cls(run_id, name, columns)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.columns.values())
+
+    def __contains__(self, col: str) -> bool:
+        return col in self.columns
+
+    def __getitem__(self, col: str) -> np.ndarray:
+        return self.columns[col]
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def column_names(self) -> List[str]:
+        return list(self.columns.keys())
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.columns)
+
+
+class RunRegistry:
+    """
+    Almacén LRU de TGRun indexado por run_id (hash de contenido).
+    Con un backend compartido (ver engine.backends) los runs subidos en un
+    worker se resuelven también en los demás.
+    """
+
+    def __init__(self, max_runs: int = MAX_RUNS, max_bytes: int = MAX_RUN_BYTES) -> None:
+        self._cache = TieredCache("run", LRUCache(max_entries=max_runs, max_bytes=max_bytes))
+
+    def put(self, run: TGRun) -> str:
+        self._cache.set(run.run_id, run)
+        return run.run_id
+
+    def get(self, run_id: Optional[str]) -> Optional[TGRun]:
+        if not run_id:
+            return None
+        return self._cache.get(run_id)
+
+    def get_many(self, run_ids: Iterable[str]) -> List[Optional[TGRun]]:
+        return [self.get(r) for r in run_ids]
+
+    def __contains__(self, run_id: str) -> bool:
+        return run_id in self._cache
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._cache.total_bytes
+
+
+# Instancia compartida por todas las páginas
+RUNS = RunRegistry()
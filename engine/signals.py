@@ -0,0 +1,109 @@
+# engine/signals.py
+# -----------------------------------------------------------------------------
+# Señales derivadas de un ensayo TG (compartidas por las dos páginas):
+# - TG normalizada (0–100 %) y DTG por Savitzky–Golay, normalizada 0–100 %.
+# - Se calculan una sola vez por (run_id, columnas, normalización, ventana,
+#   orden) y se memorizan en una LRU; mover el marcador o cambiar la
+#   visibilidad ya no recalcula nada.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+from scipy.signal import savgol_filter
+
+from engine.backends import TieredCache
+from engine.cache import LRUCache
+from engine.run_store import TGRun
+
+# Parámetros por defecto del filtro (los que usaban ambas páginas)
+DEFAULT_WINDOW = 21
+DEFAULT_POLYORDER = 2
+
+
+def calc_smooth_derivative(
+    x: np.ndarray, y: np.ndarray, window_length: int = DEFAULT_WINDOW, polyorder: int = DEFAULT_POLYORDER
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Suaviza y deriva con Savitzky–Golay asegurando ventana válida e impar."""
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float)
+    n = len(y)
+    if n < 3:
+        # seguridad: sin puntos suficientes, devuelve ceros
+        return y.copy(), np.zeros_like(y)
+    window_length = min(window_length, n if n % 2 else n - 1)
+    window_length = max(3, window_length)
+    if window_length % 2 == 0:
+        window_length += 1
+    polyorder = min(polyorder, window_length - 1)
+    y_smooth = savgol_filter(y, window_length, polyorder)
+    delta = float(np.mean(np.diff(x))) if n > 1 else 1.0
+    dy_dx = savgol_filter(y, window_length, polyorder, deriv=1, delta=delta)
+    return y_smooth, dy_dx
+
+
+def normalize_mass(mass: np.ndarray, normalization: str = "endpoints") -> np.ndarray:
+    """
+    Masa → % (100 al inicio, 0 al final).
+      - 'endpoints': usa la primera y la última muestra (página de comparación).
+      - 'range': usa el máximo y el mínimo (página EGA).
+    """
+    mass = np.asarray(mass, dtype=float)
+    if normalization == "range":
+        init_mass, fin_mass = float(np.nanmax(mass)), float(np.nanmin(mass))
+    else:
+        init_mass, fin_mass = float(mass[0]), float(mass[-1])
+    if (init_mass - fin_mass) == 0:
+        return np.zeros_like(mass)
+    return 100.0 * (mass - fin_mass) / (init_mass - fin_mass)
+
+
+def rescale_0_100(values: np.ndarray) -> np.ndarray:
+    """Reescala min–max a 0–100 (ceros si la señal es constante)."""
+    vmin, vmax = np.min(values), np.max(values)
+    if (vmax - vmin) == 0:
+        return np.zeros_like(values)
+    return 100.0 * (values - vmin) / (vmax - vmin)
+
+
+class TGDerived:
+    """Curvas derivadas de un ensayo: eje X, TG normalizada, DTG y DTG 0–100 %."""
+
+    __slots__ = ("x", "norm_mass", "deriv", "deriv_norm")
+
+    def __init__(self, x: np.ndarray, norm_mass: np.ndarray, deriv: np.ndarray, deriv_norm: np.ndarray) -> None:
+        self.x = x
+        self.norm_mass = norm_mass
+        self.deriv = deriv
+        self.deriv_norm = deriv_norm
+
+    @property
+    def nbytes(self) -> int:
+        return self.x.nbytes + self.norm_mass.nbytes + self.deriv.nbytes + self.deriv_norm.nbytes
+
+
+DERIVED = TieredCache("derived", LRUCache(max_entries=512, max_bytes=256 * 1024 ** 2))
+
+
+def tg_dtg(
+    run: TGRun,
+    x_col: str,
+    mass_col: str,
+    normalization: str = "endpoints",
+    window_length: int = DEFAULT_WINDOW,
+    polyorder: int = DEFAULT_POLYORDER,
+) -> TGDerived:
+    """TG normalizada + DTG de un ensayo, memorizada por run_id y parámetros."""
+    key = (run.run_id, x_col, mass_col, normalization, window_length, polyorder)
+    cached = DERIVED.get(key)
+    if cached is not None:
+        return cached
+
+    x = run[x_col]
+    norm_mass = normalize_mass(run[mass_col], normalization)
+    _, deriv = calc_smooth_derivative(x, norm_mass, window_length, polyorder)
+    derived = TGDerived(x, norm_mass, deriv, rescale_0_100(deriv))
+    DERIVED.set(key, derived)
+    return derived
@@ -0,0 +1,191 @@
+# engine/tg_batch.py
+# -----------------------------------------------------------------------------
+# TG/DTG de muchos ensayos a la vez sobre una rejilla común de temperatura.
+# - Cada ensayo (TG normalizada) se remuestrea con np.interp a una rejilla
+#   uniforme compartida → una matriz (n_ensayos × n_puntos). La rejilla se
+#   alinea a múltiplos de GRID_STEP, así que la curva de un ensayo no depende
+#   de qué otros ensayos se comparen con él.
+# - Savitzky–Golay se aplica a la matriz (axis=1), con delta = paso real de
+#   la rejilla: la derivada es correcta aunque la temperatura de muestra no
+#   esté equiespaciada (antes: media de diff(x)).
+# - La ventana se da en muestras originales (21, como antes) y se pasa a
+#   puntos de la rejilla con el paso medio de cada ensayo, así que cada
+#   ensayo se suaviza con la misma anchura en °C que en el cálculo por
+#   ensayo. Las filas con la misma ventana se filtran juntas.
+# - Fuera del rango de temperatura de cada ensayo la fila se rellena con sus
+#   valores extremos para filtrar y luego se enmascara (NaN / mask).
+# - El resultado se memoriza en DERIVED por (ensayos, columnas, parámetros).
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.signal import savgol_filter
+
+from engine.run_store import TGRun
+from engine.signals import DEFAULT_POLYORDER, DEFAULT_WINDOW, DERIVED, normalize_mass
+
+GRID_STEP = 0.1             # °C entre puntos de la rejilla común
+MAX_GRID_POINTS = 20000     # tope de puntos (si se supera, el paso crece)
+
+RunSpec = Tuple[TGRun, str, str]   # (ensayo, columna X, columna de masa)
+
+
+class TGBatch:
+    """
+    Matrices alineadas en `grid` (una fila por ensayo, en el orden pedido):
+    norm_mass (TG 0–100 %), smooth (TG suavizada), deriv (dTG/dT) y
+    deriv_norm (DTG reescalada 0–100 % por fila). `mask` marca los puntos
+    dentro del rango de temperatura de cada ensayo; `residue` es la masa
+    final en % de la inicial (la TG normalizada siempre acaba en 0).
+    `edge` es la mayor media ventana del filtro (puntos de la rejilla).
+    """
+
+    __slots__ = ("grid", "norm_mass", "smooth", "deriv", "deriv_norm", "mask", "residue", "edge")
+    ARRAYS = __slots__[:-1]
+
+    def __init__(self, grid: np.ndarray, norm_mass: np.ndarray, smooth: np.ndarray,
+                 deriv: np.ndarray, deriv_norm: np.ndarray, mask: np.ndarray, residue: np.ndarray,
+                 edge: int = 0) -> None:
+        self.grid = grid
+        self.norm_mass = norm_mass
+        self.smooth = smooth
+        self.deriv = deriv
+        self.deriv_norm = deriv_norm
+        self.mask = mask
+        self.residue = residue
+        self.edge = int(edge)
+
+    @property
+    def n_runs(self) -> int:
+        return self.norm_mass.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def interior(self, edge: Optional[int] = None) -> np.ndarray:
+        """
+        `mask` sin `edge` puntos en cada extremo (zona donde el filtro ve el
+        relleno); por defecto, la media ventana más ancha usada.
+        """
+        edge = self.edge if edge is None else int(edge)
+        inner = self.mask.copy()
+        for k in range(1, edge + 1):
+            inner[:, k:] &= self.mask[:, :-k]
+            inner[:, :-k] &= self.mask[:, k:]
+        return inner
+
+    def take(self, rows: Sequence[int]) -> "TGBatch":
+        """Sub-batch con sólo esas filas (misma rejilla)."""
+        return TGBatch(self.grid, *(getattr(self, name)[rows] for name in self.ARRAYS[1:]), edge=self.edge)
+
+    def row(self, i: int, field: str = "deriv_norm") -> Tuple[np.ndarray, np.ndarray]:
+        """(x, y) del ensayo i recortados a su propio rango, listos para dibujar."""
+        keep = self.mask[i]
+        return self.grid[keep], getattr(self, field)[i, keep]
+
+
+def _sorted_xy(run: TGRun, x_col: str, mass_col: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(x, TG %) ordenados por x y sin NaN (np.interp necesita x creciente)."""
+    x = np.asarray(run[x_col], dtype=np.float64)
+    y = normalize_mass(run[mass_col], "endpoints")
+    ok = np.isfinite(x) & np.isfinite(y)
+    x, y = x[ok], y[ok]
+    order = np.argsort(x, kind="stable")
+    return x[order], y[order]
+
+
+def _residue(run: TGRun, mass_col: str) -> float:
+    """Masa final en % de la inicial (mismos extremos que la normalización)."""
+    mass = np.asarray(run[mass_col], dtype=np.float64)
+    return float(100.0 * mass[-1] / mass[0]) if len(mass) and mass[0] else np.nan
+
+
+def _mean_step(x: np.ndarray) -> float:
+    """Paso medio entre muestras (°C); 0 si hay menos de dos."""
+    return float(x[-1] - x[0]) / (len(x) - 1) if len(x) > 1 else 0.0
+
+
+def _odd_window(window: int, n: int, polyorder: int) -> int:
+    """Ventana impar, > polyorder y no mayor que la señal."""
+    window = max(int(window), polyorder + 2)
+    window += 1 - window % 2
+    limit = n if n % 2 else n - 1
+    return min(window, limit)
+
+
+def common_grid(curves: Sequence[Tuple[np.ndarray, np.ndarray]], step: float = GRID_STEP,
+                max_points: int = MAX_GRID_POINTS, margin: int = 0) -> np.ndarray:
+    """Rejilla uniforme (múltiplos de `step`) que cubre todos los ensayos, + `margin` puntos por lado."""
+    lo = min(float(x[0]) for x, _ in curves)
+    hi = max(float(x[-1]) for x, _ in curves)
+    while (hi - lo) / step + 1 + 2 * margin > max_points:
+        step *= 2
+    start, stop = np.floor(lo / step) - margin, np.ceil(hi / step) + margin
+    return np.arange(start, stop + 1) * step
+
+
+def batch_tg_dtg(specs: Sequence[RunSpec], window_length: int = DEFAULT_WINDOW,
+                 polyorder: int = DEFAULT_POLYORDER, step: float = GRID_STEP) -> Optional[TGBatch]:
+    """
+    TG/DTG de todos los ensayos `specs` en una sola pasada vectorizada.
+    `window_length` está en muestras originales de cada ensayo (se convierte
+    a puntos de la rejilla con su paso medio). Devuelve None si no hay
+    ningún ensayo con datos.
+    """
+    # "window:samples": ventana en muestras originales (las entradas antiguas en
+    # un backend compartido no traen `edge` y no deben reutilizarse)
+    key = ("batch", "window:samples", tuple((run.run_id, x_col, mass_col) for run, x_col, mass_col in specs),
+           window_length, polyorder, step)
+    cached = DERIVED.get(key)
+    if cached is not None:
+        return cached
+
+    curves = [_sorted_xy(run, x_col, mass_col) for run, x_col, mass_col in specs]
+    if not curves or not any(len(x) for x, _ in curves):
+        return None
+    valid = [c for c in curves if len(c[0])]
+    # anchura de la ventana en °C de cada ensayo: window_length × su paso medio
+    widths = np.array([window_length * _mean_step(x) for x, _ in curves])
+    # margen de media ventana: los bordes de todos los ensayos se filtran igual
+    # (relleno constante), estén o no en el extremo de la rejilla
+    grid = common_grid(valid, step, margin=int(np.ceil(widths.max() / step / 2)))
+    n_grid = len(grid)
+
+    values = np.empty((len(curves), n_grid))
+    mask = np.zeros((len(curves), n_grid), dtype=bool)
+    for i, (x, y) in enumerate(curves):
+        if not len(x):
+            values[i] = 0.0
+            continue
+        values[i] = np.interp(grid, x, y)          # fuera de rango: valores extremos
+        mask[i] = (grid >= x[0]) & (grid <= x[-1])
+
+    dx = float(grid[1] - grid[0]) if n_grid > 1 else 1.0
+    edge = 0
+    if n_grid < 3:
+        smooth, deriv = values.copy(), np.zeros_like(values)
+    else:
+        windows = np.array([_odd_window(int(round(w / dx)), n_grid, polyorder) for w in widths])
+        smooth, deriv = np.empty_like(values), np.empty_like(values)
+        for window in np.unique(windows):
+            rows = windows == window
+            order = min(polyorder, int(window) - 1)
+            smooth[rows] = savgol_filter(values[rows], int(window), order, axis=1)
+            deriv[rows] = savgol_filter(values[rows], int(window), order, deriv=1, delta=dx, axis=1)
+        edge = int(windows.max()) // 2
+
+    masked = np.where(mask, deriv, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dmin = np.nanmin(np.where(mask.any(axis=1, keepdims=True), masked, 0.0), axis=1, keepdims=True)
+        dmax = np.nanmax(np.where(mask.any(axis=1, keepdims=True), masked, 0.0), axis=1, keepdims=True)
+        span = dmax - dmin
+        deriv_norm = np.where(span > 0, 100.0 * (deriv - dmin) / np.where(span > 0, span, 1.0), 0.0)
+
+    residue = np.array([_residue(run, mass_col) for run, _, mass_col in specs])
+    batch = TGBatch(grid, values, smooth, deriv, deriv_norm, mask, residue, edge)
+    DERIVED.set(key, batch)
+    return batch
@@ -0,0 +1,114 @@
+# engine/tiles.py
+# -----------------------------------------------------------------------------
+# Vista completa del cubo FTIR (mapa tiempo × número de onda) sin enviarlo:
+# - El visor (rango de tiempo y de número de onda, + margen) se parte en
+#   ~una pantalla de teselas (MAP_TILES) y cada tesela se reduce a un valor.
+# - Reducción que conserva extremos: de cada tesela se envía su mínimo o su
+#   máximo, el que más se aleje de la media de la tesela. Así una banda
+#   estrecha (un valle en transmitancia) no desaparece al promediar.
+# - min/max/suma por tesela con reduceat a lo largo de cada eje (dos pasadas
+#   vectorizadas, sin bucles por tesela).
+# - Al hacer zoom se vuelve a agregar sólo lo visible: la resolución crece
+#   hasta llegar a los datos originales (teselas de 1×1).
+# Se supone el número de onda monótono (como en los ficheros del equipo).
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from engine.backends import TieredCache
+from engine.cache import LRUCache
+from engine.decimation import PLOT_DTYPE, VIEWPORT_PAD
+from engine.ftir_cube import FtirCube
+
+MAP_TILES = (300, 600)          # (tiempos, números de onda) del mapa de calor: ~720 kB en float32
+SURFACE_TILES = (150, 300)      # la superficie 3-D (WebGL) admite menos vértices
+
+Range = Optional[Sequence[float]]
+
+
+class CubeTiles:
+    """Mapa agregado: centros de tesela (times, wavenumbers) y z (n_times × n_wavenumbers)."""
+
+    __slots__ = ("times", "wavenumbers", "z")
+
+    def __init__(self, times: np.ndarray, wavenumbers: np.ndarray, z: np.ndarray) -> None:
+        self.times = times
+        self.wavenumbers = wavenumbers
+        self.z = z
+
+    @property
+    def nbytes(self) -> int:
+        return self.times.nbytes + self.wavenumbers.nbytes + self.z.nbytes
+
+
+TILES = TieredCache("tiles", LRUCache(max_entries=64, max_bytes=128 * 1024 ** 2))
+
+
+def _span(values: np.ndarray, rng: Range) -> Tuple[int, int]:
+    """[i0, i1) de los valores (monótonos) dentro de `rng` ampliado con VIEWPORT_PAD."""
+    if rng is None:
+        return 0, len(values)
+    lo, hi = sorted(float(v) for v in rng)
+    pad = (hi - lo) * VIEWPORT_PAD
+    idx = np.flatnonzero((values >= lo - pad) & (values <= hi + pad))
+    if not len(idx):
+        return 0, 0
+    return int(idx[0]), int(idx[-1]) + 1
+
+
+def _edges(n: int, n_tiles: int) -> np.ndarray:
+    """Inicio de cada tesela (≤ n_tiles teselas casi iguales sobre n elementos)."""
+    return np.unique(np.linspace(0, n, min(n, n_tiles) + 1).astype(np.intp)[:-1])
+
+
+def extreme_tiles(values: np.ndarray, row_edges: np.ndarray, col_edges: np.ndarray) -> np.ndarray:
+    """Por tesela: el mínimo o el máximo, el más alejado de la media de la tesela (NaN se ignoran)."""
+    finite = np.isfinite(values)
+    lo = np.fmin.reduceat(np.fmin.reduceat(values, row_edges, axis=0), col_edges, axis=1)
+    hi = np.fmax.reduceat(np.fmax.reduceat(values, row_edges, axis=0), col_edges, axis=1)
+    total = np.add.reduceat(np.add.reduceat(np.where(finite, values, 0.0), row_edges, axis=0, dtype=np.float64),
+                            col_edges, axis=1)
+    count = np.add.reduceat(np.add.reduceat(finite, row_edges, axis=0, dtype=np.int64), col_edges, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+    return np.where(hi - mean >= mean - lo, hi, lo)
+
+
+def _centers(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    counts = np.diff(np.append(edges, len(values)))
+    return np.add.reduceat(values, edges) / counts
+
+
+def cube_tiles(cube: FtirCube, time_range: Range = None, wn_range: Range = None,
+               shape: Tuple[int, int] = MAP_TILES) -> Optional[CubeTiles]:
+    """
+    Mapa del cubo dentro del visor (`time_range` en s, `wn_range` en cm⁻¹;
+    None = todo), agregado a lo sumo a `shape` teselas. None si el visor
+    no contiene datos.
+    """
+    key = (cube.cube_id,
+           None if time_range is None else tuple(round(float(v), 3) for v in time_range),
+           None if wn_range is None else tuple(round(float(v), 3) for v in wn_range),
+           tuple(shape))
+    cached = TILES.get(key)
+    if cached is not None:
+        return cached
+
+    t0, t1 = _span(cube.times, time_range)
+    w0, w1 = _span(cube.wavenumbers, wn_range)
+    if t1 <= t0 or w1 <= w0:
+        return None
+    block = cube.intensities[t0:t1, w0:w1]
+    row_edges = _edges(t1 - t0, shape[0])
+    col_edges = _edges(w1 - w0, shape[1])
+    tiles = CubeTiles(
+        _centers(cube.times[t0:t1], row_edges),
+        _centers(cube.wavenumbers[w0:w1], col_edges),
+        extreme_tiles(block, row_edges, col_edges).astype(PLOT_DTYPE),
+    )
+    TILES.set(key, tiles)
+    return tiles
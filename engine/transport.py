@@ -0,0 +1,172 @@
+# engine/transport.py
+# -----------------------------------------------------------------------------
+# Codificación compacta de arrays para enviarlos al navegador.
+# - b64_array: array numpy → base64 (little-endian) para dcc.Store.
+# - typed_array / decode_array: formato {"dtype", "bdata"} de Plotly ≥ 6, que
+#   plotly.js consume tal cual (figuras, Patch y Stores); float32 por defecto.
+# - register_payload_report: tamaño y tiempo de la respuesta de cada callback
+#   (log 'tgftir.payload' + GET api/payload-report).
+# - encode_cube_payload: cubo FTIR completo para el modo "scrub" en cliente
+#   (assets/ftir_scrub.js). Cada número de onda se cuantiza a int16 con su
+#   propio offset/escala, se codifica en deltas a lo largo del tiempo (los
+#   espectros consecutivos se parecen → deltas pequeños) y se comprime con
+#   zlib; el navegador lo descomprime con DecompressionStream('deflate').
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import base64
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+import numpy as np
+from flask import g, jsonify, request
+
+from engine.ftir_cube import FtirCube
+
+# Tamaño máximo del cubo decodificado (float32) para el modo en cliente
+CLIENT_CUBE_MAX_BYTES = int(float(os.getenv("TGFTIR_CLIENT_CUBE_MB", "64")) * 1024 ** 2)
+
+QUANT_LEVELS = 32767        # q ∈ [-32767, 32767]
+QUANT_NAN = -32768          # valor reservado para NaN
+
+
+def b64_array(values: np.ndarray, dtype: str = "<f8") -> str:
+    """Array → base64 de sus bytes con el dtype (little-endian) indicado."""
+    return base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode("ascii")
+
+
+def typed_array(values, dtype: str = "f4") -> Dict[str, str]:
+    """
+    Array → {"dtype", "bdata"} (typed array de Plotly; 'f4' salvo que haga falta
+    más precisión). Las matrices (z de un heatmap) llevan además "shape".
+    """
+    spec = {"dtype": dtype, "bdata": b64_array(values, "<" + dtype)}
+    shape = np.shape(values)
+    if len(shape) > 1:
+        spec["shape"] = ", ".join(str(n) for n in shape)
+    return spec
+
+
+def decode_array(value) -> np.ndarray:
+    """Inversa de typed_array; acepta también listas (figuras antiguas o editadas en cliente)."""
+    if value is None:
+        return np.empty(0)
+    if isinstance(value, dict) and "bdata" in value:
+        out = np.frombuffer(base64.b64decode(value["bdata"]), dtype="<" + value.get("dtype", "f8").lstrip("<>|"))
+        shape = value.get("shape")
+        if isinstance(shape, str):
+            shape = [int(n) for n in shape.split(",")]
+        return out.reshape(shape) if shape else out
+    return np.asarray(value, dtype=np.float64)
+
+
+def client_cube_nbytes(cube: FtirCube) -> int:
+    """Bytes que ocupa el cubo ya decodificado en el navegador (Float32Array)."""
+    return cube.n_spectra * len(cube.wavenumbers) * 4
+
+
+def encode_cube_payload(cube: FtirCube, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Payload JSON del cubo para el navegador:
+      times / wavenumbers  → float64 en base64
+      offset / scale       → float64 en base64 (uno por número de onda)
+      data                 → int16 delta-codificado a lo largo del tiempo, zlib, base64
+    Decodificado: v[t, j] = offset[j] + scale[j] * q[t, j]  (q = suma acumulada).
+    """
+    values = np.asarray(cube.intensities, dtype=np.float64)
+    finite = np.isfinite(values)
+    with np.errstate(invalid="ignore"):
+        vmin = np.where(finite, values, np.inf).min(axis=0)
+        vmax = np.where(finite, values, -np.inf).max(axis=0)
+    empty = ~np.isfinite(vmin)
+    vmin[empty], vmax[empty] = 0.0, 0.0
+    scale = (vmax - vmin) / (2 * QUANT_LEVELS)
+    scale[scale == 0] = 1.0
+    offset = vmin + QUANT_LEVELS * scale
+
+    q = np.rint((np.where(finite, values, 0.0) - offset) / scale)
+    q = np.clip(q, -QUANT_LEVELS, QUANT_LEVELS).astype("<i2")
+    q[~finite] = QUANT_NAN
+    # deltas en aritmética int16 modular (el navegador la deshace con Int16Array)
+    deltas = q.copy()
+    deltas[1:] -= q[:-1]
+
+    payload = {
+        "cube_id": cube.cube_id,
+        "n_times": int(cube.n_spectra),
+        "n_wavenumbers": int(len(cube.wavenumbers)),
+        "times": b64_array(cube.times),
+        "wavenumbers": b64_array(cube.wavenumbers),
+        "offset": b64_array(offset),
+        "scale": b64_array(scale),
+        "nan_code": QUANT_NAN,
+        "data": base64.b64encode(zlib.compress(deltas.tobytes(), 6)).decode("ascii"),
+    }
+    if extra:
+        payload.update(extra)
+    return payload
+
+
+def decode_cube_payload(payload: Dict[str, Any]) -> np.ndarray:
+    """Inversa de encode_cube_payload (referencia en Python del decodificador JS)."""
+    n_t, n_w = payload["n_times"], payload["n_wavenumbers"]
+    deltas = np.frombuffer(zlib.decompress(base64.b64decode(payload["data"])), dtype="<i2").reshape(n_t, n_w)
+    q = np.cumsum(deltas, axis=0, dtype=np.int16)
+    offset = np.frombuffer(base64.b64decode(payload["offset"]), dtype="<f8")
+    scale = np.frombuffer(base64.b64decode(payload["scale"]), dtype="<f8")
+    out = (offset + scale * q).astype(np.float32)
+    out[q == payload["nan_code"]] = np.nan
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Informe de tamaño de las respuestas de los callbacks
+# ---------------------------------------------------------------------------
+_log = logging.getLogger("tgftir.payload")
+_REPORT: Dict[str, Dict[str, float]] = {}
+_REPORT_LOCK = threading.Lock()
+
+
+def payload_report() -> Dict[str, Dict[str, float]]:
+    """Por callback (outputs): nº de llamadas, bytes totales/máximos/últimos y ms."""
+    with _REPORT_LOCK:
+        return {k: dict(v) for k, v in _REPORT.items()}
+
+
+def register_payload_report(app) -> None:
+    """Mide cada respuesta de /_dash-update-component y la publica en api/payload-report."""
+    server = app.server
+    prefix = app.config.routes_pathname_prefix.rstrip("/")
+    update_path = f"{prefix}/_dash-update-component"
+
+    @server.before_request
+    def _payload_timer():
+        if request.path == update_path:
+            g.tgftir_t0 = time.perf_counter()
+
+    @server.after_request
+    def _payload_size(response):
+        if request.path != update_path or response.direct_passthrough:
+            return response
+        body = request.get_json(silent=True) or {}
+        key = str(body.get("output", "?"))
+        nbytes = len(response.get_data())
+        ms = 1000.0 * (time.perf_counter() - g.get("tgftir_t0", time.perf_counter()))
+        with _REPORT_LOCK:
+            entry = _REPORT.setdefault(key, {"calls": 0, "total_bytes": 0, "max_bytes": 0, "last_bytes": 0, "last_ms": 0.0})
+            entry["calls"] += 1
+            entry["total_bytes"] += nbytes
+            entry["max_bytes"] = max(entry["max_bytes"], nbytes)
+            entry["last_bytes"] = nbytes
+            entry["last_ms"] = round(ms, 1)
+        _log.info("%s: %d bytes in %.1f ms", key, nbytes, ms)
+        return response
+
+    @server.route(f"{prefix}/api/payload-report", methods=["GET"])
+    def payload_report_route():
+        return jsonify(payload_report())
@@ -0,0 +1,155 @@
+# engine/uploads.py
+# -----------------------------------------------------------------------------
+# Subida de ficheros grandes por trozos (chunked / reanudable), fuera de Dash.
+# - El navegador envía el fichero en trozos binarios (sin base64) a una ruta
+#   Flask de app.server; cada trozo se escribe en disco (spool) al vuelo.
+# - Al completar, el fichero se hashea en streaming, se parsea desde disco con
+#   el manejador registrado para su tipo ('kind') y se devuelve SÓLO un id.
+#   No se parsea mientras llegan los trozos: los lectores (CSV con detección de
+#   separador, Excel) necesitan el fichero completo.
+# - Las páginas registran sus manejadores con register_upload_kind().
+#
+# Rutas (relativas a routes_pathname_prefix):
+#   GET  api/uploads/<upload_id>           -> {"received": bytes}   (reanudar)
+#   PUT  api/uploads/<upload_id>?offset=N  -> cuerpo = trozo crudo
+#   POST api/uploads/<upload_id>/complete  -> {"kind", "filename", "size"}
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+from flask import jsonify, request
+
+SPOOL_DIR = Path(os.getenv("TGFTIR_SPOOL_DIR", Path(tempfile.gettempdir()) / "tgftir_uploads"))
+MAX_UPLOAD_BYTES = int(os.getenv("TGFTIR_MAX_UPLOAD_MB", "2048")) * 1024 ** 2
+STALE_SECONDS = 24 * 3600           # trozos abandonados se borran tras un día
+COPY_BLOCK = 1024 ** 2              # bloque de lectura/escritura en streaming
+
+_UPLOAD_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+
+# kind -> handler(path, filename, digest) -> id (run_id / cube_id)
+UploadHandler = Callable[[Path, str, str], str]
+_HANDLERS: Dict[str, UploadHandler] = {}
+
+
+def register_upload_kind(kind: str, handler: UploadHandler) -> None:
+    """Registra el parser de un tipo de fichero (lo llaman las páginas al importarse)."""
+    _HANDLERS[kind] = handler
+
+
+def file_hash(path: Path) -> str:
+    """Mismo hash que engine.run_store.content_hash, pero leyendo en streaming."""
+    h = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(COPY_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+
+def _spool_path(upload_id: str) -> Path:
+    if not _UPLOAD_ID_RE.match(upload_id):
+        raise ValueError("Invalid upload id")
+    return SPOOL_DIR / f"{upload_id}.part"
+
+
+def _cleanup_stale() -> None:
+    """Borra ficheros .part abandonados (subidas nunca completadas)."""
+    now = time.time()
+    for part in SPOOL_DIR.glob("*.part"):
+        try:
+            if now - part.stat().st_mtime > STALE_SECONDS:
+                part.unlink()
+        except OSError:
+            pass
+
+
+def register_upload_routes(app) -> None:
+    """Añade las rutas de subida por trozos al servidor Flask de la app Dash."""
+    server = app.server
+    prefix = app.config.routes_pathname_prefix.rstrip("/")
+    SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+
+    @server.route(f"{prefix}/api/uploads/<upload_id>", methods=["GET"])
+    def upload_status(upload_id: str):
+        try:
+            part = _spool_path(upload_id)
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        return jsonify(received=part.stat().st_size if part.exists() else 0)
+
+    @server.route(f"{prefix}/api/uploads/<upload_id>", methods=["PUT"])
+    def upload_chunk(upload_id: str):
+        try:
+            part = _spool_path(upload_id)
+            offset = int(request.args.get("offset", "0"))
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+
+        received = part.stat().st_size if part.exists() else 0
+        if offset == 0 and received == 0:
+            _cleanup_stale()
+        if offset != received:
+            # el cliente debe reanudar desde lo que ya tenemos
+            return jsonify(error="Offset mismatch", received=received), 409
+        length = request.content_length or 0
+        if received + length > MAX_UPLOAD_BYTES:
+            return jsonify(error="File too large", received=received), 413
+
+        # Sin Content-Length (transfer chunked) el límite se comprueba al escribir
+        written = 0
+        with open(part, "ab") as fh:
+            stream = request.stream
+            while True:
+                block = stream.read(COPY_BLOCK)
+                if not block:
+                    break
+                written += len(block)
+                if received + written > MAX_UPLOAD_BYTES:
+                    fh.truncate(received)   # se descarta el trozo entero
+                    return jsonify(error="File too large", received=received), 413
+                fh.write(block)
+        return jsonify(received=part.stat().st_size)
+
+    @server.route(f"{prefix}/api/uploads/<upload_id>/complete", methods=["POST"])
+    def upload_complete(upload_id: str):
+        meta = request.get_json(silent=True) or {}
+        kind = meta.get("kind")
+        filename = os.path.basename(str(meta.get("filename") or upload_id))
+        try:
+            part = _spool_path(upload_id)
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        handler = _HANDLERS.get(kind)
+        if handler is None:
+            return jsonify(error=f"Unknown upload kind: {kind}"), 400
+        if not part.exists():
+            return jsonify(error="Nothing uploaded"), 404
+        size = part.stat().st_size
+        try:
+            expected = None if meta.get("size") is None else int(meta["size"])
+        except (TypeError, ValueError):
+            return jsonify(error="Invalid size"), 400
+        if expected is not None and expected != size:
+            return jsonify(error="Incomplete upload", received=size), 409
+
+        # Se parsea desde disco con el nombre original (la extensión decide Excel/CSV)
+        named = part.with_name(f"{upload_id}-{filename}")
+        part.rename(named)
+        try:
+            digest = file_hash(named)
+            result_id = handler(named, filename, digest)
+        except Exception as e:  # noqa: BLE001
+            return jsonify(error=f"{filename}: {e}"), 422
+        finally:
+            try:
+                named.unlink()
+            except OSError:
+                pass
+        return jsonify(id=result_id, kind=kind, filename=filename, size=size)
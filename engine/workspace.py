@@ -0,0 +1,75 @@
+# engine/workspace.py
+# -----------------------------------------------------------------------------
+# Espacio de trabajo por sesión (sustituye a los globales tg/gs/ftir).
+# - Cada pestaña del navegador tiene un session_id; su registro guarda sólo
+#   ids pequeños ({'tg': run_id, 'gs': run_id, 'ftir': cube_id, ...}).
+# - Los objetos parseados viven en RUNS / CUBES (TieredCache): LRU local y,
+#   si el backend es compartido (filesystem / diskcache), también en él, de
+#   modo que cualquier worker puede resolver la sesión de otro.
+# - Expulsión: sesiones y objetos expiran por inactividad (idle_ttl del
+#   backend) y por presupuesto de memoria/disco.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from engine.backends import get_backend
+from engine.ftir_cube import CUBES
+from engine.run_store import RUNS
+
+# Tipo de objeto de cada ranura del workspace
+OBJECT_KINDS = {"tg": "run", "gs": "run", "ftir": "cube"}
+
+
+class WorkspaceStore:
+    """session_id → registro de la sesión, sobre un backend intercambiable."""
+
+    def __init__(self, backend) -> None:
+        self.backend = backend
+        self._lock = threading.Lock()
+
+    # ---- registro de la sesión ----
+    def get(self, session_id: Optional[str]) -> Dict[str, Any]:
+        if not session_id:
+            return {}
+        return dict(self.backend.get(("session", session_id)) or {})
+
+    def update(self, session_id: str, **fields: Any) -> Dict[str, Any]:
+        """
+        Fusiona `fields` en el registro. El leer-modificar-escribir se hace con
+        el cerrojo del backend, así que dos workers que actualizan la misma
+        sesión no se pisan los campos.
+        """
+        with self._lock, self.backend.lock(("session", session_id)):
+            record = self.get(session_id)
+            record.update(fields)
+            record["touched"] = time.time()
+            self.backend.set(("session", session_id), record)
+        return record
+
+    def clear(self, session_id: str) -> None:
+        self.backend.delete(("session", session_id))
+
+    # ---- objetos parseados ----
+    def attach(self, session_id: str, slot: str, obj: Any) -> None:
+        """Asocia un objeto (TGRun / FtirCube) a una ranura de la sesión."""
+        kind = OBJECT_KINDS[slot]
+        obj_id = obj.run_id if kind == "run" else obj.cube_id
+        if kind == "run":
+            RUNS.put(obj)
+        else:
+            CUBES.set(obj_id, obj)
+        self.update(session_id, **{slot: obj_id})
+
+    def resolve(self, session_id: Optional[str], slot: str) -> Any:
+        """Objeto de una ranura (None si no hay o ya expiró)."""
+        obj_id = self.get(session_id).get(slot)
+        if not obj_id:
+            return None
+        return RUNS.get(obj_id) if OBJECT_KINDS[slot] == "run" else CUBES.get(obj_id)
+
+
+WORKSPACES = WorkspaceStore(get_backend())
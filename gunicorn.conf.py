@@ -0,0 +1,31 @@
+# gunicorn.conf.py
+# -----------------------------------------------------------------------------
+# Configuración de producción (Linux/macOS):   gunicorn -c gunicorn.conf.py app:server
+# - Varios procesos worker (cada uno con varios hilos) en lugar del servidor
+#   de desarrollo de Flask, de un solo proceso.
+# - preload_app: la app (Dash + páginas) se importa una vez en el master y los
+#   workers la heredan con fork.
+# - Los runs/cubos parseados deben compartirse entre workers: si no se indica
+#   otra cosa se usa el backend 'filesystem' (ver engine/backends.py).
+# Variables: TGFTIR_BIND (0.0.0.0:8050), TGFTIR_WORKERS (nº CPUs, máx. 8),
+#            TGFTIR_THREADS (4), TGFTIR_TIMEOUT (300 s; parseos grandes).
+# -----------------------------------------------------------------------------
+
+import multiprocessing
+import os
+
+# Debe fijarse antes de importar la app (preload_app)
+os.environ.setdefault("TGFTIR_CACHE_BACKEND", "filesystem")
+
+bind = os.getenv("TGFTIR_BIND", "0.0.0.0:8050")
+workers = int(os.getenv("TGFTIR_WORKERS", str(min(multiprocessing.cpu_count(), 8))))
+worker_class = "gthread"
+threads = int(os.getenv("TGFTIR_THREADS", "4"))
+timeout = int(os.getenv("TGFTIR_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+# Reciclar workers de vez en cuando limita la fragmentación de memoria
+max_requests = 1000
+max_requests_jitter = 100
+accesslog = "-"
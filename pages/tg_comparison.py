@@ -3,8 +3,11 @@ from __future__ import annotations
 
 import base64
 import io
+import json
+import os
+import tempfile
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List
 
 import dash
 import dash_bootstrap_components as dbc
@@ -12,9 +15,20 @@ import dash_mantine_components as dmc
 import numpy as np
 import pandas as pd
 import plotly.graph_objs as go
-from dash import Input, Output, State, ctx, dcc, html
+from dash import Input, Output, State, ctx, dash_table, dcc, html
+from dash.dash_table.Format import Format, Scheme
 from dash.exceptions import PreventUpdate
-from scipy.signal import savgol_filter
+
+from engine.backends import get_backend
+from engine.characteristic import characteristic_points
+from engine.decimation import decimate, viewport_from_relayout
+from engine.deconvolution import MAX_PEAKS, fit_many, peak_curves
+from engine.kinetics import heating_rate_from_name, heating_rate_from_program, isoconversional, kissinger
+from engine.readers import read_tg_table
+from engine.rendering import count_points, line_trace, use_webgl
+from engine.run_store import RUNS, TGRun, content_hash
+from engine.uploads import register_upload_kind
+from engine.tg_batch import batch_tg_dtg
 
 dash.register_page(__name__, path="/tg-comparison", name="Thermogravimetric Analysis", order=2)
 dash._dash_renderer._set_react_version('18.2.0')
@@ -36,34 +50,65 @@ WALKTHROUGH_FILES: List[Dict] = [
     },
 ]
 
+# Gráficas con decimado LTTB: cada una guarda su visor (rango X) en un Store
+GRAPH_IDS = ("multi-tg-temp-graph", "multi-tg-dtg-graph", "multi-tg-comparison-graph")
+
 PLOTLY_COLORS = [
     "#636EFA", "#EF553B", "#00CC96", "#AB63FA", "#FFA15A",
     "#19D3F3", "#FF6692", "#B6E880", "#FF97FF", "#FECB52",
 ]
 
 
+def _background_manager():
+    """
+    DiskcacheManager para callbacks en segundo plano (None si faltan
+    diskcache/multiprocess/psutil). Sólo con un backend de caché compartido:
+    el trabajo corre en otro proceso, que tiene que leer los ensayos de RUNS
+    y dejar los ajustes en FITS donde los vea el servidor.
+    """
+    if not get_backend().shared:
+        return None
+    try:
+        import diskcache
+        directory = Path(os.getenv("TGFTIR_CACHE_DIR") or tempfile.gettempdir()) / "tgftir_background"
+        return dash.DiskcacheManager(diskcache.Cache(str(directory)))
+    except ImportError:
+        return None
+
+
+BACKGROUND_MANAGER = _background_manager()
+
+
 # =========================
 # Utils
 # =========================
+def decode_upload_bytes(contents: str) -> bytes:
+    """dcc.Upload.contents → bytes crudos del fichero."""
+    _, content_string = contents.split(",", 1)
+    return base64.b64decode(content_string)
+
+
 def decode_csv_file_content(contents: str) -> io.StringIO:
     """dcc.Upload.contents → CSV StringIO con tolerancia a utf-8 / ISO-8859-1."""
-    _, content_string = contents.split(",", 1)
-    decoded = base64.b64decode(content_string)
+    decoded = decode_upload_bytes(contents)
     try:
         return io.StringIO(decoded.decode("utf-8"))
     except UnicodeDecodeError:
         return io.StringIO(decoded.decode("ISO-8859-1"))
 
 
-def _read_table_like(buf: io.StringIO | bytes | bytearray, filename: str) -> pd.DataFrame:
+def _read_table_like(buf: io.StringIO | bytes | bytearray | Path, filename: str) -> pd.DataFrame:
     """
-    Lee un archivo tipo tabla:
+    Lee un archivo tipo tabla (en memoria o ya en disco, p. ej. subida por trozos):
       - Si el nombre termina en .xls/.xlsx -> intenta leer Excel.
-      - Si no -> CSV con autodetección de separador (',' o ';').
+      - Si no -> CSV del equipo con el lector rápido (separador detectado en la
+        cabecera, motor C); sólo recurre al motor 'python' si hace falta.
     """
     name = (filename or "").lower()
     if name.endswith((".xls", ".xlsx")):
         # Excel: convertir a BytesIO si no lo es
+        if isinstance(buf, Path):
+            return pd.read_excel(buf)
         if isinstance(buf, io.StringIO):
             data = buf.getvalue().encode("utf-8")
             bio: io.BytesIO = io.BytesIO(data)
@@ -74,14 +119,10 @@ def _read_table_like(buf: io.StringIO | bytes | bytearray, filename: str) -> pd.
             bio = io.BytesIO(buf.read())  # type: ignore[attr-defined]
         return pd.read_excel(bio)
 
-    # CSV (usa engine='python' para detectar sep automáticamente)
+    # CSV
     if isinstance(buf, io.StringIO):
-        return pd.read_csv(buf, sep=None, engine="python")
-    # bytes -> decodificar como utf-8/latin
-    try:
-        return pd.read_csv(io.StringIO(buf.decode("utf-8")), sep=None, engine="python")  # type: ignore[arg-type]
-    except Exception:
-        return pd.read_csv(io.StringIO(buf.decode("ISO-8859-1")), sep=None, engine="python")  # type: ignore[arg-type]
+        return read_tg_table(buf.getvalue().encode("utf-8"))
+    return read_tg_table(buf)
 
 
 def _select_tg_columns(df: pd.DataFrame) -> pd.DataFrame:
@@ -89,6 +130,7 @@ def _select_tg_columns(df: pd.DataFrame) -> pd.DataFrame:
     Selecciona columnas TG de forma robusta:
       - Si existen 'Sample Temperature', 'Program Temperature', y 'Mass', las devuelve.
       - Si no, busca por nombres similares.
+      - 'Time' (min) se conserva si existe: da β cuando el nombre no la indica.
       - No renombra columnas, solo selecciona.
     """
     cols = df.columns.str.lower()
@@ -113,23 +155,47 @@ def _select_tg_columns(df: pd.DataFrame) -> pd.DataFrame:
     # Si no encuentra, usa las dos primeras columnas como fallback
     if not selected_cols:
         selected_cols = df.columns[:2]
+    else:
+        # Tiempo (para la velocidad de calentamiento)
+        for i, c in enumerate(cols):
+            if c.strip() == "time":
+                selected_cols.append(df.columns[i])
+                break
 
     return df[selected_cols].copy()
 
 
-def calc_smooth_derivative(
-    x: np.ndarray, y: np.ndarray, window_length: int = 21, polyorder: int = 2
-) -> Tuple[np.ndarray, np.ndarray]:
-    """Suaviza y deriva con Savitzky–Golay asegurando ventana válida e impar."""
-    n = len(y)
-    window_length = max(3, min(window_length, n - 1))
-    if window_length % 2 == 0:
-        window_length -= 1
-    polyorder = min(polyorder, window_length - 1)
-    y_smooth = savgol_filter(y, window_length, polyorder)
-    dx = float(np.mean(np.diff(x))) if n > 1 else 1.0
-    dy_dx = savgol_filter(y, window_length, polyorder, deriv=1, delta=dx)
-    return y_smooth, dy_dx
+def register_tg_run(raw: bytes | Path, filename: str, run_id: str | None = None) -> str:
+    """
+    Parsea un fichero TG y lo guarda en el registro del servidor.
+    Devuelve el run_id (hash del contenido); si ya existía no se vuelve a parsear.
+    Con un Path (subida por trozos) el hash ya viene calculado en `run_id`.
+    """
+    run_id = run_id or content_hash(raw)
+    if run_id in RUNS:
+        return run_id
+    df = _read_table_like(raw, filename)
+    try:
+        df_selected = _select_tg_columns(df)
+    except Exception:
+        # Fallback mínimo: primeras dos columnas
+        df_selected = df.iloc[:, [0, 1]].copy()
+        df_selected.columns = ["X_Value", "Mass"]
+    RUNS.put(TGRun.from_frame(df_selected, filename, run_id))
+    return run_id
+
+
+# Subidas grandes (engine.uploads): el fichero llega a disco y se registra aquí
+register_upload_kind("tg-comparison", lambda path, filename, digest: register_tg_run(path, filename, digest))
+
+
+def find_mass_column(run: TGRun) -> str | None:
+    """Busca la columna de masa por nombre (misma heurística que _select_tg_columns)."""
+    for col in run.column_names():
+        col_lower = col.lower()
+        if "unsubtracted weight" in col_lower or "weight" in col_lower or "mass" in col_lower or "tg" in col_lower:
+            return col
+    return None
 
 
 def sync_vis_dict(data_json: Dict[str, str] | None, vis_dict: Dict[str, bool] | None) -> Dict[str, bool]:
@@ -210,7 +276,10 @@ layout = html.Div(
                 dcc.Store(id="multi-tg-data-store", data={}),
                 dcc.Store(id="show-graph-cards", data=False),
                 dcc.Store(id="tg-legend-visibility", data={}),
+                dcc.Store(id="tg-visibility-applied", data=None),   # salida muda del restyle en cliente
                 dcc.Store(id="walkthrough-data", data=None),  # datos precargados
+                dcc.Store(id="chunked-upload-tg", data=None),  # ids de subidas por trozos
+                *[dcc.Store(id=f"{gid}-viewport", data=None) for gid in GRAPH_IDS],  # rango X visible
 
                 dbc.Card(
                     dbc.CardBody(
@@ -247,10 +316,24 @@ layout = html.Div(
                                         },
                                         multiple=True,
                                     ),
+                                    html.Div(
+                                        [
+                                            dmc.Button(
+                                                "Archivos grandes (subida por trozos)",
+                                                id="chunked-upload-btn-tg",
+                                                leftSection=html.I(className="fa fa-cloud-arrow-up"),
+                                                size="xs",
+                                                variant="subtle",
+                                            ),
+                                            dmc.Progress(id="chunked-upload-progress-tg", value=0, size="sm", style={"flexGrow": 1}),
+                                        ],
+                                        style={"display": "flex", "alignItems": "center", "gap": "12px"},
+                                    ),
                                 ],
                                 style={"display": "flex", "flexDirection": "column", "gap": "8px"},
                             ),
                             html.Div(id="multi-tg-filenames-display", className="mt-3 text-muted"),
+                            html.Div(id="tg-upload-status", className="text-danger"),
                             html.Div(
                                 id="tg-unified-legend",
                                 style={"marginTop": "18px", "display": "flex", "flexWrap": "wrap", "gap": "12px", "justifyContent": "center"},
@@ -263,6 +346,41 @@ layout = html.Div(
 
                 dmc.Divider(variant="solid", m="xl", color="#b0b0b0", size="md"),
                 html.Div(id="graph-cards-container"),
+                html.Div(id="tg-characteristics-container"),
+                html.Div(id="tg-kinetics-container"),
+                dcc.Store(id="tg-deconv-results", data=None),
+                html.Div(
+                    id="tg-deconv-section",
+                    style={"display": "none"},
+                    children=dbc.Card(
+                        dbc.CardBody(
+                            [
+                                html.H5("Peak deconvolution (DTG)", style={"fontWeight": "bold", "color": "#333"}),
+                                html.Div(
+                                    [
+                                        dmc.SegmentedControl(
+                                            id="tg-deconv-model",
+                                            data=[{"label": "Gaussian", "value": "gaussian"},
+                                                  {"label": "Fraser–Suzuki", "value": "fraser_suzuki"}],
+                                            value="fraser_suzuki",
+                                        ),
+                                        dmc.NumberInput(id="tg-deconv-npeaks", value=3, min=1, max=MAX_PEAKS, step=1, w=90),
+                                        dmc.Button("Fit all runs", id="tg-deconv-run", leftSection=html.I(className="fa fa-play")),
+                                        dmc.Progress(id="tg-deconv-progress", value=0, size="sm", style={"flexGrow": 1}),
+                                        html.Span(id="tg-deconv-progress-label", className="text-muted"),
+                                    ],
+                                    style={"display": "flex", "alignItems": "center", "gap": "12px", "marginBottom": "12px"},
+                                ),
+                                html.Div(id="tg-deconv-message", className="text-danger"),
+                                dmc.Select(id="tg-deconv-file", data=[], placeholder="File", w=320),
+                                dcc.Graph(id="tg-deconv-graph", style={"height": "400px", "width": "100%"}),
+                                html.Div(id="tg-deconv-table"),
+                            ]
+                        ),
+                        className="shadow p-3 mb-4 rounded",
+                        style={"backgroundColor": "rgba(255,255,255,0.85)"},
+                    ),
+                ),
             ],
             fluid=True,
             className="mt-4",
@@ -279,7 +397,7 @@ layout = html.Div(
     prevent_initial_call=True,
 )
 def load_walkthrough(n_clicks: int | None):
-    """Lee los CSV definidos en WALKTHROUGH_FILES y devuelve el dict {filename: json}."""
+    """Lee los CSV definidos en WALKTHROUGH_FILES y devuelve el dict {filename: run_id}."""
     if not n_clicks:
         raise PreventUpdate
 
@@ -289,19 +407,7 @@ def load_walkthrough(n_clicks: int | None):
         if not path.exists():
             # no rompemos flujo si falta alguno
             continue
-        # Lee con heurística (aunque sean CSV)
-        raw = path.read_bytes()
-        df = _read_table_like(raw, path.name)
-
-        # Selecciona columnas robustamente
-        try:
-            df_selected = _select_tg_columns(df)
-        except Exception:
-            # Fallback mínimo: primeras dos columnas
-            df_selected = df.iloc[:, [0, 1]].copy()
-            df_selected.columns = ["X_Value", "Mass"]
-
-        loaded[spec["label"]] = df_selected.to_json(orient="split")
+        loaded[spec["label"]] = register_tg_run(path.read_bytes(), path.name)
     return loaded
 
 
@@ -311,31 +417,39 @@ def load_walkthrough(n_clicks: int | None):
     Output("show-graph-cards", "data"),
     Input("upload-multi-tg", "contents"),
     Input("walkthrough-data", "data"),
+    Input("chunked-upload-tg", "data"),
     State("upload-multi-tg", "filename"),
     State("multi-tg-data-store", "data"),
 )
-def handle_multi_tg_uploads(list_of_contents, walkthrough_loaded, list_of_names, existing_data_json):
+def handle_multi_tg_uploads(list_of_contents, walkthrough_loaded, chunked_loaded, list_of_names, existing_data_json):
     """
-    Maneja carga manual (Upload) y automática (Walkthrough).
+    Maneja carga manual (Upload o subida por trozos) y automática (Walkthrough).
     Funde los resultados en el store de curvas disponibles.
+    El store sólo guarda {nombre_fichero: run_id}; los datos viven en RUNS.
     """
     current_data = existing_data_json.copy() if existing_data_json else {}
     trigger = ctx.triggered_id
 
     # --- Carga manual ---------------------------------------------------------
-    if trigger == "upload-multi-tg" and list_of_contents:
+    if (trigger == "upload-multi-tg" and list_of_contents) or (trigger == "chunked-upload-tg" and chunked_loaded):
         newly_added, errors = [], []
-        for c, n in zip(list_of_contents, list_of_names):
-            if n in current_data:
-                continue
-            try:
-                file_buf = decode_csv_file_content(c)
-                df = _read_table_like(file_buf, n)
-                df_selected = _select_tg_columns(df)
-                current_data[n] = df_selected.to_json(orient="split")
-                newly_added.append(n)
-            except Exception as e:  # noqa: BLE001
-                errors.append(f"Error en {n}: {e}")
+        if trigger == "upload-multi-tg":
+            for c, n in zip(list_of_contents, list_of_names):
+                if n in current_data:
+                    continue
+                try:
+                    current_data[n] = register_tg_run(decode_upload_bytes(c), n)
+                    newly_added.append(n)
+                except Exception as e:  # noqa: BLE001
+                    errors.append(f"Error en {n}: {e}")
+        else:
+            # Subida por trozos: el servidor ya parseó y sólo nos llega el run_id
+            for f in chunked_loaded.get("files", []):
+                if f["filename"] in current_data:
+                    continue
+                current_data[f["filename"]] = f["id"]
+                newly_added.append(f["filename"])
+            errors.extend(f"Error en {e}" for e in chunked_loaded.get("errors", []))
 
         feedback = []
         if newly_added:
@@ -441,47 +555,151 @@ def show_graph_cards(show_cards: bool):
     )
 
 
+def _run_trace(index: int, filename: str, x_data, y_data, visible: bool, webgl: bool = False):
+    """
+    Traza de un fichero. Siempre hay una traza por fichero aunque esté oculta
+    o no tenga datos; su uid es el nombre del fichero, y la visibilidad se
+    cambia en el navegador con Plotly.restyle buscando la traza por uid.
+    Scatter o Scattergl según el nº total de puntos de la figura
+    (engine/rendering.py).
+    """
+    return line_trace(
+        webgl,
+        x=x_data, y=y_data, mode='lines',
+        name=filename.rsplit('.', 1)[0],
+        uid=filename,
+        line=dict(width=2, dash="solid", color=PLOTLY_COLORS[index % len(PLOTLY_COLORS)]),
+        visible=visible,
+    )
+
+
+def _add_run_traces(fig: go.Figure, rows, vis_dict: Dict[str, bool]) -> None:
+    """Añade las trazas [(filename, x, y), ...]; WebGL si la figura tiene muchos puntos."""
+    webgl = use_webgl(count_points(x_data for _, x_data, _ in rows))
+    for i, (filename, x_data, y_data) in enumerate(rows):
+        fig.add_trace(_run_trace(i, filename, x_data, y_data, vis_dict[filename], webgl))
+
+
+def _temperature_xy(run: TGRun | None):
+    """(x, y, título Y) del programa de temperatura, o None si no hay columna."""
+    if run is None:
+        return None
+    # Eje Y: Program Temperature, Eje X: índice (tiempo)
+    if "Program Temperature" in run:
+        y_data = run["Program Temperature"]
+        return np.arange(len(y_data)), y_data, "Program Temperature (°C)"
+    if "Temperature" in run:
+        y_data = run["Temperature"]
+        return np.arange(len(y_data)), y_data, "Temperature (°C)"
+    return None
+
+
+def _tg_columns(run: TGRun | None):
+    """(x_col, mass_col, título X) con Sample Temperature (preferente) o Temperature."""
+    if run is None:
+        return None
+    if "Sample Temperature" in run:
+        x_col, x_title = "Sample Temperature", "Sample Temperature (°C)"
+    elif "Temperature" in run:
+        x_col, x_title = "Temperature", "Temperature (°C)"
+    else:
+        return None
+    # Busca la columna de masa
+    mass_col = find_mass_column(run)
+    if mass_col is None:
+        return None
+    return x_col, mass_col, x_title
+
+
+def _batch_for(data_json: Dict[str, str]):
+    """
+    (TGBatch o None, {filename: fila del batch}, título X, [ficheros expirados]):
+    TG/DTG de todos los ficheros calculadas juntas en la rejilla común
+    (engine/tg_batch.py). Los ficheros cuyo run ya no está en RUNS (expulsado
+    o expirado) se devuelven aparte para poder avisar.
+    """
+    x_title = "Temperature (°C)"
+    specs, row_of, missing = [], {}, []
+    for filename, run_id in data_json.items():
+        run = RUNS.get(run_id)
+        if run is None:
+            missing.append(filename)
+            continue
+        found = _tg_columns(run)
+        if found is None:
+            continue
+        x_col, mass_col, x_title = found
+        row_of[filename] = len(specs)
+        specs.append((run, x_col, mass_col))
+    return (batch_tg_dtg(specs) if specs else None), row_of, x_title, missing
+
+
+def _missing_runs(data_json: Dict[str, str] | None) -> List[str]:
+    """Ficheros del Store cuyo run ya no está en RUNS."""
+    return [filename for filename, run_id in (data_json or {}).items() if RUNS.get(run_id) is None]
+
+
+def _batch_rows(data_json: Dict[str, str], field: str, viewport=None):
+    """Filas [(filename, x, y), ...] de `field` ('deriv_norm', 'norm_mass'…) y el título X."""
+    batch, row_of, x_title, _ = _batch_for(data_json)
+    rows = []
+    for filename in data_json:
+        if batch is None or filename not in row_of:
+            rows.append((filename, [], []))
+            continue
+        rows.append((filename, *decimate(*batch.row(row_of[filename], field), viewport=viewport)))
+    return rows, x_title
+
+
+# --------- Aviso de ficheros expirados (el Store sólo guarda run_ids)
+@dash.callback(
+    Output("tg-upload-status", "children"),
+    Input("multi-tg-data-store", "data"),
+    *[Input(gid, "figure") for gid in GRAPH_IDS],
+)
+def report_expired_runs(data_json, *_figures):
+    """Se revisa tras cada redibujado: un run puede expirar entre dos zooms."""
+    missing = _missing_runs(data_json)
+    if not missing:
+        return ""
+    return html.P(f"File expired from the server cache, please upload it again: {', '.join(missing)}")
+
+
 # --------- Gráfico 1: Programas de temperatura
 @dash.callback(
     Output("multi-tg-temp-graph", "figure"),
     Input("multi-tg-data-store", "data"),
-    Input("tg-legend-visibility", "data"),
+    Input("multi-tg-temp-graph-viewport", "data"),
+    State("tg-legend-visibility", "data"),
 )
-def plot_temp_programs(data_json, vis_dict):
+def plot_temp_programs(data_json, viewport=None, vis_dict=None):
     fig = go.Figure()
     vis_dict = sync_vis_dict(data_json, vis_dict)
-    if not data_json or not any(vis_dict.values()):
+    if not data_json:
         fig.update_layout(xaxis={"visible": False}, yaxis={"visible": False}, plot_bgcolor="white", paper_bgcolor="white")
         return fig
 
-    for i, (filename, df_json_single) in enumerate(data_json.items()):
-        if not vis_dict.get(filename, True):
+    y_title = "Temperature (°C)"
+    rows = []
+    for filename, run_id in data_json.items():
+        found = _temperature_xy(RUNS.get(run_id))
+        if found is None:
+            rows.append((filename, [], []))
             continue
-        df = pd.read_json(io.StringIO(df_json_single), orient="split")
-        # Eje Y: Program Temperature, Eje X: índice (tiempo)
-        if "Program Temperature" in df.columns:
-            y_data = df["Program Temperature"].astype(float).values
-            x_data = np.arange(len(y_data))
-        elif "Temperature" in df.columns:
-            y_data = df["Temperature"].astype(float).values
-            x_data = np.arange(len(y_data))
-        else:
-            continue
-        fig.add_trace(go.Scatter(
-            x=x_data, y=y_data, mode='lines',
-            name=filename.rsplit('.', 1)[0],
-            line=dict(width=2, dash="solid")
-        ))
+        x_data, y_data, y_title = found
+        rows.append((filename, *decimate(x_data, y_data, viewport=viewport)))
+    _add_run_traces(fig, rows, vis_dict)
 
     fig.update_layout(
         xaxis_title="Time (s)",
-        yaxis_title="Program Temperature (°C)" if "Program Temperature" in df.columns else "Temperature (°C)",
+        yaxis_title=y_title,
         margin=dict(l=60, r=20, t=10, b=70),
         plot_bgcolor="white", paper_bgcolor="white",
         xaxis=dict(showgrid=True, gridcolor="#e0e0e0"),
         yaxis=dict(showgrid=True, gridcolor="#e0e0e0"),
         showlegend=False,
-        font_family="Segoe UI, system-ui"
+        font_family="Segoe UI, system-ui",
+        uirevision="tg-comparison",  # conserva el zoom al redibujar
     )
     return fig
 
@@ -490,48 +708,18 @@ def plot_temp_programs(data_json, vis_dict):
 @dash.callback(
     Output("multi-tg-dtg-graph", "figure"),
     Input("multi-tg-data-store", "data"),
-    Input("tg-legend-visibility", "data"),
+    Input("multi-tg-dtg-graph-viewport", "data"),
+    State("tg-legend-visibility", "data"),
 )
-def plot_multi_tg_dtg(data_json, vis_dict):
+def plot_multi_tg_dtg(data_json, viewport=None, vis_dict=None):
     fig = go.Figure()
     vis_dict = sync_vis_dict(data_json, vis_dict)
-    if not data_json or not any(vis_dict.values()):
+    if not data_json:
         fig.update_layout(xaxis={"visible": False}, yaxis={"visible": False}, plot_bgcolor="white", paper_bgcolor="white")
         return fig
 
-    for i, (filename, df_json_single) in enumerate(data_json.items()):
-        if not vis_dict.get(filename, True):
-            continue
-        df = pd.read_json(io.StringIO(df_json_single), orient="split")
-        # Eje X: Sample Temperature (preferente), si no, Temperature
-        if "Sample Temperature" in df.columns:
-            x_data = df["Sample Temperature"].astype(float).values
-            x_title = "Sample Temperature (°C)"
-        elif "Temperature" in df.columns:
-            x_data = df["Temperature"].astype(float).values
-            x_title = "Temperature (°C)"
-        else:
-            continue
-        # Busca la columna de masa
-        mass_col = None
-        for col in df.columns:
-            col_lower = col.lower()
-            if "unsubtracted weight" in col_lower or "weight" in col_lower or "mass" in col_lower or "tg" in col_lower:
-                mass_col = col
-                break
-        if mass_col is None:
-            continue
-        y_data = df[mass_col].astype(float).values
-        init_mass = y_data[0]
-        fin_mass = y_data[-1]
-        norm_mass = 100 * (y_data - fin_mass) / (init_mass - fin_mass) if (init_mass - fin_mass) != 0 else np.zeros_like(y_data)
-        _, deriv = calc_smooth_derivative(x_data, norm_mass)
-        deriv_norm = 100 * (deriv - np.min(deriv)) / (np.max(deriv) - np.min(deriv)) if (np.max(deriv) - np.min(deriv)) != 0 else np.zeros_like(deriv)
-        fig.add_trace(go.Scatter(
-            x=x_data, y=deriv_norm, mode='lines',
-            name=filename.rsplit('.', 1)[0],
-            line=dict(width=2, dash="solid")
-        ))
+    rows, x_title = _batch_rows(data_json, "deriv_norm", viewport)
+    _add_run_traces(fig, rows, vis_dict)
 
     fig.update_layout(
         xaxis_title=x_title,
@@ -541,7 +729,8 @@ def plot_multi_tg_dtg(data_json, vis_dict):
         xaxis=dict(showgrid=True, gridcolor="#e0e0e0"),
         yaxis=dict(showgrid=True, gridcolor="#e0e0e0"),
         showlegend=False,
-        font_family="Segoe UI, system-ui"
+        font_family="Segoe UI, system-ui",
+        uirevision="tg-comparison",  # conserva el zoom al redibujar
     )
     fig.update_yaxes(range=[0, 100])
     return fig
@@ -551,61 +740,346 @@ def plot_multi_tg_dtg(data_json, vis_dict):
 @dash.callback(
     Output("multi-tg-comparison-graph", "figure"),
     Input("multi-tg-data-store", "data"),
-    Input("tg-legend-visibility", "data"),
+    Input("multi-tg-comparison-graph-viewport", "data"),
+    State("tg-legend-visibility", "data"),
 )
-def plot_multi_tg_comparison(data_json, vis_dict):
+def plot_multi_tg_comparison(data_json, viewport=None, vis_dict=None):
     fig = go.Figure()
     vis_dict = sync_vis_dict(data_json, vis_dict)
-    if not data_json or not any(vis_dict.values()):
+    if not data_json:
         fig.update_layout(xaxis={"visible": False}, yaxis={"visible": False}, plot_bgcolor="white", paper_bgcolor="white")
         return fig
 
-    for i, (filename, df_json_single) in enumerate(data_json.items()):
-        if not vis_dict.get(filename, True):
-            continue
-        df = pd.read_json(io.StringIO(df_json_single), orient="split")
-        # Eje X: Sample Temperature o Temperature
-        if "Sample Temperature" in df.columns:
-            x_data = df["Sample Temperature"].astype(float).values
-            x_title = "Sample Temperature (°C)"
-        elif "Temperature" in df.columns:
-            x_data = df["Temperature"].astype(float).values
-            x_title = "Temperature (°C)"
-        else:
-            continue
-        # Busca la columna de masa
-        mass_col = None
-        for col in df.columns:
-            col_lower = col.lower()
-            if "unsubtracted weight" in col_lower or "weight" in col_lower or "mass" in col_lower or "tg" in col_lower:
-                mass_col = col
-                break
-        if mass_col is None:
-            continue
-        y_data = df[mass_col].astype(float).values
-        init_mass = y_data[0]
-        fin_mass = y_data[-1]
-        norm_mass = 100 * (y_data - fin_mass) / (init_mass - fin_mass) if (init_mass - fin_mass) != 0 else np.zeros_like(y_data)
-        fig.add_trace(go.Scatter(
-            x=x_data, y=norm_mass, mode='lines',
-            name=filename.rsplit('.', 1)[0],
-            line=dict(width=2, dash="solid")
-        ))
+    rows, x_title = _batch_rows(data_json, "norm_mass", viewport)
+    _add_run_traces(fig, rows, vis_dict)
 
     fig.update_layout(
-        xaxis_title="Sample Temperature (°C)" if "Sample Temperature" in df.columns else "Temperature (°C)",
+        xaxis_title=x_title,
         yaxis_title="Weight loss (%)",
         margin=dict(l=60, r=20, t=10, b=70),
         plot_bgcolor="white", paper_bgcolor="white",
         xaxis=dict(showgrid=True, gridcolor="#e0e0e0"),
         yaxis=dict(showgrid=True, gridcolor="#e0e0e0"),
         showlegend=False,
-        font_family="Segoe UI, system-ui"
+        font_family="Segoe UI, system-ui",
+        uirevision="tg-comparison",  # conserva el zoom al redibujar
     )
     fig.update_yaxes(range=[0, 100])
     return fig
 
 
+# --------- Visor de cada gráfico: el zoom pide los datos a resolución completa
+def _register_viewport_callback(graph_id: str) -> None:
+    @dash.callback(
+        Output(f"{graph_id}-viewport", "data"),
+        Input(graph_id, "relayoutData"),
+        State(f"{graph_id}-viewport", "data"),
+        prevent_initial_call=True,
+    )
+    def update_viewport(relayout_data, current):
+        viewport = viewport_from_relayout(relayout_data, current)
+        if viewport == current:
+            raise PreventUpdate
+        return viewport
+
+
+for _graph_id in GRAPH_IDS:
+    _register_viewport_callback(_graph_id)
+
+
+# --------- Tabla de puntos característicos (todas las etapas de todos los ficheros)
+CHARACTERISTIC_COLUMNS = [
+    ("file", "File", None),
+    ("step", "Step", 0),
+    ("t_onset", "Tonset (°C)", 1),
+    ("t_peak", "Tpeak (°C)", 1),
+    ("t_endset", "Tendset (°C)", 1),
+    ("peak_rate", "Peak DTG rate (%/°C)", 3),
+    ("mass_loss", "Mass loss (%)", 2),
+    ("residue", "Residue (%)", 2),
+]
+
+
+@dash.callback(
+    Output("tg-characteristics-container", "children"),
+    Input("multi-tg-data-store", "data"),
+)
+def update_characteristics_table(data_json):
+    if not data_json:
+        return ""
+    batch, row_of, _, _ = _batch_for(data_json)
+    if batch is None:
+        return ""
+    table = characteristic_points(batch)
+    filenames = {row: filename for filename, row in row_of.items()}
+    table.insert(0, "file", [filenames[r].rsplit('.', 1)[0] for r in table["run"]])
+
+    columns = [
+        {"id": cid, "name": name, "type": "text"} if decimals is None else
+        {"id": cid, "name": name, "type": "numeric", "format": Format(precision=decimals, scheme=Scheme.fixed)}
+        for cid, name, decimals in CHARACTERISTIC_COLUMNS
+    ]
+    return dbc.Card(
+        dbc.CardBody(
+            [
+                html.H5("Characteristic points", style={"fontWeight": "bold", "color": "#333"}),
+                dash_table.DataTable(
+                    id="tg-characteristics-table",
+                    columns=columns,
+                    data=table[[cid for cid, _, _ in CHARACTERISTIC_COLUMNS]].to_dict("records"),
+                    sort_action="native",
+                    sort_mode="multi",
+                    export_format="csv",
+                    export_headers="display",
+                    page_size=25,
+                    style_table={"overflowX": "auto"},
+                    style_cell={"fontFamily": "Segoe UI, system-ui", "fontSize": "14px", "padding": "6px"},
+                    style_header={"fontWeight": "bold", "backgroundColor": "#f4f8fb"},
+                ),
+            ]
+        ),
+        className="shadow p-3 mb-4 rounded",
+        style={"backgroundColor": "rgba(255,255,255,0.85)"},
+    )
+
+
+# --------- Cinética isoconversional: Ea(α) con las velocidades de calentamiento cargadas
+KINETIC_METHODS = (("friedman", "Friedman"), ("ofw", "Ozawa–Flynn–Wall"), ("kas", "Kissinger–Akahira–Sunose"))
+
+
+def _heating_rate(filename: str, run: TGRun) -> float | None:
+    """β (°C/min): del nombre (_R10) o, si no está, de la temperatura programada."""
+    beta = heating_rate_from_name(filename)
+    if beta is None and "Time" in run and "Program Temperature" in run:
+        beta = heating_rate_from_program(run["Time"], run["Program Temperature"])
+    return beta
+
+
+@dash.callback(
+    Output("tg-kinetics-container", "children"),
+    Input("multi-tg-data-store", "data"),
+)
+def update_kinetics_card(data_json):
+    if not data_json:
+        return ""
+    batch, row_of, _, _ = _batch_for(data_json)
+    if batch is None:
+        return ""
+    betas = np.full(batch.n_runs, np.nan)
+    for filename, row in row_of.items():
+        betas[row] = _heating_rate(filename, RUNS.get(data_json[filename])) or np.nan
+    rates_txt = ", ".join(
+        f"{filename.rsplit('.', 1)[0]}: β = {betas[row]:g} °C/min" if np.isfinite(betas[row]) else f"{filename.rsplit('.', 1)[0]}: β = ?"
+        for filename, row in row_of.items()
+    )
+
+    known = np.isfinite(betas)
+    if len(np.unique(betas[known])) < 2:
+        body = [html.P("Se necesitan ensayos a al menos dos velocidades de calentamiento distintas "
+                       "(p. ej. _R5, _R10, _R20 en el nombre del fichero).", className="text-muted")]
+    else:
+        rows = np.flatnonzero(known)
+        sub = batch.take(rows)
+        ea = isoconversional(sub, betas[rows])
+        ea_kissinger, r2_kissinger = kissinger(sub, betas[rows])
+        fig = go.Figure()
+        for i, (col, name) in enumerate(KINETIC_METHODS):
+            fig.add_trace(go.Scatter(x=ea["alpha"], y=ea[col], mode="lines", name=name,
+                                     line=dict(width=2, color=PLOTLY_COLORS[i])))
+        fig.add_hline(y=ea_kissinger, line=dict(dash="dash", color="#555"),
+                      annotation_text=f"Kissinger: {ea_kissinger:.1f} kJ/mol (r² = {r2_kissinger:.3f})")
+        fig.update_layout(
+            xaxis_title="Conversion α",
+            yaxis_title="Ea (kJ/mol)",
+            margin=dict(l=60, r=20, t=10, b=70),
+            plot_bgcolor="white", paper_bgcolor="white",
+            xaxis=dict(showgrid=True, gridcolor="#e0e0e0", range=[0, 1]),
+            yaxis=dict(showgrid=True, gridcolor="#e0e0e0"),
+            legend=dict(orientation="h", y=-0.25),
+            font_family="Segoe UI, system-ui",
+        )
+        body = [dcc.Graph(id="tg-kinetics-graph", figure=fig, style={"height": "400px", "width": "100%"})]
+
+    return dbc.Card(
+        dbc.CardBody(
+            [
+                html.H5("Isoconversional kinetics", style={"fontWeight": "bold", "color": "#333"}),
+                html.P(rates_txt, className="text-muted", style={"fontSize": "0.9em"}),
+                *body,
+            ]
+        ),
+        className="shadow p-3 mb-4 rounded",
+        style={"backgroundColor": "rgba(255,255,255,0.85)"},
+    )
+
+
+# --------- Deconvolución de la DTG (en segundo plano si hay DiskcacheManager)
+SYNC_MAX_RUNS = 10      # ensayos que se ajustan como mucho dentro de la petición
+DECONV_COLUMNS = [
+    ("file", "File", None),
+    ("peak", "Peak", 0),
+    ("center", "Center (°C)", 1),
+    ("fwhm", "FWHM (°C)", 1),
+    ("height", "Height (%/°C)", 3),
+    ("asymmetry", "Asymmetry", 3),
+    ("area", "Area (%)", 1),
+    ("r2", "r²", 4),
+]
+
+
+@dash.callback(
+    Output("tg-deconv-section", "style"),
+    Input("show-graph-cards", "data"),
+)
+def show_deconv_section(show_cards):
+    return {"display": "block"} if show_cards else {"display": "none"}
+
+
+@dash.callback(
+    Output("tg-deconv-file", "data"),
+    Output("tg-deconv-file", "value"),
+    Input("multi-tg-data-store", "data"),
+    State("tg-deconv-file", "value"),
+)
+def update_deconv_files(data_json, current):
+    files = list(data_json or {})
+    return files, (current if current in files else (files[0] if files else None))
+
+
+def _dtg_rate(data_json: Dict[str, str]):
+    """{filename: (T, -dTG/dT)} en la rejilla común, sin los bordes del filtro."""
+    batch, row_of, _, _ = _batch_for(data_json)
+    if batch is None:
+        return {}
+    inner = batch.interior()
+    return {filename: (batch.grid[inner[row]], -batch.deriv[row, inner[row]]) for filename, row in row_of.items()}
+
+
+def run_deconvolution(set_progress, n_clicks, data_json, model, n_peaks, max_workers=None, max_runs=None):
+    """
+    Ajusta todos los ficheros cargados; el resultado (sólo parámetros) va a un
+    Store. Si no queda ninguna curva (ensayos expulsados) se avisa en vez de
+    devolver un resultado vacío.
+    """
+    if not n_clicks or not data_json:
+        raise PreventUpdate
+    n_peaks = int(np.clip(n_peaks or 1, 1, MAX_PEAKS))
+    curves = _dtg_rate(data_json)
+    if not curves:
+        return None, "No DTG curves to fit: the loaded runs are no longer in the cache. Upload them again."
+    skipped = []
+    if max_runs is not None and len(curves) > max_runs:
+        skipped = list(curves)[max_runs:]
+        curves = {filename: curves[filename] for filename in list(curves)[:max_runs]}
+    jobs = [(data_json[filename], x, y) for filename, (x, y) in curves.items()]
+
+    def progress(done, total):
+        set_progress((100.0 * done / max(total, 1), f"{done}/{total}"))
+
+    fits = fit_many(jobs, n_peaks, model, progress=progress, max_workers=max_workers)
+    message = (f"Only the first {max_runs} runs were fitted ({len(skipped)} skipped): "
+               "fitting in the request is limited; enable background jobs for more.") if skipped else ""
+    return {
+        filename: {"model": model, "params": fits[data_json[filename]].params.tolist(),
+                   "areas": fits[data_json[filename]].areas.tolist(), "r2": fits[data_json[filename]].r2}
+        for filename in curves
+    }, message
+
+
+_DECONV_IO = (
+    Output("tg-deconv-results", "data"),
+    Output("tg-deconv-message", "children"),
+    Input("tg-deconv-run", "n_clicks"),
+    State("multi-tg-data-store", "data"),
+    State("tg-deconv-model", "value"),
+    State("tg-deconv-npeaks", "value"),
+)
+if BACKGROUND_MANAGER is not None:
+    dash.callback(
+        *_DECONV_IO,
+        background=True,
+        manager=BACKGROUND_MANAGER,
+        progress=[Output("tg-deconv-progress", "value"), Output("tg-deconv-progress-label", "children")],
+        running=[(Output("tg-deconv-run", "disabled"), True, False)],
+        prevent_initial_call=True,
+    )(run_deconvolution)
+else:
+    @dash.callback(*_DECONV_IO, prevent_initial_call=True)
+    def run_deconvolution_sync(n_clicks, data_json, model, n_peaks):
+        """
+        Sin trabajos en segundo plano el ajuste bloquea la petición y no hay
+        barra de progreso. Se ajusta en serie dentro del proceso (no se lanza
+        un pool desde un worker con hilos) y sólo hasta SYNC_MAX_RUNS ensayos.
+        """
+        return run_deconvolution(lambda _: None, n_clicks, data_json, model, n_peaks,
+                                 max_workers=1, max_runs=SYNC_MAX_RUNS)
+
+
+@dash.callback(
+    Output("tg-deconv-graph", "figure"),
+    Output("tg-deconv-table", "children"),
+    Input("tg-deconv-results", "data"),
+    Input("tg-deconv-file", "value"),
+    State("multi-tg-data-store", "data"),
+)
+def show_deconvolution(results, filename, data_json):
+    fig = go.Figure()
+    fig.update_layout(
+        xaxis_title="Temperature (°C)",
+        yaxis_title="-dTG/dT (%/°C)",
+        margin=dict(l=60, r=20, t=10, b=70),
+        plot_bgcolor="white", paper_bgcolor="white",
+        xaxis=dict(showgrid=True, gridcolor="#e0e0e0"),
+        yaxis=dict(showgrid=True, gridcolor="#e0e0e0"),
+        legend=dict(orientation="h", y=-0.25),
+        font_family="Segoe UI, system-ui",
+    )
+    if not data_json or not filename or filename not in data_json:
+        return fig, ""
+    curve = _dtg_rate({filename: data_json[filename]}).get(filename)
+    if curve is None:
+        return fig, ""
+    x, y = curve
+    fig.add_trace(go.Scatter(x=x, y=y, mode="lines", name="DTG", line=dict(width=2, color="#333")))
+
+    results = {k: v for k, v in (results or {}).items() if k in data_json}
+    fit = results.get(filename)
+    if fit:
+        peaks = peak_curves(fit["model"], fit["params"], x)
+        for i, peak in enumerate(peaks):
+            fig.add_trace(go.Scatter(x=x, y=peak, mode="lines", name=f"Peak {i + 1}",
+                                     line=dict(width=1.5, dash="dot", color=PLOTLY_COLORS[i % len(PLOTLY_COLORS)])))
+        fig.add_trace(go.Scatter(x=x, y=peaks.sum(axis=0), mode="lines", name="Sum",
+                                 line=dict(width=2, dash="dash", color="#d62728")))
+    if not results:
+        return fig, ""
+
+    records = []
+    for name, res in results.items():
+        for i, (p, area) in enumerate(zip(res["params"], res["areas"])):
+            records.append({
+                "file": name.rsplit('.', 1)[0], "peak": i + 1, "center": p[1], "fwhm": p[2], "height": p[0],
+                "asymmetry": p[3] if len(p) > 3 else None, "area": 100.0 * area, "r2": res["r2"],
+            })
+    table = dash_table.DataTable(
+        id="tg-deconv-params",
+        columns=[
+            {"id": cid, "name": name, "type": "text"} if decimals is None else
+            {"id": cid, "name": name, "type": "numeric", "format": Format(precision=decimals, scheme=Scheme.fixed)}
+            for cid, name, decimals in DECONV_COLUMNS
+        ],
+        data=records,
+        sort_action="native",
+        export_format="csv",
+        export_headers="display",
+        page_size=25,
+        style_table={"overflowX": "auto"},
+        style_cell={"fontFamily": "Segoe UI, system-ui", "fontSize": "14px", "padding": "6px"},
+        style_header={"fontWeight": "bold", "backgroundColor": "#f4f8fb"},
+    )
+    return fig, table
+
+
 # --- Refresh (client-side) --- (seguro aunque aún no exista el app)
 try:
     _app = dash.get_app()
@@ -617,6 +1091,47 @@ try:
             Output("refresh-btn-tgcomp", "n_clicks"),
             Input("refresh-btn-tgcomp", "n_clicks"),
         )
+        # Visibilidad: Plotly.restyle sólo de 'visible' en las trazas afectadas,
+        # buscadas por uid (= fichero); no se reenvían datos ni la figura. Las
+        # figuras que redibuja el servidor ya traen la visibilidad del Store.
+        _app.clientside_callback(
+            """
+            function(vis) {
+                if (!vis || !window.Plotly) { return window.dash_clientside.no_update; }
+                %s.forEach(function(gid) {
+                    var host = document.getElementById(gid);
+                    var gd = host && (host.classList.contains("js-plotly-plot") ? host : host.querySelector(".js-plotly-plot"));
+                    if (!gd || !gd.data) { return; }
+                    var idx = [], visible = [];
+                    gd.data.forEach(function(trace, i) {
+                        var want = vis[trace.uid];
+                        if (want !== undefined && trace.visible !== want) {
+                            idx.push(i);
+                            visible.push(want);
+                        }
+                    });
+                    if (idx.length) { window.Plotly.restyle(gd, {visible: visible}, idx); }
+                });
+                return window.dash_clientside.no_update;
+            }
+            """ % json.dumps(list(GRAPH_IDS)),
+            Output("tg-visibility-applied", "data"),
+            Input("tg-legend-visibility", "data"),
+            prevent_initial_call=True,
+        )
+        # Subida por trozos (assets/chunked_upload.js): el resultado llega por set_props
+        _app.clientside_callback(
+            """
+            function(n_clicks){
+                return window.dash_clientside.chunked_upload.pick(
+                    n_clicks, "tg-comparison", true, ".csv,.txt,.xls,.xlsx",
+                    "chunked-upload-tg", "chunked-upload-progress-tg");
+            }
+            """,
+            Output("chunked-upload-btn-tg", "n_clicks"),
+            Input("chunked-upload-btn-tg", "n_clicks"),
+            prevent_initial_call=True,
+        )
 except Exception:
     pass
 
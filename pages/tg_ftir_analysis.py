@@ -1,12 +1,21 @@
 # pages/tg_ftir_analysis.py
 # -----------------------------------------------------------------------------
 # Evolved Gas Analysis (TG-FTIR)
-# - Carga TG (CSV), GS (XLSX) y FTIR (CSV)
+# - Carga TG (CSV), FTIR (CSV) y, opcionalmente, GS (XLSX); sin él, el GS se
+#   calcula a partir del cubo FTIR (engine/gram_schmidt.py)
 # - Sincroniza tiempo entre TG/GS y muestra espectro FTIR más cercano
+# - Perfiles de bandas (CO2, CO, H2O...) sobre la TG/DTG: presets o selección
+#   por caja en el espectro (engine/bands.py)
+# - Mapa tiempo × número de onda del cubo completo (heatmap o superficie 3-D),
+#   agregado por teselas en el servidor y re-agregado al hacer zoom
+# - Biblioteca local de referencias (JCAMP-DX/CSV): top-k por correlación o
+#   coseno del espectro actual, de un fijado o de todo el ensayo; el chat
+#   recibe las coincidencias (engine/library.py)
 # - Permite "fijar" espectros y compararlos (como en la primera versión funcional)
 # - Incluye botón "Walkthrough" para precargar ficheros de ejemplo
 # - Chat experto (opcional, igual que antes)
-# - ***SIN*** conversión a absorbancia (eliminada por completo)
+# - Preprocesado opcional del cubo: absorbancia, resta del fondo y línea base
+#   ALS/polinómica sobre todos los espectros a la vez (engine/preprocessing.py)
 # -----------------------------------------------------------------------------
 
 from __future__ import annotations
@@ -14,6 +23,7 @@ from __future__ import annotations
 import base64
 import io
 import os
+import uuid
 from pathlib import Path
 
 import dash
@@ -22,10 +32,26 @@ import dash_mantine_components as dmc
 import numpy as np
 import pandas as pd
 import plotly.graph_objs as go
-from dash import dcc, html, Input, Output, State, ctx
+from dash import dash_table, dcc, html, Input, Output, State, ctx
 from dash.exceptions import PreventUpdate
 from dotenv import load_dotenv
-from scipy.signal import savgol_filter
+
+from engine.bands import BAND_PRESETS, band_profile
+from engine.decimation import decimate, viewport_from_relayout
+from engine.library import DEFAULT_TOP_K, METRICS, add_reference, load_library
+from engine.preprocessing import DEFAULT_BACKGROUND_SCANS, preprocess_cube
+from engine.ftir_cube import CUBES, FtirCube, get_cube
+from engine.gram_schmidt import gram_schmidt_run
+from engine.readers import read_ftir_cube, read_tg_table
+from engine.tiles import MAP_TILES, SURFACE_TILES, cube_tiles
+from engine.rendering import count_points, line_trace, use_webgl
+from engine.run_store import RUNS, TGRun, content_hash
+from engine.uploads import register_upload_kind
+from engine.workspace import WORKSPACES
+from engine.signals import tg_dtg
+from engine.transport import (
+    CLIENT_CUBE_MAX_BYTES, b64_array, client_cube_nbytes, decode_array, encode_cube_payload, typed_array,
+)
 
 # (opcionales) usados en tu primera versión
 from dash import dash_table  # noqa: F401
@@ -43,7 +69,7 @@ dash._dash_renderer._set_react_version('18.2.0')
 # ------------------ Walkthrough: archivos de ejemplo ------------------
 BASE_DIR = Path(__file__).resolve().parents[1]
 EGA_WALKTHROUGH = {
-    # TG CSV (el callback lee con delimiter=',')
+    # TG CSV (lector rápido: separador detectado en la cabecera)
     "tg": {
         "label": "TG_50CO_50P_R10.csv",
         "path": BASE_DIR / "assets" / "walkthrough" / "TG_50CO_50P_R10.csv",
@@ -69,39 +95,49 @@ def _file_to_contents(path: Path, mime: str) -> str:
     b64 = base64.b64encode(data).decode("utf-8")
     return f"data:{mime};base64,{b64}"
 
-def decode_file(contents, file_type='csv'):
+def decode_bytes(contents):
+    """dcc.Upload.contents → bytes crudos del fichero."""
     content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string)
-    if file_type == 'xlsx':
-        return io.BytesIO(decoded)
-    elif file_type == 'csv':
-        try:
-            return io.StringIO(decoded.decode('utf-8'))
-        except UnicodeDecodeError:
-            return io.StringIO(decoded.decode('ISO-8859-1'))
-    else:
-        raise ValueError("Unsupported file type")
-
-def calc_smooth_derivative(x, y, window_length=21, polyorder=2):
-    if len(y) < 3:
-        # seguridad: sin puntos suficientes, devuelve ceros
-        return np.asarray(y, dtype=float), np.zeros_like(y, dtype=float)
-    if window_length >= len(y):
-        window_length = len(y) - 1 if len(y) % 2 == 0 else len(y)
-    if window_length < 3:
-        window_length = 3
-    if window_length % 2 == 0:
-        window_length += 1
-    y = np.asarray(y, dtype=float)
-    x = np.asarray(x, dtype=float)
-    y_smooth = savgol_filter(y, window_length, polyorder)
-    delta = float(np.mean(np.diff(x))) if len(x) > 1 else 1.0
-    dy_dx = savgol_filter(y, window_length, polyorder, deriv=1, delta=delta)
-    return y_smooth, dy_dx
-
-# ------------------ Estado global ------------------
-tg = gs = ftir = None
-last_ftir_hash = None
+    return base64.b64decode(content_string)
+
+# Los ids de esta página llevan prefijo: la página de comparación guarda el
+# mismo fichero TG en RUNS pero sólo con las columnas seleccionadas.
+def load_tg_run(raw: bytes | Path, filename: str, digest: str | None = None) -> TGRun:
+    """Parsea el CSV TG (todas las columnas, por posición) y lo registra en RUNS."""
+    run_id = f"ega-tg-{digest or content_hash(raw)}"
+    run = RUNS.get(run_id)
+    if run is None:
+        run = TGRun.from_frame(read_tg_table(raw), filename, run_id)
+        RUNS.put(run)
+    return run
+
+def load_gs_run(raw: bytes | Path, filename: str, digest: str | None = None) -> TGRun:
+    """Lee el XLSX de Gram-Schmidt (skiprows=4) y lo registra en RUNS."""
+    run_id = f"ega-gs-{digest or content_hash(raw)}"
+    run = RUNS.get(run_id)
+    if run is None:
+        source = io.BytesIO(raw) if isinstance(raw, (bytes, bytearray)) else raw
+        run = TGRun.from_frame(pd.read_excel(source, skiprows=4), filename, run_id)
+        RUNS.put(run)
+    return run
+
+def load_ftir_cube(raw: bytes | Path, digest: str | None = None) -> FtirCube:
+    """Parsea el CSV FTIR (';', coma decimal) y construye el cubo una sola vez por fichero."""
+    cube_id = f"ega-ftir-{digest or content_hash(raw)}"
+    cube = get_cube(cube_id)
+    if cube is None:
+        cube = read_ftir_cube(raw, cube_id)
+        CUBES.set(cube_id, cube)
+    return cube
+
+# Subidas grandes por trozos (engine.uploads): el fichero se parsea desde disco
+register_upload_kind("ega-tg", lambda path, filename, digest: load_tg_run(path, filename, digest).run_id)
+register_upload_kind("ega-gs", lambda path, filename, digest: load_gs_run(path, filename, digest).run_id)
+register_upload_kind("ega-ftir", lambda path, filename, digest: load_ftir_cube(path, digest).cube_id)
+
+# ------------------ Estado por sesión ------------------
+# Nada de globales: cada vista de la página tiene su session_id y sus datos
+# (TG/GS/FTIR, último hash FTIR del chat) viven en engine.workspace.WORKSPACES.
 
 # Paleta de colores para fijados (como tenías)
 PLOTLY_COLORS = [
@@ -110,7 +146,7 @@ PLOTLY_COLORS = [
 ]
 
 # ------------------ Layout ------------------
-layout = dmc.MantineProvider(
+_page_layout = dmc.MantineProvider(
     theme={"colorScheme": "light"},
     children=html.Div([
         # ======= Header =======
@@ -197,6 +233,15 @@ layout = dmc.MantineProvider(
                                     'fontWeight': 'bold', 'cursor': 'pointer'
                                 }
                             ),
+                            dmc.Button(
+                                "Large file upload",
+                                id='chunked-btn-tg',
+                                leftSection=html.I(className="fa fa-cloud-arrow-up"),
+                                size="xs",
+                                variant="subtle",
+                                fullWidth=True,
+                                style={"marginTop": "4px"}
+                            ),
                             html.Div(id='tg-status', style={
                                 "transform": "translateX(-50%)", "zIndex": 5, "marginTop": "8px",
                                 "left": "50%", "position": "absolute"
@@ -213,7 +258,7 @@ layout = dmc.MantineProvider(
                 dbc.Col(html.Div([
                     dbc.Card(
                         dbc.CardBody([
-                            html.H4("Upload GS XLSX", className="text-center"),
+                            html.H4("Upload GS XLSX (optional)", className="text-center"),
                             dcc.Upload(
                                 id='upload-gs',
                                 children=html.Div(
@@ -228,6 +273,15 @@ layout = dmc.MantineProvider(
                                     'fontWeight': 'bold', 'cursor': 'pointer'
                                 }
                             ),
+                            dmc.Button(
+                                "Large file upload",
+                                id='chunked-btn-gs',
+                                leftSection=html.I(className="fa fa-cloud-arrow-up"),
+                                size="xs",
+                                variant="subtle",
+                                fullWidth=True,
+                                style={"marginTop": "4px"}
+                            ),
                             html.Div(id='gs-status', style={
                                 "transform": "translateX(-50%)", "zIndex": 5, "marginTop": "8px",
                                 "left": "50%", "position": "absolute"
@@ -259,6 +313,15 @@ layout = dmc.MantineProvider(
                                     'fontWeight': 'bold', 'cursor': 'pointer'
                                 }
                             ),
+                            dmc.Button(
+                                "Large file upload",
+                                id='chunked-btn-ftir',
+                                leftSection=html.I(className="fa fa-cloud-arrow-up"),
+                                size="xs",
+                                variant="subtle",
+                                fullWidth=True,
+                                style={"marginTop": "4px"}
+                            ),
                             html.Div(id='ftir-status', style={
                                 "transform": "translateX(-50%)", "zIndex": 5, "marginTop": "8px",
                                 "left": "50%", "position": "absolute"
@@ -273,13 +336,23 @@ layout = dmc.MantineProvider(
             ])
         ], fluid=True),
 
+        dmc.Progress(id='chunked-progress-ega', value=0, size="sm", style={"margin": "8px 12px 0"}),
         dmc.Divider(m="xl"),
 
         # Stores
         dcc.Store(id='upload-status', data={'tg': False, 'gs': False, 'ftir': False}),
+        dcc.Store(id='ega-chunked-upload', data=None),   # último resultado de subida por trozos
+        dcc.Store(id='ega-chunked-files', data={}),      # {kind: {id, filename}} vigentes
         dcc.Store(id='show-gs-store', data=False),
         dcc.Store(id='selected-time-store', data=None),
         dcc.Store(id='fixed-ftir-list', data=[]),
+        dcc.Store(id='ega-band-selection', data=None),   # banda elegida con caja en el FTIR {lo, hi}
+        dcc.Store(id='mass-temp-chart-viewport', data=None),   # rango X visible (decimado LTTB)
+        dcc.Store(id='time-temp-chart-viewport', data=None),
+        dcc.Store(id='ftir-map-viewport', data=None),   # {"x": rango cm⁻¹, "y": rango s} del mapa
+        dcc.Store(id='library-matches', data=None),     # última búsqueda en la biblioteca (para el chat)
+        dcc.Store(id='ftir-client-cube', data=None),    # cubo comprimido para el modo scrub
+        dcc.Store(id='ftir-client-ready', data=None),   # cube_id ya decodificado en el navegador
 
         # ======= Charts =======
         html.Div(id='chart-container', style={'display': 'none'}, children=[
@@ -289,8 +362,18 @@ layout = dmc.MantineProvider(
                     dbc.Card(
                         dbc.CardBody([
                             dcc.Graph(id='mass-temp-chart', style={"height": "400px", "width": "100%"}),
-                            dmc.Center(dmc.Badge(id='initial-mass-badge', variant='outline',
-                                                 style={'fontSize':'20px','marginTop':'10px'}))
+                            dmc.Group([
+                                dmc.MultiSelect(
+                                    id='ega-band-presets',
+                                    data=list(BAND_PRESETS),
+                                    value=[],
+                                    placeholder='Gas bands (or box-select on the spectrum)',
+                                    clearable=True,
+                                    size='xs',
+                                    w=280
+                                ),
+                                dmc.Badge(id='initial-mass-badge', variant='outline', style={'fontSize':'20px'})
+                            ], style={"justifyContent": "center", "marginTop": "10px"})
                         ]),
                         className="shadow p-3 mb-4 rounded",
                         style={
@@ -371,7 +454,33 @@ layout = dmc.MantineProvider(
                                         variant="outline",
                                         style={"fontSize": "20px"}
                                     ),
+                                    dmc.Switch(
+                                        id="ftir-interp-switch",
+                                        label="Interpolate between scans",
+                                        checked=False,
+                                        size="md"
+                                    ),
+                                    dmc.Switch(
+                                        id="ftir-client-scrub",
+                                        label="Scrub spectra in the browser",
+                                        checked=False,
+                                        size="md"
+                                    ),
                                 ], style={"justifyContent": "center", "width": "100%"}),
+                                # Preprocesado del cubo completo
+                                dmc.Group([
+                                    dmc.Switch(id="ftir-absorbance", label="Absorbance", checked=False, size="md"),
+                                    dmc.Switch(id="ftir-background", label="Subtract background (first scans)",
+                                               checked=False, size="md"),
+                                    dmc.SegmentedControl(
+                                        id="ftir-baseline",
+                                        data=[{'value': 'none', 'label': 'No baseline'},
+                                              {'value': 'als', 'label': 'ALS baseline'},
+                                              {'value': 'poly', 'label': 'Polynomial baseline'}],
+                                        value='none',
+                                        size='xs'
+                                    ),
+                                ], style={"justifyContent": "center", "width": "100%", "marginTop": "1rem"}),
                                 dmc.Group(
                                     id="fixed-ftir-badges",
                                     style={
@@ -401,6 +510,67 @@ layout = dmc.MantineProvider(
                 ),
                 className='mt-4'
             ),
+
+            # Biblioteca local de referencias
+            dbc.Row(
+                dbc.Col(
+                    dbc.Card(
+                        dbc.CardBody([
+                            dmc.Group([
+                                html.H5("Reference library", className="mb-0", style={"color": "#333"}),
+                                dcc.Upload(
+                                    id='library-upload',
+                                    multiple=True,
+                                    accept='.jdx,.dx,.jcamp,.csv,.txt',
+                                    children=dmc.Button("Add references (JCAMP-DX / CSV)", variant='outline', size='xs'),
+                                ),
+                                html.Span(id='library-size', style={"color": "#555"}),
+                            ], style={"justifyContent": "space-between"}),
+                            dmc.Group([
+                                dmc.Select(id='library-source', data=[{'value': 'current', 'label': 'Current spectrum'}],
+                                           value='current', allowDeselect=False, size='xs', w=220),
+                                dmc.SegmentedControl(id='library-metric', data=list(METRICS), value='correlation', size='xs'),
+                                dmc.Button("Match spectrum", id='library-match-btn', size='xs'),
+                                dmc.Button("Match whole run", id='library-match-run-btn', size='xs', variant='outline'),
+                            ], style={"justifyContent": "center", "marginTop": "12px"}),
+                            html.Div(id='library-results', style={"marginTop": "12px"}),
+                        ]),
+                        className="shadow p-3 mb-4 rounded",
+                        style={
+                            "backgroundColor": "rgba(255,255,255,0.85)",
+                            "marginBottom": "40px"
+                        }
+                    ),
+                    width=12
+                )
+            ),
+
+            # Mapa del cubo completo (tiempo × número de onda)
+            dbc.Row(
+                dbc.Col(
+                    dbc.Card(
+                        dbc.CardBody([
+                            dmc.Group([
+                                html.H5("Spectral map", className="mb-0", style={"color": "#333"}),
+                                dmc.SegmentedControl(
+                                    id='ftir-map-mode',
+                                    data=[{'value': 'heatmap', 'label': 'Heatmap'},
+                                          {'value': 'surface', 'label': '3-D surface'}],
+                                    value='heatmap',
+                                    size='xs'
+                                ),
+                            ], style={"justifyContent": "space-between"}),
+                            dcc.Graph(id='ftir-map-graph', style={"height": "520px", "width": "100%"}),
+                        ]),
+                        className="shadow p-3 mb-4 rounded",
+                        style={
+                            "backgroundColor": "rgba(255,255,255,0.85)",
+                            "marginBottom": "40px"
+                        }
+                    ),
+                    width=12
+                )
+            ),
         ]),
 
         # ======= Chat =======
@@ -477,6 +647,14 @@ layout = dmc.MantineProvider(
     ])
 )
 
+
+def layout(**_kwargs):
+    """Layout con un session_id nuevo por vista de página (recargar = sesión nueva)."""
+    return html.Div([
+        dcc.Store(id='ega-session-id', data=uuid.uuid4().hex),
+        _page_layout,
+    ])
+
 # ======= Upload status & parsing =======
 @dash.callback(
     [
@@ -487,6 +665,7 @@ layout = dmc.MantineProvider(
         Output('tg-alert','children'),
         Output('gs-alert','children'),
         Output('ftir-alert','children'),
+        Output('ega-chunked-files','data'),
     ],
     [
         Input('upload-tg','contents'),
@@ -495,13 +674,17 @@ layout = dmc.MantineProvider(
         Input('upload-tg','filename'),
         Input('upload-gs','filename'),
         Input('upload-ftir','filename'),
+        Input('ega-chunked-upload','data'),
     ],
-    State('upload-status','data')
+    State('upload-status','data'),
+    State('ega-chunked-files','data'),
+    State('ega-session-id','data'),
 )
 def update_status(tg_contents, gs_contents, ftir_contents,
                   tg_filename, gs_filename, ftir_filename,
-                  current_status):
-    global tg, gs, ftir
+                  chunked_event, current_status, chunked_files, session_id):
+    if not session_id:
+        raise PreventUpdate
 
     ok_icon = html.I(className="fa-solid fa-circle-check", style={"color": "#000000", "fontSize": "26px"})
     ko_icon = html.I(className="fa-solid fa-arrow-up-from-bracket", style={"color": "#000000", "fontSize": "26px"})
@@ -529,13 +712,42 @@ def update_status(tg_contents, gs_contents, ftir_contents,
             style={"fontSize": "14px"}
         )
 
+    # Subidas por trozos: sólo llegan ids ya parseados en el servidor.
+    # Una subida normal posterior del mismo tipo sustituye a la de trozos.
+    trigger = ctx.triggered_id
+    chunked = dict(chunked_files or {})
+    chunk_errors = {}
+    if trigger == 'ega-chunked-upload' and chunked_event:
+        kind = str(chunked_event.get('kind', '')).replace('ega-', '')
+        for f in chunked_event.get('files', []):
+            chunked[kind] = {'id': f['id'], 'filename': f['filename']}
+        if chunked_event.get('errors'):
+            chunk_errors[kind] = "; ".join(chunked_event['errors'])
+    for kind in ('tg', 'gs', 'ftir'):
+        if trigger == f'upload-{kind}':
+            chunked.pop(kind, None)
+
+    def from_chunk(kind, lookup):
+        obj = lookup(chunked[kind]['id'])
+        if obj is None:
+            raise ValueError("upload expired from the server cache, please upload it again")
+        return obj, chunked[kind]['filename']
+
     # --- TG ---
     tg_alert = ""
-    if tg_contents:
+    if 'tg' in chunk_errors:
+        current_status['tg'] = False
+        tg_status = ko_icon
+        tg_alert = make_err_alert(chunk_errors['tg'])
+    elif tg_contents or 'tg' in chunked:
         try:
             current_status['tg'] = True
             tg_status = ok_icon
-            tg = pd.read_csv(decode_file(tg_contents, 'csv'), delimiter=',')
+            if 'tg' in chunked:
+                tg, tg_filename = from_chunk('tg', RUNS.get)
+            else:
+                tg = load_tg_run(decode_bytes(tg_contents), tg_filename or "TG")
+            WORKSPACES.attach(session_id, 'tg', tg)
             tg_alert = make_ok_alert(tg_filename or "TG file")
         except Exception as e:
             current_status['tg'] = False
@@ -546,11 +758,19 @@ def update_status(tg_contents, gs_contents, ftir_contents,
 
     # --- GS ---
     gs_alert = ""
-    if gs_contents:
+    if 'gs' in chunk_errors:
+        current_status['gs'] = False
+        gs_status = ko_icon
+        gs_alert = make_err_alert(chunk_errors['gs'])
+    elif gs_contents or 'gs' in chunked:
         try:
             current_status['gs'] = True
             gs_status = ok_icon
-            gs = pd.read_excel(decode_file(gs_contents, 'xlsx'), skiprows=4)
+            if 'gs' in chunked:
+                gs, gs_filename = from_chunk('gs', RUNS.get)
+            else:
+                gs = load_gs_run(decode_bytes(gs_contents), gs_filename or "GS")
+            WORKSPACES.attach(session_id, 'gs', gs)
             gs_alert = make_ok_alert(gs_filename or "GS file")
         except Exception as e:
             current_status['gs'] = False
@@ -561,15 +781,19 @@ def update_status(tg_contents, gs_contents, ftir_contents,
 
     # --- FTIR ---
     ftir_alert = ""
-    if ftir_contents:
+    if 'ftir' in chunk_errors:
+        current_status['ftir'] = False
+        ftir_status = ko_icon
+        ftir_alert = make_err_alert(chunk_errors['ftir'])
+    elif ftir_contents or 'ftir' in chunked:
         try:
             current_status['ftir'] = True
             ftir_status = ok_icon
-            ftir = pd.read_csv(decode_file(ftir_contents, 'csv'), delimiter=';')
-            ftir = ftir.dropna(axis=1, how='all')
-            ftir = ftir.dropna(axis=0, how='all')
-            for col in ftir.columns[0:]:
-                ftir[col] = ftir[col].astype(str).str.replace(',', '.').astype(float)
+            if 'ftir' in chunked:
+                ftir, ftir_filename = from_chunk('ftir', get_cube)
+            else:
+                ftir = load_ftir_cube(decode_bytes(ftir_contents))
+            WORKSPACES.attach(session_id, 'ftir', ftir)
             ftir_alert = make_ok_alert(ftir_filename or "FTIR file")
         except Exception as e:
             current_status['ftir'] = False
@@ -578,7 +802,7 @@ def update_status(tg_contents, gs_contents, ftir_contents,
     else:
         ftir_status = ko_icon
 
-    return tg_status, gs_status, ftir_status, current_status, tg_alert, gs_alert, ftir_alert
+    return tg_status, gs_status, ftir_status, current_status, tg_alert, gs_alert, ftir_alert, chunked
 
 
 # Mostrar/ocultar GS
@@ -593,114 +817,192 @@ def toggle_gs(n, show):
     return show, 'Add GS data'
 
 # ======= Charts update =======
+# Tres callbacks de "datos" (se recalculan sólo cuando cambian los datos, el
+# toggle de GS, los fijados o el zoom) y uno del marcador de tiempo que sólo
+# envía dash.Patch: x0/x1 de la línea roja, la 'y' del espectro y el texto.
+
+def _ready(status) -> bool:
+    """TG y FTIR cargados (el GS es opcional: si falta, se calcula del cubo)."""
+    return bool(status) and bool(status.get('tg')) and bool(status.get('ftir'))
+
+
+def _preprocessing(session_id) -> dict:
+    """Parámetros de preprocesado de la sesión (kwargs de preprocess_cube)."""
+    return WORKSPACES.get(session_id).get('preprocessing') or {}
+
+
+def _intensity_title(session_id) -> str:
+    return "Absorbance" if _preprocessing(session_id).get('absorbance') else "Transmittance (%)"
+
+
+def _resolve_session_data(session_id):
+    """
+    (tg, gs, cube) de la sesión, o None si falta TG o FTIR (expirado/expulsado).
+    El cubo sale ya preprocesado; el GS calculado usa siempre el cubo original.
+    """
+    tg = WORKSPACES.resolve(session_id, 'tg')
+    ftir = WORKSPACES.resolve(session_id, 'ftir')
+    if tg is None or ftir is None:
+        return None
+    gs = WORKSPACES.resolve(session_id, 'gs')
+    if gs is None:
+        gs = gram_schmidt_run(ftir)
+    return tg, gs, preprocess_cube(ftir, **_preprocessing(session_id))
+
+
+def _clamp_time(gs: TGRun, selected_time) -> float:
+    """Tiempo seleccionado dentro del rango del GS (por defecto, el inicio)."""
+    time_gs = gs[gs.column_names()[0]]
+    t_min, t_max = float(np.nanmin(time_gs)), float(np.nanmax(time_gs))
+    if selected_time is None:
+        return t_min
+    return float(np.clip(float(selected_time), t_min, t_max))
+
+
+def _make_pin(cube: FtirCube, selected_time: float, interpolate: bool, label: str, color: str) -> dict:
+    """Referencia a un espectro del cubo (no sus valores): id, índice, color y etiqueta."""
+    pin = {"cube_id": cube.cube_id, "index": cube.nearest_index(selected_time), "color": color, "label": label}
+    if interpolate:
+        pin["time"] = float(selected_time)   # espectro interpolado: se recalcula en ese instante
+    return pin
+
+
+def _resolve_pins(pins, preprocessing=None):
+    """
+    (wavenumbers, espectro, pin) de cada fijado cuyo cubo sigue en caché. Los
+    fijados apuntan al cubo original y se les aplica el preprocesado actual,
+    así que comparten unidades con el espectro mostrado.
+    """
+    out = []
+    for pin in pins or []:
+        cube = get_cube(pin.get("cube_id"))
+        if cube is None:
+            continue   # cubo expulsado/expirado: el fijado deja de dibujarse
+        cube = preprocess_cube(cube, **(preprocessing or {}))
+        if "time" in pin:
+            spectrum, _ = cube.spectrum_at(pin["time"], interpolate=True)
+        else:
+            spectrum = cube.spectrum(int(np.clip(pin["index"], 0, cube.n_spectra - 1)))
+        out.append((cube.wavenumbers, spectrum, pin))
+    return out
+
+
+def _time_selection(tg: TGRun, cube: FtirCube, selected_time: float, interpolate: bool):
+    """Espectro FTIR en el tiempo seleccionado, su tiempo real y el texto informativo."""
+    spectrum, closest_time = cube.spectrum_at(selected_time, interpolate=bool(interpolate))
+    tg_cols = tg.column_names()
+    temp_interp = float(np.interp(selected_time, tg[tg_cols[0]] * 60.0, tg[tg_cols[4]]))
+    ftir_label = "Interpolated FTIR time" if interpolate else "Closest FTIR time"
+    info = f"Selected time (GS): {selected_time:.1f}s | {ftir_label}: {closest_time:.1f}s | Interpolated temperature (TG): {temp_interp:.1f}°C"
+    return spectrum, closest_time, info
+
+
+def _selected_bands(presets, selection):
+    """[(etiqueta, lo, hi)] de los presets marcados + la banda elegida con caja."""
+    bands = [(name, *BAND_PRESETS[name]) for name in presets or [] if name in BAND_PRESETS]
+    if selection:
+        lo, hi = selection["lo"], selection["hi"]
+        bands.append((f"{lo:.0f}–{hi:.0f} cm⁻¹", lo, hi))
+    return bands
+
+
+def _band_profiles(tg: TGRun, cube: FtirCube, bands, absorbance: bool = False):
+    """
+    [(etiqueta, temperatura, perfil 0–100 %)] de cada banda: el tiempo de cada
+    espectro se pasa a temperatura con la TG (fuera de su rango se descarta).
+    En transmitancia una banda de absorción es un valle, así que el perfil es
+    el área bajo la línea base; en absorbancia, el área sobre ella.
+    """
+    tg_cols = tg.column_names()
+    tg_time = tg[tg_cols[0]] * 60.0
+    inside = (cube.times >= np.nanmin(tg_time)) & (cube.times <= np.nanmax(tg_time))
+    if not inside.any():
+        return []
+    temps = np.interp(cube.times[inside], tg_time, tg[tg_cols[4]])
+    out = []
+    for label, lo, hi in bands:
+        profile = band_profile(cube, lo, hi)
+        if profile is None:
+            continue
+        profile = profile[inside] if absorbance else -profile[inside]
+        span = float(profile.max() - profile.min())
+        norm = 100.0 * (profile - profile.min()) / span if span > 0 else np.zeros_like(profile)
+        out.append((label, temps, norm))
+    return out
+
+
 @dash.callback(
-    [
-        Output('chart-container','style'),
-        Output('mass-temp-chart','figure'),
-        Output('time-temp-chart','figure'),
-        Output('ftir-graph','figure'),
-        Output('initial-mass-badge','children'),
-        Output('info-button','children'),
-        Output('manual-time-input', 'value'),
-    ],
-    [
-        Input('upload-status','data'),
-        Input('show-gs-store','data'),
-        Input('time-temp-chart','relayoutData'),
-        Input('manual-time-input', 'value'),
-        Input('fixed-ftir-list','data')
-    ],
+    Output('chart-container','style'),
+    Output('mass-temp-chart','figure'),
+    Output('initial-mass-badge','children'),
+    Input('upload-status','data'),
+    Input('mass-temp-chart-viewport', 'data'),
+    Input('ega-band-presets', 'value'),
+    Input('ega-band-selection', 'data'),
+    State('ega-session-id', 'data'),
 )
-def update_charts(status, show_gs, relayout_data, manual_time, fixed_ftir_list):
-    if not status or not all(status.values()):
-        return {'display':'none'}, {}, {}, {}, '', '', None
+def update_tg_chart(status, mass_viewport=None, band_presets=None, band_selection=None, session_id=None):
+    """TG% + DTG frente a temperatura (+ perfiles de bandas): depende de los datos, las bandas y el zoom."""
+    if not _ready(status):
+        return {'display':'none'}, {}, ''
+    data = _resolve_session_data(session_id)
+    if data is None:
+        # sesión expirada o expulsada de la caché: hay que volver a subir
+        return {'display':'none'}, {}, ''
+    tg, _, cube = data
 
     # ---------- TG ----------
-    time_tg = tg.iloc[:, 0] * 60.0
-    masa_loss = tg.iloc[:, 1]
-    sample_temp = tg.iloc[:, 4]
-    prog_temp  = tg.iloc[:, 3]
-
-    # ---------- GS ----------
-    time_gs = gs.iloc[:, 0].astype(float)
-    trans_gs = gs.iloc[:, 1].astype(float)
-    df_gs = pd.DataFrame({'Time (s)': time_gs, 'Signal': trans_gs})
-
-    # ---------- FTIR robusto (SIN absorbancia) ----------
-    # Transponer: tiempos pasan a filas
-    df_ftir = ftir.T.copy()
-    df_ftir.columns = df_ftir.iloc[0]    # primera fila -> cabecera (nº de onda)
-    df_ftir = df_ftir.iloc[1:]
-    df_ftir.reset_index(inplace=True)
-    df_ftir.rename(columns={df_ftir.columns[0]: 'Time (s)'}, inplace=True)
-
-    # "Time (s)" puede venir con coma decimal aunque ya leíste el CSV a float; por si acaso:
-    df_ftir['Time (s)'] = (
-        df_ftir['Time (s)'].astype(str).str.replace(',', '.', regex=False).astype(float)
-    )
+    tg_cols = tg.column_names()
+    masa_loss = tg[tg_cols[1]]
+    sample_temp = tg[tg_cols[4]]
 
-    # Detecta columnas de número de onda:
-    kept_cols = []     # nombres EXACTOS (pueden ser float, int o str) que existen en df_ftir
-    wavelengths = []   # sus valores numéricos como float, mismo orden que kept_cols
-    for c in list(df_ftir.columns[1:]):  # todas salvo "Time (s)"
-        if isinstance(c, (int, float, np.number)):
-            kept_cols.append(c)
-            wavelengths.append(float(c))
-        else:
-            s = str(c).strip().replace(',', '.')
-            try:
-                val = float(s)
-                kept_cols.append(c)   # usamos el label original para indexar SIN KeyError
-                wavelengths.append(val)
-            except Exception:
-                # columna no numérica -> la ignoramos
-                pass
-
-    # Si hay columnas numéricas, nos quedamos sólo con ellas (evita KeyError por casteos)
-    if kept_cols:
-        df_ftir = df_ftir[['Time (s)'] + kept_cols]
-        wavelengths = np.asarray(wavelengths, dtype=float)
-    else:
-        # Fallback imposible en archivos correctos: usamos todas tal cual y X incremental
-        kept_cols = list(df_ftir.columns[1:])
-        wavelengths = np.arange(len(kept_cols), dtype=float)
-
-    # ---------- TG normalizada + DTG ----------
-    init_mass = float(masa_loss.max())
-    fin_mass  = float(masa_loss.min())
-    if (init_mass - fin_mass) != 0:
-        norm_mass = 100.0 * (masa_loss - fin_mass) / (init_mass - fin_mass)
-    else:
-        norm_mass = np.zeros_like(masa_loss)
-
-    _, deriv = calc_smooth_derivative(sample_temp, norm_mass)
-    if (np.max(deriv) - np.min(deriv)) != 0:
-        deriv_norm = 100.0 * (deriv - np.min(deriv)) / (np.max(deriv) - np.min(deriv))
-    else:
-        deriv_norm = np.zeros_like(deriv)
+    # ---------- TG normalizada + DTG (memorizadas por run_id) ----------
+    init_mass = float(np.nanmax(masa_loss))
+    derived = tg_dtg(tg, tg_cols[4], tg_cols[1], normalization="range")
+    norm_mass = derived.norm_mass
+    deriv_norm = derived.deriv_norm
 
     # Crear figura
     fig1 = go.Figure()
 
     # TG en eje primario (izquierda)
-    fig1.add_trace(go.Scatter(
-        x=sample_temp, y=norm_mass,
+    x_tg, y_tg = decimate(sample_temp, norm_mass, viewport=mass_viewport)
+    x_dtg, y_dtg = decimate(sample_temp, deriv_norm, viewport=mass_viewport)
+    profiles = [(label, *decimate(temps, norm, viewport=mass_viewport))
+                for label, temps, norm in _band_profiles(tg, cube, _selected_bands(band_presets, band_selection),
+                                                            bool(_preprocessing(session_id).get('absorbance')))]
+    webgl = use_webgl(count_points([x_tg, x_dtg] + [x for _, x, _ in profiles]))
+    fig1.add_trace(line_trace(
+        webgl,
+        x=x_tg, y=y_tg,
         mode='lines', name='TG (%)',
         line=dict(color='red'),
         yaxis="y1"
     ))
 
     # DTG en eje secundario (derecha)
-    fig1.add_trace(go.Scatter(
-        x=sample_temp, y=deriv_norm,
+    fig1.add_trace(line_trace(
+        webgl,
+        x=x_dtg, y=y_dtg,
         mode='lines', name='d(TG)/dT (normalizado)',
         line=dict(color='blue'),
         yaxis="y2"
     ))
 
+    # Perfiles de bandas (0–100 %) en el eje de la DTG normalizada
+    for i, (label, x_band, y_band) in enumerate(profiles):
+        fig1.add_trace(line_trace(
+            webgl,
+            x=x_band, y=y_band,
+            mode='lines', name=label,
+            line=dict(color=PLOTLY_COLORS[(i + 2) % len(PLOTLY_COLORS)], dash='dash'),
+            yaxis="y2"
+        ))
+
     # Configurar layout con doble eje
     fig1.update_layout(
-        showlegend=False, #legend=dict(orientation="h", yanchor="bottom", y=-0.35, xanchor="center", x=0.5),
+        showlegend=bool(profiles),
+        legend=dict(orientation="h", yanchor="top", y=1, xanchor="right", x=1, bgcolor='rgba(255,255,255,0.6)'),
         xaxis=dict(
             title='Temperature (°C)',
             title_font_size=20,
@@ -726,25 +1028,47 @@ def update_charts(status, show_gs, relayout_data, manual_time, fixed_ftir_list):
         plot_bgcolor='rgba(0,0,0,0)',
         paper_bgcolor='rgba(0,0,0,0)',
         margin=dict(l=20, r=20, t=10, b=70),
-        font_family="Segoe UI, system-ui"
+        font_family="Segoe UI, system-ui",
+        uirevision="ega-mass-temp",  # conserva el zoom al redibujar
     )
 
+    badge_text = f"Initial mass: {init_mass:.2f} mg"
+    return {'display':'block'}, fig1, badge_text
 
-    # ---------- Selección de tiempo ----------
-    if ctx.triggered_id == "manual-time-input" and manual_time is not None:
-        selected_time = float(manual_time)
-    elif ctx.triggered_id == "time-temp-chart" and relayout_data and ('shapes[0].x0' in relayout_data or 'shapes[0].x1' in relayout_data):
-        selected_time = relayout_data.get('shapes[0].x0', relayout_data.get('shapes[0].x1'))
-    elif manual_time is not None:
-        selected_time = float(manual_time)
-    else:
-        selected_time = float(df_gs['Time (s)'].min())
-    selected_time = float(np.clip(selected_time, df_gs['Time (s)'].min(), df_gs['Time (s)'].max()))
+
+@dash.callback(
+    Output('time-temp-chart','figure'),
+    Input('upload-status','data'),
+    Input('show-gs-store','data'),
+    Input('time-temp-chart-viewport', 'data'),
+    State('selected-time-store', 'data'),
+    State('ega-session-id', 'data'),
+)
+def update_time_chart(status, show_gs, time_viewport=None, selected_time=None, session_id=None):
+    """Temperatura/tiempo (+ GS opcional) con la línea roja del tiempo seleccionado."""
+    if not _ready(status):
+        return {}
+    data = _resolve_session_data(session_id)
+    if data is None:
+        return {}
+    tg, gs, _cube = data
+
+    tg_cols = tg.column_names()
+    time_tg = tg[tg_cols[0]] * 60.0
+    prog_temp = tg[tg_cols[3]]
+    gs_cols = gs.column_names()
+    time_gs = gs[gs_cols[0]]
+    trans_gs = gs[gs_cols[1]]
+    selected_time = _clamp_time(gs, selected_time)
 
     # ---------- Temp/Time + GS + línea roja ----------
-    traces = [go.Scatter(x=time_tg, y=prog_temp, mode='lines', name='TG Temp', line=dict(color='#006400'))]
+    x_prog, y_prog = decimate(time_tg, prog_temp, viewport=time_viewport)
+    x_gs, y_gs = decimate(time_gs, trans_gs, viewport=time_viewport) if show_gs else ([], [])
+    # la línea roja es una forma del layout: funciona igual con Scatter y Scattergl
+    webgl = use_webgl(count_points((x_prog, x_gs)))
+    traces = [line_trace(webgl, x=x_prog, y=y_prog, mode='lines', name='TG Temp', line=dict(color='#006400'))]
     if show_gs:
-        traces.append(go.Scatter(x=time_gs, y=trans_gs, mode='lines', name='GS Signal', line=dict(color='#00008B'), yaxis='y2'))
+        traces.append(line_trace(webgl, x=x_gs, y=y_gs, mode='lines', name='GS Signal', line=dict(color='#00008B'), yaxis='y2'))
     fig2 = go.Figure(data=traces)
     fig2.add_shape(type='line', x0=selected_time, x1=selected_time, y0=0, y1=1,
                    xref='x', yref='paper', line=dict(color='red', width=2), editable=True)
@@ -755,7 +1079,9 @@ def update_charts(status, show_gs, relayout_data, manual_time, fixed_ftir_list):
         plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
         legend=dict(orientation="h", yanchor="bottom", y=-0.35, xanchor="center", x=0.5),
         margin=dict(l=60, r=20, t=10, b=70),
-        font_family="Segoe UI, system-ui"
+        font_family="Segoe UI, system-ui",
+        uirevision="ega-time-temp",
+        editrevision=f"{selected_time:.6g}",  # la línea sigue al tiempo seleccionado
     )
     if show_gs:
         layout2['yaxis2'] = dict(
@@ -769,39 +1095,315 @@ def update_charts(status, show_gs, relayout_data, manual_time, fixed_ftir_list):
             title_font=dict(family="Segoe UI, system-ui")
         )
     fig2.update_layout(**layout2, title="", title_text="")
+    return fig2
 
-    # ---------- FTIR: espectro más cercano ----------
-    closest_idx  = (df_ftir['Time (s)'] - selected_time).abs().argmin()
-    closest_time = float(df_ftir['Time (s)'].iloc[closest_idx])
-    row_data     = df_ftir.iloc[closest_idx]
-
-    # Usa los labels originales (kept_cols) y el eje numérico (wavelengths)
-    spectrum = row_data.loc[kept_cols].astype(float).to_numpy()
 
+@dash.callback(
+    Output('ftir-graph','figure'),
+    Output('info-button','children'),
+    Output('selected-time-store', 'data'),
+    Output('manual-time-input', 'value'),
+    Input('upload-status','data'),
+    Input('fixed-ftir-list','data'),
+    Input('ftir-interp-switch', 'checked'),
+    Input('ega-band-selection', 'data'),
+    State('selected-time-store', 'data'),
+    State('ega-session-id', 'data'),
+    State('manual-time-input', 'value'),
+)
+def update_ftir_chart(status, fixed_ftir_list, interpolate=False, band_selection=None, selected_time=None, session_id=None,
+                      manual_time=None):
+    """Espectro FTIR en el tiempo seleccionado + espectros fijados (resueltos desde la caché)."""
+    if not _ready(status):
+        return {}, '', None, None
+    data = _resolve_session_data(session_id)
+    if data is None:
+        return {}, '', None, None
+    tg, gs, cube = data
+    selected_time = _clamp_time(gs, selected_time)
+
+    # ---------- FTIR: espectro más cercano (o interpolado) ----------
+    spectrum, closest_time, btn_txt = _time_selection(tg, cube, selected_time, interpolate)
+
+    pinned = _resolve_pins(fixed_ftir_list, _preprocessing(session_id))
+    webgl = use_webgl(len(spectrum) + count_points(y for _, y, _ in pinned))
     fig_ftir = go.Figure()
-    fig_ftir.add_trace(go.Scatter(
-        x=wavelengths, y=spectrum, mode='lines',
+    fig_ftir.add_trace(line_trace(
+        webgl,
+        x=typed_array(cube.wavenumbers), y=typed_array(spectrum), mode='lines',
         name=f'Espectro a {closest_time:.1f}s', line=dict(color='#333')
     ))
 
-    # Fijados (como antes)
-    if fixed_ftir_list:
-        for i, f in enumerate(fixed_ftir_list):
-            fig_ftir.add_trace(go.Scatter(
-                x=f["x"], y=f["y"], mode='lines',
-                name=f'Fijado {i+1}', line=dict(color=f["color"], width=2)
-            ))
+    # Fijados
+    for i, (x, y, pin) in enumerate(pinned):
+        fig_ftir.add_trace(line_trace(
+            webgl,
+            x=typed_array(x), y=typed_array(y), mode='lines',
+            name=f'Fijado {i+1}', line=dict(color=pin["color"], width=2)
+        ))
 
     fig_ftir.update_xaxes(title="Wavenumber (cm⁻¹)", autorange='reversed', showgrid=True, gridcolor='#ccc', showline=True, linecolor='#999')
-    fig_ftir.update_yaxes(title="Transmittance (%)", showgrid=True, gridcolor='#ccc', showline=True, linecolor='#999')
-    fig_ftir.update_layout(plot_bgcolor='white', paper_bgcolor='white', showlegend=False, margin=dict(l=60, r=20, t=10, b=70), font_family="Segoe UI, system-ui")
+    fig_ftir.update_yaxes(title=_intensity_title(session_id), showgrid=True, gridcolor='#ccc', showline=True, linecolor='#999')
+    fig_ftir.update_layout(plot_bgcolor='white', paper_bgcolor='white', showlegend=False, margin=dict(l=60, r=20, t=10, b=70), font_family="Segoe UI, system-ui",
+                           modebar_add=['select2d'], selectdirection='h')
+    if band_selection:
+        fig_ftir.add_vrect(x0=band_selection["lo"], x1=band_selection["hi"], fillcolor='#FFA15A', opacity=0.2, line_width=0)
+
+    return fig_ftir, btn_txt, selected_time, _manual_echo(manual_time, selected_time)
+
+
+def _manual_echo(manual_time, selected_time):
+    """
+    Valor para 'manual-time-input', o no_update si ya muestra ese tiempo: cada
+    escritura dispara move_time_marker y sería otra petición al servidor.
+    """
+    value = round(selected_time, 2)
+    if manual_time is not None and round(float(manual_time), 2) == value:
+        return dash.no_update
+    return value
+
+
+def _band_from_events(selected_data, relayout_data, current):
+    """
+    Banda {lo, hi} de una selección por caja en el FTIR. Plotly la comunica en
+    selectedData['range'] o, al mover/editar la caja, en relayoutData['selections'].
+    Deseleccionar (doble clic) la borra.
+    """
+    if ctx.triggered_id is None:
+        raise PreventUpdate
+    prop = ctx.triggered[0]["prop_id"].rsplit(".", 1)[-1]
+    if prop == "selectedData":
+        x = ((selected_data or {}).get("range") or {}).get("x")
+        return {"lo": float(min(x)), "hi": float(max(x))} if x else None
+    relayout_data = relayout_data or {}
+    if "selections" in relayout_data:
+        boxes = [b for b in relayout_data["selections"] or [] if "x0" in b and "x1" in b]
+        if not boxes:
+            return None
+        x0, x1 = boxes[-1]["x0"], boxes[-1]["x1"]
+    elif "selections[0].x0" in relayout_data or "selections[0].x1" in relayout_data:
+        x0 = relayout_data.get("selections[0].x0", (current or {}).get("lo"))
+        x1 = relayout_data.get("selections[0].x1", (current or {}).get("hi"))
+        if x0 is None or x1 is None:
+            raise PreventUpdate
+    else:
+        raise PreventUpdate
+    return {"lo": float(min(x0, x1)), "hi": float(max(x0, x1))}
+
+
+@dash.callback(
+    Output('ega-band-selection', 'data'),
+    Input('ftir-graph', 'selectedData'),
+    Input('ftir-graph', 'relayoutData'),
+    State('ega-band-selection', 'data'),
+    prevent_initial_call=True,
+)
+def update_band_selection(selected_data, relayout_data, current):
+    """Guarda la banda seleccionada por caja en el espectro (sólo sus bordes)."""
+    band = _band_from_events(selected_data, relayout_data, current)
+    if band == current:
+        raise PreventUpdate
+    return band
 
-    # ---------- Info / badge ----------
-    badge_text = f"Initial mass: {init_mass:.2f} mg"
-    temp_interp = float(np.interp(selected_time, time_tg, sample_temp))
-    btn_txt = f"Selected time (GS): {selected_time:.1f}s | Closest FTIR time: {closest_time:.1f}s | Interpolated temperature (TG): {temp_interp:.1f}°C"
 
-    return {'display':'block'}, fig1, fig2, fig_ftir, badge_text, btn_txt, round(selected_time, 2)
+@dash.callback(
+    Output('time-temp-chart','figure', allow_duplicate=True),
+    Output('ftir-graph','figure', allow_duplicate=True),
+    Output('info-button','children', allow_duplicate=True),
+    Output('selected-time-store', 'data', allow_duplicate=True),
+    Output('manual-time-input', 'value', allow_duplicate=True),
+    Input('time-temp-chart','relayoutData'),
+    Input('manual-time-input', 'value'),
+    State('upload-status','data'),
+    State('ftir-interp-switch', 'checked'),
+    State('selected-time-store', 'data'),
+    State('ftir-client-ready', 'data'),
+    State('ega-session-id', 'data'),
+    prevent_initial_call=True,
+)
+def move_time_marker(relayout_data, manual_time, status, interpolate=False, current_time=None,
+                     client_ready=None, session_id=None):
+    """Mover la línea roja: sólo se parchean la forma, la 'y' del espectro y el texto."""
+    if not _ready(status):
+        raise PreventUpdate
+    if client_ready:
+        # modo scrub: lo resuelve el navegador (assets/ftir_scrub.js)
+        raise PreventUpdate
+    if ctx.triggered_id == "manual-time-input":
+        if manual_time is None:
+            raise PreventUpdate
+        if current_time is not None and round(float(manual_time), 2) == round(current_time, 2):
+            # eco del propio tiempo seleccionado: nada que mover
+            raise PreventUpdate
+        selected_time = float(manual_time)
+    elif relayout_data and ('shapes[0].x0' in relayout_data or 'shapes[0].x1' in relayout_data):
+        selected_time = relayout_data.get('shapes[0].x0', relayout_data.get('shapes[0].x1'))
+    else:
+        # zoom/pan: lo atiende el Store del visor
+        raise PreventUpdate
+    data = _resolve_session_data(session_id)
+    if data is None:
+        raise PreventUpdate
+    tg, gs, cube = data
+    selected_time = _clamp_time(gs, selected_time)
+    if current_time is not None and selected_time == current_time:
+        raise PreventUpdate
+
+    spectrum, closest_time, btn_txt = _time_selection(tg, cube, selected_time, interpolate)
+
+    time_patch = dash.Patch()
+    time_patch["layout"]["shapes"][0]["x0"] = selected_time
+    time_patch["layout"]["shapes"][0]["x1"] = selected_time
+    time_patch["layout"]["editrevision"] = f"{selected_time:.6g}"
+
+    ftir_patch = dash.Patch()
+    ftir_patch["data"][0]["y"] = typed_array(spectrum)
+    ftir_patch["data"][0]["name"] = f'Espectro a {closest_time:.1f}s'
+
+    return time_patch, ftir_patch, btn_txt, selected_time, _manual_echo(manual_time, selected_time)
+
+
+# ======= Preprocesado del cubo (absorbancia, fondo, línea base) =======
+@dash.callback(
+    Output('upload-status', 'data', allow_duplicate=True),
+    Input('ftir-absorbance', 'checked'),
+    Input('ftir-background', 'checked'),
+    Input('ftir-baseline', 'value'),
+    State('upload-status', 'data'),
+    State('ega-session-id', 'data'),
+    prevent_initial_call=True,
+)
+def set_preprocessing(absorbance, background, baseline, status, session_id=None):
+    """Guarda los parámetros en la sesión y cambia upload-status para redibujar todo."""
+    if not session_id:
+        raise PreventUpdate
+    params = {
+        'absorbance': bool(absorbance),
+        'background_scans': DEFAULT_BACKGROUND_SCANS if background else 0,
+        'baseline': baseline or 'none',
+    }
+    if params == _preprocessing(session_id):
+        raise PreventUpdate
+    WORKSPACES.update(session_id, preprocessing=params)
+    return {**(status or {}), 'pp': f"{int(params['absorbance'])}{params['background_scans']}{params['baseline']}"}
+
+
+# ======= Modo scrub: el cubo se envía una vez y el navegador dibuja =======
+@dash.callback(
+    Output('ftir-client-cube', 'data'),
+    Output('ftir-client-scrub', 'description'),
+    Input('ftir-client-scrub', 'checked'),
+    Input('upload-status', 'data'),
+    State('ega-session-id', 'data'),
+)
+def ship_client_cube(enabled, status, session_id=None):
+    """Payload comprimido del cubo si el modo está activo y el cubo cabe en el límite."""
+    if not enabled or not _ready(status):
+        return None, None
+    data = _resolve_session_data(session_id)
+    if data is None:
+        return None, None
+    tg, gs, cube = data
+    size = client_cube_nbytes(cube)
+    if size > CLIENT_CUBE_MAX_BYTES:
+        return None, (f"Cube too large for browser mode ({size / 1024 ** 2:.0f} MB > "
+                      f"{CLIENT_CUBE_MAX_BYTES / 1024 ** 2:.0f} MB); using the server")
+    tg_cols = tg.column_names()
+    time_gs = gs[gs.column_names()[0]]
+    payload = encode_cube_payload(cube, extra={
+        "tg_time": b64_array(tg[tg_cols[0]] * 60.0),
+        "tg_temp": b64_array(tg[tg_cols[4]]),
+        "time_min": float(np.nanmin(time_gs)),
+        "time_max": float(np.nanmax(time_gs)),
+    })
+    return payload, None
+
+
+# ======= Visor (zoom) de las gráficas decimadas =======
+def _register_viewport_callback(graph_id: str) -> None:
+    @dash.callback(
+        Output(f'{graph_id}-viewport', 'data'),
+        Input(graph_id, 'relayoutData'),
+        State(f'{graph_id}-viewport', 'data'),
+        prevent_initial_call=True,
+    )
+    def update_viewport(relayout_data, current):
+        viewport = viewport_from_relayout(relayout_data, current)
+        if viewport == current:
+            raise PreventUpdate
+        return viewport
+
+
+for _graph_id in ('mass-temp-chart', 'time-temp-chart'):
+    _register_viewport_callback(_graph_id)
+
+
+# ======= Mapa del cubo (heatmap / superficie 3-D) =======
+# Nunca se envía el cubo: sólo ~una pantalla de teselas (engine/tiles.py).
+# El heatmap se re-agrega con el zoom; la superficie usa siempre el cubo entero.
+@dash.callback(
+    Output('ftir-map-viewport', 'data'),
+    Input('ftir-map-graph', 'relayoutData'),
+    State('ftir-map-viewport', 'data'),
+    prevent_initial_call=True,
+)
+def update_map_viewport(relayout_data, current):
+    current = current or {"x": None, "y": None}
+    viewport = {
+        "x": viewport_from_relayout(relayout_data, current.get("x"), axis="xaxis"),
+        "y": viewport_from_relayout(relayout_data, current.get("y"), axis="yaxis"),
+    }
+    if viewport == current:
+        raise PreventUpdate
+    return viewport
+
+
+@dash.callback(
+    Output('ftir-map-graph', 'figure'),
+    Input('upload-status', 'data'),
+    Input('ftir-map-mode', 'value'),
+    Input('ftir-map-viewport', 'data'),
+    State('ega-session-id', 'data'),
+)
+def update_ftir_map(status, mode='heatmap', viewport=None, session_id=None):
+    """Cubo completo como mapa tiempo × número de onda, agregado por teselas."""
+    if not _ready(status):
+        return {}
+    data = _resolve_session_data(session_id)
+    if data is None:
+        return {}
+    cube = data[2]
+    intensity = _intensity_title(session_id)
+
+    fig = go.Figure()
+    if mode == 'surface':
+        tiles = cube_tiles(cube, shape=SURFACE_TILES)
+        fig.add_trace(go.Surface(
+            x=typed_array(tiles.wavenumbers), y=typed_array(tiles.times), z=typed_array(tiles.z),
+            colorscale='Viridis', colorbar=dict(title=intensity)
+        ))
+        fig.update_layout(scene=dict(
+            xaxis=dict(title='Wavenumber (cm⁻¹)', autorange='reversed'),
+            yaxis=dict(title='Time (s)'),
+            zaxis=dict(title=intensity),
+        ))
+    else:
+        viewport = viewport or {}
+        # visor de otro cubo (o fuera de rango) → mapa completo
+        tiles = cube_tiles(cube, viewport.get("y"), viewport.get("x"), shape=MAP_TILES) or cube_tiles(cube)
+        fig.add_trace(go.Heatmap(
+            x=typed_array(tiles.wavenumbers), y=typed_array(tiles.times), z=typed_array(tiles.z),
+            colorscale='Viridis', colorbar=dict(title=intensity)
+        ))
+        fig.update_xaxes(title="Wavenumber (cm⁻¹)", autorange='reversed', showline=True, linecolor='#999')
+        fig.update_yaxes(title="Time (s)", showline=True, linecolor='#999')
+
+    fig.update_layout(
+        plot_bgcolor='white', paper_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=60, r=20, t=10, b=60), font_family="Segoe UI, system-ui",
+        uirevision=f"ega-map-{mode}",   # conserva zoom/cámara al re-agregar
+    )
+    return fig
 
 
 # ======= Refresh (clientside) =======
@@ -820,6 +1422,51 @@ if _app is not None:
         DOutput('refresh-btn', 'n_clicks'),
         DInput('refresh-btn', 'n_clicks')
     )
+    # Subida por trozos (assets/chunked_upload.js), una por tipo de fichero
+    for _kind, _accept in (('tg', '.csv,.txt'), ('gs', '.xls,.xlsx'), ('ftir', '.csv,.txt')):
+        _app.clientside_callback(
+            f"""
+            function(n_clicks) {{
+                return window.dash_clientside.chunked_upload.pick(
+                    n_clicks, "ega-{_kind}", false, "{_accept}",
+                    "ega-chunked-upload", "chunked-progress-ega");
+            }}
+            """,
+            DOutput(f'chunked-btn-{_kind}', 'n_clicks'),
+            DInput(f'chunked-btn-{_kind}', 'n_clicks'),
+            prevent_initial_call=True
+        )
+    # Modo scrub (assets/ftir_scrub.js): decodificar el cubo y dibujar en cliente
+    _app.clientside_callback(
+        """
+        function(payload) {
+            return window.dash_clientside.ftir_scrub.decode(payload, "ftir-client-ready");
+        }
+        """,
+        DOutput('ftir-client-ready', 'data'),
+        DInput('ftir-client-cube', 'data')
+    )
+    _app.clientside_callback(
+        """
+        function(hoverData, relayoutData, manualTime, ready, interpolate, ftirFig, timeFig) {
+            return window.dash_clientside.ftir_scrub.scrub(
+                hoverData, relayoutData, manualTime, ready, interpolate, ftirFig, timeFig);
+        }
+        """,
+        DOutput('time-temp-chart', 'figure', allow_duplicate=True),
+        DOutput('ftir-graph', 'figure', allow_duplicate=True),
+        DOutput('info-button', 'children', allow_duplicate=True),
+        DOutput('selected-time-store', 'data', allow_duplicate=True),
+        DOutput('manual-time-input', 'value', allow_duplicate=True),
+        DInput('time-temp-chart', 'hoverData'),
+        DInput('time-temp-chart', 'relayoutData'),
+        DInput('manual-time-input', 'value'),
+        State('ftir-client-ready', 'data'),
+        State('ftir-interp-switch', 'checked'),
+        State('ftir-graph', 'figure'),
+        State('time-temp-chart', 'figure'),
+        prevent_initial_call=True
+    )
 
 # ======= Walkthrough: inyecta contents en los Uploads =======
 @dash.callback(
@@ -851,22 +1498,26 @@ def ega_walkthrough(n):
     Input('fix-ftir-btn', 'n_clicks'),
     Input({'type': 'remove-fixed-ftir', 'index': dash.ALL}, 'n_clicks'),
     State('fixed-ftir-list', 'data'),
-    State('ftir-graph', 'figure'),
+    State('selected-time-store', 'data'),
+    State('ftir-interp-switch', 'checked'),
     State('info-button', 'children'),
+    State('ega-session-id', 'data'),
     prevent_initial_call=True
 )
-def manage_fixed_ftir_list(add_clicks, remove_clicks, fixed_list, fig, info_text):
+def manage_fixed_ftir_list(add_clicks, remove_clicks, fixed_list, selected_time, interpolate, info_text, session_id=None):
     triggered_id = ctx.triggered_id
     if not triggered_id:
         raise PreventUpdate
+    fixed_list = fixed_list or []
 
     if triggered_id == 'fix-ftir-btn':
-        if fig is None or not fig.get('data'):
+        # sólo la referencia (cubo original + índice); el espectro se lee de la caché
+        # y se preprocesa al dibujar
+        cube = WORKSPACES.resolve(session_id, 'ftir')
+        if cube is None or selected_time is None:
             raise PreventUpdate
-        current_trace = fig['data'][0]
         color = PLOTLY_COLORS[len(fixed_list) % len(PLOTLY_COLORS)]
-        new_fixed_item = {"x": current_trace['x'], "y": current_trace['y'], "label": info_text, "color": color}
-        return fixed_list + [new_fixed_item]
+        return fixed_list + [_make_pin(cube, float(selected_time), bool(interpolate), info_text, color)]
 
     if isinstance(triggered_id, dict) and triggered_id.get('type') == 'remove-fixed-ftir':
         idx = triggered_id['index']
@@ -906,10 +1557,174 @@ def show_fixed_ftir_badges(fixed_list):
     Input('upload-status', 'data')
 )
 def show_chatbot(upload_status):
-    if upload_status and all(upload_status.values()):
+    if _ready(upload_status):
         return {"display": "block", "marginTop": "18px"}
     return {"display": "none"}
 
+# ======= Biblioteca local de referencias =======
+MIN_RUN_SCORE = 0.5     # en el resumen del ensayo no se listan coincidencias más débiles
+LIBRARY_TABLE_STYLE = dict(
+    sort_action="native",
+    export_format="csv",
+    export_headers="display",
+    page_size=10,
+    style_table={"overflowX": "auto"},
+    style_cell={"fontFamily": "Segoe UI, system-ui", "fontSize": "14px", "padding": "6px"},
+    style_header={"fontWeight": "bold", "backgroundColor": "#f4f8fb"},
+)
+
+
+@dash.callback(
+    Output('library-size', 'children'),
+    Input('library-upload', 'contents'),
+    Input('upload-status', 'data'),
+    State('library-upload', 'filename'),
+)
+def update_library(contents_list, status=None, filenames=None):
+    """Guarda las referencias subidas en la biblioteca y muestra cuántas hay."""
+    skipped = []
+    if ctx.triggered_id == 'library-upload' and contents_list:
+        for contents, filename in zip(contents_list, filenames or []):
+            try:
+                add_reference(decode_bytes(contents), filename)
+            except (ValueError, OSError) as e:
+                skipped.append(f"{filename}: {e}")
+    text = f"{load_library().n_refs} reference spectra"
+    if skipped:
+        text += " · skipped " + "; ".join(skipped)
+    return text
+
+
+@dash.callback(
+    Output('library-source', 'data'),
+    Output('library-source', 'value'),
+    Input('fixed-ftir-list', 'data'),
+    State('library-source', 'value'),
+)
+def update_library_sources(fixed_list, current):
+    """Espectro a buscar: el actual o cualquiera de los fijados."""
+    options = [{'value': 'current', 'label': 'Current spectrum'}]
+    options += [{'value': str(i), 'label': f'Pinned {i + 1}'} for i in range(len(fixed_list or []))]
+    return options, current if current in {o['value'] for o in options} else 'current'
+
+
+@dash.callback(
+    Output('library-results', 'children'),
+    Output('library-matches', 'data'),
+    Input('library-match-btn', 'n_clicks'),
+    State('library-source', 'value'),
+    State('library-metric', 'value'),
+    State('selected-time-store', 'data'),
+    State('ftir-interp-switch', 'checked'),
+    State('fixed-ftir-list', 'data'),
+    State('upload-status', 'data'),
+    State('ega-session-id', 'data'),
+    prevent_initial_call=True,
+)
+def match_spectrum(n_clicks, source, metric, selected_time, interpolate, fixed_list, status, session_id=None):
+    """Top-k de la biblioteca para el espectro actual o un fijado."""
+    if not n_clicks or not _ready(status):
+        raise PreventUpdate
+    data = _resolve_session_data(session_id)
+    if data is None:
+        raise PreventUpdate
+    _, gs, cube = data
+
+    if source and source != 'current':
+        pinned = _resolve_pins((fixed_list or [])[int(source):int(source) + 1], _preprocessing(session_id))
+        if not pinned:
+            raise PreventUpdate
+        wavenumbers, spectrum, _ = pinned[0]
+        label = f"pinned spectrum {int(source) + 1}"
+    else:
+        spectrum, closest_time = cube.spectrum_at(_clamp_time(gs, selected_time), interpolate=bool(interpolate))
+        wavenumbers, label = cube.wavenumbers, f"spectrum at {closest_time:.1f} s"
+
+    library = load_library()
+    if not library.n_refs:
+        return dmc.Text("The reference library is empty: add JCAMP-DX or CSV spectra.", c="dimmed"), None
+    records = [{"rank": i + 1, "reference": name, "score": round(score, 4)}
+               for i, (name, score) in enumerate(library.search(wavenumbers, spectrum, DEFAULT_TOP_K, metric,
+                                                             transmittance=not _preprocessing(session_id).get('absorbance')))]
+    table = dash_table.DataTable(
+        id='library-match-table',
+        columns=[{"id": "rank", "name": "#"}, {"id": "reference", "name": "Reference"},
+                 {"id": "score", "name": metric.capitalize()}],
+        data=records,
+        **LIBRARY_TABLE_STYLE,
+    )
+    return [dmc.Text(f"Best matches for the {label}", fw=500), table], \
+        {"source": label, "metric": metric, "matches": records}
+
+
+@dash.callback(
+    Output('library-results', 'children', allow_duplicate=True),
+    Output('library-matches', 'data', allow_duplicate=True),
+    Input('library-match-run-btn', 'n_clicks'),
+    State('library-metric', 'value'),
+    State('upload-status', 'data'),
+    State('ega-session-id', 'data'),
+    prevent_initial_call=True,
+)
+def match_run(n_clicks, metric, status, session_id=None):
+    """Mejor referencia de cada espectro del ensayo (una sola pasada) y resumen por referencia."""
+    if not n_clicks or not _ready(status):
+        raise PreventUpdate
+    data = _resolve_session_data(session_id)
+    if data is None:
+        raise PreventUpdate
+    tg, _, cube = data
+
+    library = load_library()
+    if not library.n_refs:
+        return dmc.Text("The reference library is empty: add JCAMP-DX or CSV spectra.", c="dimmed"), None
+    best, scores = library.search_many(cube.wavenumbers, cube.intensities, k=1, metric=metric,
+                                        transmittance=not _preprocessing(session_id).get('absorbance'))
+    tg_cols = tg.column_names()
+    df = pd.DataFrame({
+        "reference": np.asarray(library.names, dtype=object)[best[:, 0]],
+        "time": cube.times,
+        "temperature": np.interp(cube.times, tg[tg_cols[0]] * 60.0, tg[tg_cols[4]]),
+        "score": scores[:, 0].astype(np.float64),
+    })
+    df = df[df["score"] >= MIN_RUN_SCORE]
+    if df.empty:
+        return dmc.Text(f"No spectrum of the run matches a reference with {metric} ≥ {MIN_RUN_SCORE}.", c="dimmed"), None
+    peak = df.loc[df.groupby("reference")["score"].idxmax(), ["reference", "temperature"]].set_index("reference")
+    summary = df.groupby("reference").agg(
+        spectra=("time", "size"), first_time=("time", "min"), last_time=("time", "max"), best_score=("score", "max"),
+    ).join(peak.rename(columns={"temperature": "best_temperature"}))
+    summary = summary.sort_values("spectra", ascending=False).reset_index().round(
+        {"first_time": 1, "last_time": 1, "best_score": 4, "best_temperature": 1})
+    records = summary.to_dict("records")
+    table = dash_table.DataTable(
+        id='library-run-table',
+        columns=[{"id": "reference", "name": "Reference"}, {"id": "spectra", "name": "Spectra (best match)"},
+                 {"id": "first_time", "name": "First (s)"}, {"id": "last_time", "name": "Last (s)"},
+                 {"id": "best_score", "name": f"Best {metric}"}, {"id": "best_temperature", "name": "T at best (°C)"}],
+        data=records,
+        **LIBRARY_TABLE_STYLE,
+    )
+    return [dmc.Text(f"Best reference for each of the {cube.n_spectra} spectra of the run", fw=500), table], \
+        {"source": "whole run (best reference per spectrum)", "metric": metric, "matches": records[:10]}
+
+
+def _library_prompt(library_matches) -> str:
+    """Coincidencias de la biblioteca local como contexto para el chat."""
+    if not library_matches or not library_matches.get("matches"):
+        return ""
+    lines = []
+    for m in library_matches["matches"]:
+        score = m.get("score", m.get("best_score"))
+        extra = f", {m['spectra']} espectros, {m['first_time']}–{m['last_time']} s" if "spectra" in m else ""
+        lines.append(f"- {m['reference']} ({library_matches['metric']} = {score}{extra})")
+    return (
+        f"\nCoincidencias en la biblioteca local de espectros de referencia ({library_matches['source']}):\n"
+        + "\n".join(lines)
+        + "\nBasa la asignación de compuestos en estas coincidencias; si alguna no encaja con el espectro, dilo."
+    )
+
+
 # ======= Chat (igual que tenías) =======
 @dash.callback(
     [Output("chat-history", "children"),
@@ -919,11 +1734,11 @@ def show_chatbot(upload_status):
     State("chat-history", "children"),
     State('ftir-graph', 'figure'),
     State('info-button', 'children'),
+    State('ega-session-id', 'data'),
+    State('library-matches', 'data'),
     prevent_initial_call=True
 )
-def chat_with_expert(n_clicks, n_submit, user_msg, history, ftir_fig, info_text):
-    global last_ftir_hash
-
+def chat_with_expert(n_clicks, n_submit, user_msg, history, ftir_fig, info_text, session_id=None, library_matches=None):
     if not user_msg:
         raise dash.exceptions.PreventUpdate
 
@@ -931,8 +1746,9 @@ def chat_with_expert(n_clicks, n_submit, user_msg, history, ftir_fig, info_text)
     ftir_x, ftir_y = [], []
     if ftir_fig and "data" in ftir_fig and len(ftir_fig["data"]) > 0:
         trace = ftir_fig["data"][0]
-        ftir_x = trace.get("x", [])
-        ftir_y = trace.get("y", [])
+        # float32 → redondeo para no arrastrar dígitos espurios al prompt
+        ftir_x = decode_array(trace.get("x")).astype(float).round(6).tolist()
+        ftir_y = decode_array(trace.get("y")).astype(float).round(6).tolist()
 
     # Extrae tiempo y temperatura del info_button
     ftir_time, ftir_temp = "", ""
@@ -942,6 +1758,8 @@ def chat_with_expert(n_clicks, n_submit, user_msg, history, ftir_fig, info_text)
             ftir_time = parts[0].split(":")[-1].strip()
             ftir_temp = parts[2].split(":")[-1].strip()
 
+    y_label = "absorbancia" if _preprocessing(session_id).get('absorbance') else "transmitancia"
+
     # Calcula hash del FTIR actual
     current_ftir_hash = hash(tuple(ftir_x)) if ftir_x else None
 
@@ -950,7 +1768,7 @@ def chat_with_expert(n_clicks, n_submit, user_msg, history, ftir_fig, info_text)
         "Eres un experto en análisis TG-FTIR y degradación térmica de materiales. "
         "El usuario te preguntará sobre el espectro FTIR mostrado, que corresponde a una muestra en un experimento de degradación térmica. "
         "Tus tareas son: "
-        "1. Analizar el espectro FTIR mostrado (te paso los datos completos de X=numero de onda y Y=transmitancia). "
+        f"1. Analizar el espectro FTIR mostrado (te paso los datos completos de X=numero de onda y Y={y_label}). "
         "2. Identificar todos los picos relevantes y asignar grupos funcionales o compuestos desprendidos, según la temperatura y el tiempo del experimento. "
         "3. Si el usuario lo pide, sugiere posibles mecanismos de degradación o interpreta los resultados. "
         "4. Responde de forma clara, profesional y didáctica, como un experto en TG-FTIR. "
@@ -958,14 +1776,15 @@ def chat_with_expert(n_clicks, n_submit, user_msg, history, ftir_fig, info_text)
         f"- Tiempo: {ftir_time} s\n"
         f"- Temperatura: {ftir_temp} °C\n"
         f"- Número de onda (X): {list(ftir_x)}\n"
-        f"- Transmitancia (Y): {list(ftir_y)}\n"
+        f"- {y_label.capitalize()} (Y): {list(ftir_y)}\n"
         "Si necesitas más datos, pídelos al usuario. Si el usuario pregunta por picos, asigna los más probables según la temperatura y el contexto."
     )
+    system_prompt += _library_prompt(library_matches)
     system_prompt += ("\nPor favor, estructura tu respuesta usando títulos y secciones en Markdown para mayor claridad.")
 
     messages = [{"role": "system", "content": system_prompt}]
 
-    if current_ftir_hash != last_ftir_hash:
+    if current_ftir_hash != WORKSPACES.get(session_id).get('last_ftir_hash'):
         messages.append({
             "role": "system",
             "content": (
@@ -974,10 +1793,11 @@ def chat_with_expert(n_clicks, n_submit, user_msg, history, ftir_fig, info_text)
                 f"- Tiempo: {ftir_time} s\n"
                 f"- Temperatura: {ftir_temp} °C\n"
                 f"- Número de onda (X): {list(ftir_x)}\n"
-                f"- Transmitancia (Y): {list(ftir_y)}\n"
+                f"- {y_label.capitalize()} (Y): {list(ftir_y)}\n"
             )
         })
-        last_ftir_hash = current_ftir_hash
+        if session_id:
+            WORKSPACES.update(session_id, last_ftir_hash=current_ftir_hash)
 
     if history:
         for h in history:
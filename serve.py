@@ -0,0 +1,61 @@
+# serve.py
+# -----------------------------------------------------------------------------
+# Punto de entrada de producción:   python serve.py [--workers N] [--port P]
+# - Linux/macOS: gunicorn con gunicorn.conf.py (varios procesos + hilos).
+# - Windows (o sin gunicorn): waitress, un proceso con varios hilos.
+# En ambos casos se usa un backend de caché compartido (filesystem por defecto)
+# para que cualquier proceso resuelva los datos subidos en otro.
+# `python app.py` sigue siendo el modo de escritorio/desarrollo.
+# -----------------------------------------------------------------------------
+
+import argparse
+import os
+import sys
+
+os.environ.setdefault("TGFTIR_CACHE_BACKEND", "filesystem")
+
+
+def run_gunicorn(host: str, port: int, workers: int | None, threads: int) -> None:
+    from gunicorn.app.wsgiapp import WSGIApplication
+
+    conf = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+    argv = ["gunicorn", "-c", conf, "-b", f"{host}:{port}", "--threads", str(threads)]
+    if workers:
+        argv += ["-w", str(workers)]
+    sys.argv = argv + ["app:server"]
+    WSGIApplication("%(prog)s [OPTIONS] [APP_MODULE]").run()
+
+
+def run_waitress(host: str, port: int, threads: int) -> None:
+    from waitress import serve
+
+    from app import server
+
+    serve(server, host=host, port=port, threads=threads)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="TG-FTIR production server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--workers", type=int, default=None, help="procesos (sólo gunicorn)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("TGFTIR_THREADS", "4")))
+    args = parser.parse_args()
+
+    if sys.platform != "win32":
+        try:
+            import gunicorn  # noqa: F401
+        except ImportError:
+            pass
+        else:
+            run_gunicorn(args.host, args.port, args.workers, args.threads)
+            return
+    try:
+        import waitress  # noqa: F401
+    except ImportError:
+        sys.exit("Install 'gunicorn' (Linux/macOS) or 'waitress' (Windows) to run the production server.")
+    run_waitress(args.host, args.port, args.threads * 2)
+
+
+if __name__ == "__main__":
+    main()